@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared HTTP transport for the Github (PyGithub) and Stackexchange (py-stackexchange) clients.
+
+Both libraries are pointed at a requests session, so that transport adapters
+(http_cache.CachingAdapter, rate_limit.GovernedAdapter / StackExchangeGovernedAdapter,
+ResilientAdapter, TracingAdapter) apply to every API call either of them makes.
+"""
+
+import re
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+import stackexchange
+from requests.adapters import HTTPAdapter
+from github.Requester import Requester, HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass
+
+import http_cache
+import rate_limit
+import resilience
+import tracing
+
+STACKEXCHANGE_API_ROOT = 'https://api.stackexchange.com'
+# hedged requests in flight at once, per adapter
+HEDGE_WORKERS = 16
+
+
+def make_adapter(cache=None, governor=None, policy=None, stackexchange_governor=None, **kwargs):
+    '''HTTPAdapter with the requested layers stacked, outermost first:
+    response cache (http_cache.ResponseCache), rate limit governor (rate_limit.RateLimitGovernor)
+    of Github requests (governor) or of Stackexchange requests (stackexchange_governor),
+    timeouts / retries / hedging / circuit breaker (resilience.RequestPolicy),
+    and the tracing of requests sent to the network (TracingAdapter, if a tracer is installed).
+    kwargs are passed on to HTTPAdapter.
+    '''
+    bases = []
+    if cache is not None:
+        bases.append(http_cache.CachingAdapter)
+        kwargs['cache'] = cache
+    if governor is not None:
+        bases.append(rate_limit.GovernedAdapter)
+        kwargs['governor'] = governor
+    # under the cache: cached responses take no tokens and replay no backoff
+    if stackexchange_governor is not None:
+        bases.append(StackExchangeGovernedAdapter)
+        kwargs['stackexchange_governor'] = stackexchange_governor
+    # inside the governor: rate limit waits don't count against the deadline
+    if policy is not None:
+        bases.append(ResilientAdapter)
+        kwargs['policy'] = policy
+    if tracing.get_tracer() is not None:
+        bases.append(TracingAdapter)
+    if not bases:
+        return HTTPAdapter(**kwargs)
+    # layers are cooperative HTTPAdapter subclasses, each send() calls the next through super()
+    adapter_class = type('ApiAdapter', tuple(bases), {})
+    return adapter_class(**kwargs)
+
+
+class ResilientAdapter(HTTPAdapter):
+    '''Transport adapter sending requests under a resilience.RequestPolicy:
+    per attempt timeouts and a deadline per call, retries of idempotent requests
+    with jittered exponential backoff, optional hedging, circuit breaker per host.
+    Hedged copies are paced by the rate limit governor of the adapter, if any.
+    '''
+    def __init__(self, policy, **kwargs):
+        self.policy = policy
+        self.hedge_pool = None
+        super().__init__(**kwargs)
+
+    def _send_hedged(self, send, request, kwargs):
+        '''Response of request, sent again if unanswered after the hedge delay;
+        the first response wins, the other one is closed when it arrives
+        '''
+        if self.hedge_pool is None:
+            self.hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS)
+        send = tracing.bind(send)
+        futures = [self.hedge_pool.submit(send, request, **kwargs)]
+        done, pending = wait(futures, timeout=self.policy.hedge_delay)
+        if not done:
+            # the copy is sent below the governor, with the token / app key of the request
+            governor = getattr(self, 'governor', None) or getattr(self, 'stackexchange_governor', None)
+            if governor is not None:
+                governor.pace()
+            futures.append(self.hedge_pool.submit(send, request.copy(), **kwargs))
+        error = None
+        while futures:
+            done, pending = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                try:
+                    resp = future.result()
+                except Exception as err:
+                    error = err
+                    continue
+                for other in futures:
+                    other.add_done_callback(close_response)
+                return resp
+        raise error
+
+    def send(self, request, **kwargs):
+        policy = self.policy
+        host = urllib.parse.urlsplit(request.url).netloc
+        idempotent = request.method in resilience.IDEMPOTENT_METHODS
+        n_attempts = policy.max_retries + 1 if idempotent else 1
+        deadline = time.monotonic() + policy.deadline
+        send = super().send
+        for attempt in range(n_attempts):
+            policy.breaker.check(host)
+            kwargs['timeout'] = policy.timeout(deadline)
+            resp, error = None, None
+            try:
+                if idempotent and policy.hedge_delay is not None:
+                    resp = self._send_hedged(send, request, kwargs)
+                else:
+                    resp = send(request, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                error = err
+            failed = resp is None or resp.status_code in resilience.RETRY_STATUSES
+            policy.breaker.record(host, not failed)
+            if not failed:
+                return resp
+            delay = policy.backoff(attempt)
+            if resp is not None:
+                delay = max(delay, resilience.retry_after(resp.headers) or 0)
+            # out of attempts or time: the last error / response is the result
+            if attempt == n_attempts - 1 or time.monotonic() + delay >= deadline:
+                break
+            print("\tRetrying '{}' in {:.1f} sec ({})".format(
+                    request.path_url, delay, error or resp.status_code))
+            if resp is not None:
+                resp.close()
+            time.sleep(delay)
+        if resp is None:
+            raise error
+        return resp
+
+
+def close_response(future):
+    '''Close the response of a finished future, if any
+    '''
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class TracingAdapter(HTTPAdapter):
+    '''Transport adapter counting the requests it sends, their response bytes, time
+    and the Github rate limit quota left, with the installed tracing.Tracer
+    '''
+    def send(self, request, **kwargs):
+        api = urllib.parse.urlsplit(request.url).netloc
+        start = time.perf_counter()
+        try:
+            resp = super().send(request, **kwargs)
+        except Exception:
+            tracing.record_request(api, None, 0, time.perf_counter() - start)
+            raise
+        # streamed bodies aren't read here
+        n_bytes = int(resp.headers.get('Content-Length') or 0) if kwargs.get('stream') \
+                  else len(resp.content)
+        tracing.record_request(api, resp.status_code, n_bytes, time.perf_counter() - start)
+        tracing.record_quota(api, resp.headers.get('X-RateLimit-Remaining'),
+                             resource=resp.headers.get('X-RateLimit-Resource', 'core'))
+        return resp
+
+
+def make_session(adapter):
+    '''Requests session with adapter mounted for http and https
+    '''
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class GithubHTTPSConnection(HTTPSRequestsConnectionClass):
+    '''PyGithub connection that sends requests through the shared session
+    '''
+    shared_session = None
+
+    def __init__(self, host, port=None, **kwargs):
+        super().__init__(host, port, **kwargs)
+        if self.shared_session is not None:
+            self.session.close()
+            self.session = self.shared_session
+
+    def close(self):
+        # the shared session outlives the connection
+        if self.session is not self.shared_session:
+            super().close()
+
+
+class GithubHTTPConnection(HTTPRequestsConnectionClass):
+    '''PyGithub connection that sends requests through the shared session
+    '''
+    shared_session = None
+
+    def __init__(self, host, port=None, **kwargs):
+        super().__init__(host, port, **kwargs)
+        if self.shared_session is not None:
+            self.session.close()
+            self.session = self.shared_session
+
+    def close(self):
+        if self.session is not self.shared_session:
+            super().close()
+
+
+def install_github_session(session):
+    '''Route all PyGithub requests through session
+    '''
+    # don't fall back to .netrc credentials, PyGithub sets the auth header itself
+    session.auth = Requester.noopAuth
+    GithubHTTPSConnection.shared_session = session
+    GithubHTTPConnection.shared_session = session
+    Requester.injectConnectionClasses(GithubHTTPConnection, GithubHTTPSConnection)
+
+
+class StackExchangeGovernedAdapter(HTTPAdapter):
+    '''Transport adapter that paces Stackexchange requests with a RateLimitGovernor,
+    adding the app key with most quota left to the query, respecting the 'backoff'
+    and 'quota_remaining' the API reports and retrying throttled requests
+    '''
+    def __init__(self, stackexchange_governor, **kwargs):
+        self.stackexchange_governor = stackexchange_governor
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        governor = self.stackexchange_governor
+        url = request.url
+        split_url = urllib.parse.urlsplit(url)
+        # path after the api version
+        method = stackexchange_method(urllib.parse.unquote(split_url.path).strip('/').split('/', 1)[-1])
+        for attempt in range(rate_limit.MAX_RATE_LIMIT_RETRIES + 1):
+            # wait for pacing / backoff, use the app key with most quota left
+            app_key = governor.acquire(method=method)
+            request.url = with_query_param(url, 'key', app_key) if app_key is not None else url
+            resp = super().send(request, **kwargs)
+            try:
+                json = resp.json()
+            except ValueError:
+                return resp
+            throttled = record_stackexchange_quota(governor, app_key, json, method)
+            if not (throttled and attempt < rate_limit.MAX_RATE_LIMIT_RETRIES):
+                break
+            resp.close()
+        tracing.record_quota(split_url.netloc, json.get('quota_remaining'))
+        return resp
+
+
+def with_query_param(url, name, value):
+    '''url with query parameter name set to value
+    '''
+    split_url = urllib.parse.urlsplit(url)
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(split_url.query, keep_blank_values=True)
+             if k != name]
+    query.append((name, value))
+    return urllib.parse.urlunsplit(split_url._replace(query=urllib.parse.urlencode(query)))
+
+
+class StackExchangeSite(stackexchange.Site):
+    '''py-stackexchange Site that sends its requests through a requests session
+    instead of urllib. The session's adapter paces requests (StackExchangeGovernedAdapter,
+    see make_adapter); without a session, one paced for app_key is made.
+    '''
+    def __init__(self, domain, app_key=None, session=None, api_root=STACKEXCHANGE_API_ROOT,
+                 **kwargs):
+        super().__init__(domain, app_key, **kwargs)
+        if session is None:
+            governor = rate_limit.stackoverflow_governor([app_key])
+            session = make_session(make_adapter(stackexchange_governor=governor))
+        self.session = session
+        self.api_root = api_root
+
+    def _request_params(self, params):
+        '''Query parameters of a request, as strings, with the site
+        '''
+        params['site'] = params.get('site', self.root_domain)
+        new_params = {}
+        for k, v in params.items():
+            if v is None:
+                continue
+            elif k in ('fromdate', 'todate'):
+                new_params[k] = str(int(v))
+            else:
+                new_params[k] = self._kw_to_str(v)
+        return new_params
+
+    def _request(self, to, params):
+        url = '{}/{}/{}'.format(self.api_root, self.api_version, urllib.parse.quote(to))
+        # the app key is added under the response cache, by the session's adapter
+        resp = self.session.get(url, params=self._request_params(params))
+        try:
+            json = resp.json()
+        except ValueError:
+            raise stackexchange.StackExchangeError()
+        check_stackexchange_response(resp.status_code, json)
+        if 'quota_remaining' in json and 'quota_max' in json:
+            self.rate_limit = (json['quota_remaining'], json['quota_max'])
+            self.requests_used = self.rate_limit[1] - self.rate_limit[0]
+            self.requests_left = self.rate_limit[0]
+        return json
+
+
+def stackexchange_method(to):
+    '''Api method of request path to, the path without ids (backoff is reported per method)
+    '''
+    return '/'.join(part for part in to.split('/') if not part[:1].isdigit())
+
+
+def record_stackexchange_quota(governor, app_key, json, method):
+    '''Record the quota and backoff of a Stackexchange response with governor.
+    True if the IP is throttled (throttle_violation): all keys are held back, retry.
+    '''
+    governor.update(app_key, remaining=json.get('quota_remaining'),
+                    reset=rate_limit.next_utc_midnight(),
+                    backoff=json.get('backoff'), method=method)
+    if json.get('error_id') != 502:
+        return False
+    wait = re.search(r'available in (\d+) seconds', json.get('error_message') or '')
+    reset = time.time() + (int(wait.group(1)) if wait else 5)
+    for key in governor.tokens:
+        governor.exhaust(key, reset=reset)
+    return True
+
+
+def check_stackexchange_response(status_code, json):
+    '''Raise StackExchangeError for an error response
+    '''
+    if status_code != 200:
+        raise stackexchange.StackExchangeError(
+                json.get('error_id', stackexchange.StackExchangeError.UNKNOWN),
+                json.get('error_name'), json.get('error_message'))
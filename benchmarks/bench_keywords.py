@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Throughput benchmark of readme keyword extraction engines.
+
+Compares nltk (serial), regex (serial) and regex on the process pool over a
+corpus of real readmes, and reports how closely regex keywords match nltk's.
+The corpus is the README/markdown files found under the given directories
+(by default the installed python packages and this repo).
+
+Usage (from the repo root): python3 benchmarks/bench_keywords.py [-d dir ...] [-n max_files]
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+import keywords
+
+# package METADATA files carry the project readme as long description
+README_PATTERNS = ['**/README*', '**/*.md', '**/*.rst', '**/METADATA']
+
+
+def load_corpus(dirs, max_files):
+    '''Text of up to max_files readme files found under dirs
+    '''
+    readmes = []
+    for root in dirs:
+        for pattern in README_PATTERNS:
+            for path in glob.iglob(os.path.join(root, pattern), recursive=True):
+                if len(readmes) >= max_files:
+                    return readmes
+                if not os.path.isfile(path):
+                    continue
+                with open(path, 'rb') as f_readme:
+                    readmes.append(f_readme.read().decode('utf-8', errors='ignore'))
+    return readmes
+
+
+def time_engine(readmes, engine, use_pool):
+    start = time.perf_counter()
+    results = keywords.extract_keywords_batch(readmes, engine=engine, use_pool=use_pool)
+    return time.perf_counter() - start, results
+
+
+def jaccard(a, b):
+    a, b = set(a), set(b)
+    return len(a & b)/len(a | b) if (a | b) else 1.0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Readme keyword extraction benchmark")
+    parser.add_argument("-d", dest="dirs", nargs='+', default=[sys.prefix, REPO_DIR],
+                        help="directories to collect readmes from (default python prefix and repo)")
+    parser.add_argument("-n", dest="max_files", type=int, default=2000,
+                        help="max number of readmes in the corpus (default 2000)")
+    args = parser.parse_args()
+    os.chdir(REPO_DIR)
+    readmes = load_corpus(args.dirs, args.max_files)
+    n_bytes = sum(len(readme.encode('utf-8')) for readme in readmes)
+    print('corpus: {} readmes, {:.1f} MB'.format(len(readmes), n_bytes/1e6))
+    # start the pool outside the timed runs
+    keywords.extract_keywords_batch(['warm up'] * keywords.MIN_POOL_BATCH)
+    runs = [('nltk', False), ('regex', False), ('regex', True)]
+    results = {}
+    print('{:20s} {:>10s} {:>12s} {:>10s}'.format('engine', 'time (s)', 'readmes/s', 'MB/s'))
+    for engine, use_pool in runs:
+        elapsed, results[(engine, use_pool)] = time_engine(readmes, engine, use_pool)
+        name = engine + (' (pool)' if use_pool else '')
+        print('{:20s} {:10.2f} {:12.0f} {:10.2f}'.format(name, elapsed, len(readmes)/elapsed,
+                                                      n_bytes/1e6/elapsed))
+    similarity = [jaccard(a, b) for a, b in zip(results[('nltk', False)], results[('regex', False)])]
+    print('mean jaccard similarity regex vs nltk keywords: {:.3f}'.format(
+            sum(similarity)/max(1, len(similarity))))
+    keywords.shutdown_pool()
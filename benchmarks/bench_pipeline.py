@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+End to end benchmark of a rating run against the local fake API server.
+
+Drives get_github_profiles, get_stackoverflow_profiles (one search + profile
+per applicant) and the master data pipeline (get_github_stackorf_details)
+against benchmarks/fake_api_server.py, for growing numbers of applicants and
+repos per user, and reports wall time, requests served, failed lookups and peak
+Python memory (tracemalloc) of each. No network access is needed. The first
+failure of each run is printed, and the benchmark exits 1 if any lookup failed.
+
+Client pacing is off by default so the numbers show the pipeline's own cost;
+--paced uses the real rate limit governors (Stackexchange: 30 requests / 5 sec).
+Caches are in memory and fresh for every run.
+
+Rate limit behavior of the server: -q (Github quota per window, 403s after it
+is used up) and --backoff (Stackexchange backoff every few responses). Faults:
+--errors (every n-th response a 503) and --stall (every --stall-every-th
+response delayed), handled by the request policy (--deadline, --retries, --hedge).
+
+The refresh scenario re-rates the Github users of an earlier (untimed) github
+run incrementally (repo_snapshots), after --changed of their repos were pushed
+to; compare its requests with the github scenario's.
+
+Usage (from the repo root): python3 benchmarks/bench_pipeline.py [-n 5 20] [-r 10 50] [-l latency] [-w workers]
+                                                                [-q quota] [--backoff sec] [--errors n]
+                                                                [--stall sec] [--hedge [sec]] [--changed 0.1]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import traceback
+import tempfile
+import warnings
+import contextlib
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+import pandas as pd
+import stackexchange
+from github import Github
+
+import api_session
+import rate_limit
+import keywords
+import contributor_cache
+import repo_snapshots
+import result_store
+import resilience
+import get_github_details as ghd
+import get_stackoverflow_details as sod
+import parse_applicant_masterdata as pam
+from fake_api_server import FakeApiServer, applicant
+
+SCENARIOS = ['github', 'refresh', 'stackoverflow', 'master']
+# governor that never holds requests back
+UNPACED_RATE = 1e6
+# Stackexchange responses carrying a backoff, with --backoff
+BACKOFF_EVERY = 20
+# responses delayed, with --stall
+STALL_EVERY = 50
+# share of the repos pushed to between the runs of the refresh scenario
+CHANGED = 0.1
+
+
+def make_clients(server, paced=False, policy=None):
+    '''Github and Stackoverflow objects talking to server,
+    with the timeouts / retries of policy (resilience.RequestPolicy)
+    '''
+    if paced:
+        github_governor = rate_limit.github_governor(['bench-token'])
+        stackovf_governor = rate_limit.stackoverflow_governor([])
+    else:
+        github_governor = rate_limit.RateLimitGovernor(['bench-token'], UNPACED_RATE, UNPACED_RATE)
+        stackovf_governor = rate_limit.RateLimitGovernor([], UNPACED_RATE, UNPACED_RATE)
+    adapter = api_session.make_adapter(governor=github_governor, policy=policy)
+    api_session.install_github_session(api_session.make_session(adapter))
+    g = Github(login_or_token='bench-token', base_url=server.url, seconds_between_requests=0,
+               seconds_between_writes=0)
+    session = api_session.make_session(api_session.make_adapter(
+            policy=policy, stackexchange_governor=stackovf_governor))
+    so = api_session.StackExchangeSite(stackexchange.StackOverflow, None, session=session,
+                                       api_root=server.url, cache=0)
+    return g, so
+
+
+def report_failure(n_failed):
+    '''Print the traceback of the first failed lookup of a run to stderr
+    '''
+    if n_failed == 1:
+        traceback.print_exc(file=sys.stderr)
+
+
+def run_github(g, so, applicants, store, n_workers):
+    '''Number of failed lookups, the first one's traceback is printed
+    '''
+    n_failed = 0
+    for name, email in applicants:
+        try:
+            matches = ghd.find_matching_users(g, email, top_k=1)
+            ghd.get_github_profiles(matches, email, store=store)
+        except Exception:
+            n_failed += 1
+            report_failure(n_failed)
+    return n_failed
+
+
+def run_stackoverflow(g, so, applicants, store, n_workers):
+    n_failed = 0
+    for name, email in applicants:
+        search_kw = {'inname': name}
+        try:
+            matches = sod.find_matching_users(so, search_kw, top_k=1)
+            sod.get_stackoverflow_profiles(matches, search_kw, store=store)
+        except Exception:
+            n_failed += 1
+            report_failure(n_failed)
+    return n_failed
+
+
+def run_master(g, so, applicants, store, n_workers):
+    master_data_df = pd.DataFrame(applicants, columns=['name', 'email'])
+    all_details_dict = pam.get_github_stackorf_details(g, so, master_data_df, n_workers=n_workers,
+                                                       github_kw={'store': store},
+                                                       stackovf_kw={'store': store}, store=store)
+    errors = [error for errors in all_details_dict['errors_dict'].values() for error in errors]
+    if errors:
+        print('First failed lookup: {}'.format(errors[0]), file=sys.stderr)
+    return len(errors)
+
+
+def push_repos(server, n_applicants, n_repos, changed, seed=0):
+    '''Push to a share changed of the repos of the applicants' Github users
+    '''
+    rnd = random.Random(seed)
+    full_names = {server.github_repo('applicant{}'.format(k), j)['full_name']
+                  for k in range(n_applicants) for j in range(n_repos)}
+    server.push([full_name for full_name in sorted(full_names) if rnd.random() < changed])
+
+
+RUNNERS = {'github': run_github, 'refresh': run_github, 'stackoverflow': run_stackoverflow,
+           'master': run_master}
+
+
+def run_scenario(scenario, n_applicants, n_repos, args):
+    '''(wall time, requests served, failed lookups, peak traced memory MB) of a scenario
+    '''
+    server = FakeApiServer(n_applicants=n_applicants, n_repos=n_repos, latency=args.latency,
+                           github_quota=args.github_quota, quota_window=args.quota_window,
+                           backoff=args.backoff, backoff_every=BACKOFF_EVERY,
+                           error_every=args.error_every, stall=args.stall,
+                           stall_every=args.stall_every).start()
+    try:
+        # fresh circuit breaker for every scenario
+        g, so = make_clients(server, paced=args.paced, policy=resilience.policy_from_args(args))
+        applicants = [(applicant(k)['name'], applicant(k)['email']) for k in range(n_applicants)]
+        with tempfile.TemporaryDirectory() as results_dir:
+            store = result_store.ResultStore(results_dir)
+            if scenario == 'refresh':
+                # earlier hiring round: snapshot every user's repos, then some repos change
+                repo_snapshots.install_snapshots(repo_snapshots.RepoSnapshots(
+                        os.path.join(results_dir, 'repo_snapshots.sqlite')))
+                keywords.install_cache(keywords.KeywordCache())
+                contributor_cache.install_cache(contributor_cache.ContributorCache())
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    run_github(g, so, applicants, store, args.n_workers)
+                push_repos(server, n_applicants, n_repos, args.changed)
+                server.reset_counts()
+            keywords.install_cache(keywords.KeywordCache())
+            contributor_cache.install_cache(contributor_cache.ContributorCache())
+            tracemalloc.start()
+            start = time.perf_counter()
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                n_failed = RUNNERS[scenario](g, so, applicants, store, args.n_workers)
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        return elapsed, server.n_requests(), n_failed, peak/1e6
+    finally:
+        repo_snapshots.install_snapshots(None)
+        server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="End to end rating benchmark against a fake API")
+    parser.add_argument("-n", dest="n_applicants", type=int, nargs='+', default=[5, 20],
+                        help="numbers of applicants (default 5 20)")
+    parser.add_argument("-r", dest="n_repos", type=int, nargs='+', default=[10, 50],
+                        help="numbers of repos per Github user (default 10 50)")
+    parser.add_argument("-s", dest="scenarios", nargs='+', choices=SCENARIOS, default=SCENARIOS,
+                        help="scenarios to run (default all)")
+    parser.add_argument("-l", dest="latency", type=float, default=0.02,
+                        help="seconds of latency per response (default 0.02)")
+    parser.add_argument("-w", dest="n_workers", type=int, default=4,
+                        help="applicant lookups run concurrently by the master pipeline (default 4)")
+    parser.add_argument("-q", dest="github_quota", type=int,
+                        help="Github requests allowed per quota window, then 403s (default no limit)")
+    parser.add_argument("--quota-window", dest="quota_window", type=float, default=10,
+                        help="seconds of a Github quota window (default 10)")
+    parser.add_argument("--backoff", dest="backoff", type=int,
+                        help="seconds of backoff sent with every {}th Stackexchange response".format(
+                                BACKOFF_EVERY))
+    parser.add_argument("--errors", dest="error_every", type=int, default=0,
+                        help="every ERROR_EVERY-th response is a 503 (default none)")
+    parser.add_argument("--stall", dest="stall", type=float, default=0.0,
+                        help="seconds added to every --stall-every-th response (default 0)")
+    parser.add_argument("--stall-every", dest="stall_every", type=int, default=STALL_EVERY,
+                        help="responses stalled, with --stall (default every {}th)".format(STALL_EVERY))
+    parser.add_argument("--changed", dest="changed", type=float, default=CHANGED,
+                        help="share of the repos pushed to before the refresh run "
+                             "(default {})".format(CHANGED))
+    parser.add_argument("--paced", dest="paced", action="store_true",
+                        help="pace requests with the real rate limit governors")
+    resilience.add_arguments(parser)
+    args = parser.parse_args()
+    os.chdir(REPO_DIR)
+    # keep the table readable
+    warnings.simplefilter('ignore', DeprecationWarning)
+    print('latency {:.3f} s, {} workers{}'.format(args.latency, args.n_workers,
+                                                  ', paced' if args.paced else ''))
+    print('{:14s} {:>10s} {:>6s} {:>10s} {:>9s} {:>7s} {:>12s}'.format(
+            'scenario', 'applicants', 'repos', 'time (s)', 'requests', 'failed', 'peak mem MB'))
+    n_failed_total = 0
+    for scenario in args.scenarios:
+        for n_applicants in args.n_applicants:
+            # Stackoverflow lookups don't depend on the number of repos
+            for n_repos in args.n_repos if scenario != 'stackoverflow' else args.n_repos[:1]:
+                elapsed, n_requests, n_failed, peak = run_scenario(scenario, n_applicants, n_repos,
+                                                                   args)
+                print('{:14s} {:10d} {:>6s} {:10.2f} {:9d} {:7d} {:12.1f}'.format(
+                        scenario, n_applicants, str(n_repos) if scenario != 'stackoverflow' else '-',
+                        elapsed, n_requests, n_failed, peak))
+                n_failed_total += n_failed
+    keywords.shutdown_pool()
+    if n_failed_total:
+        print('\n{} lookup(s) failed, see the tracebacks above'.format(n_failed_total))
+        sys.exit(1)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks of the CPU-bound rating functions, with regression tracking.
+
+Times get_overall_rating, apply_row_ops (row-wise, as a frame apply) against
+apply_column_ops, apply_func_wgt_bias, get_stackoverflow_details.overall_rating,
+get_keywords and write_df_to_excel on synthetic repo, tag, readme and applicant
+frames from 10 rows up (default 10, 1000, 100000; 1000000 with -n). The slow
+row-wise functions are capped at fewer rows.
+
+Each result is appended to a JSON lines file (default
+benchmarks/bench_rating.jsonl), keyed by git commit and host. Results are
+compared with the latest ones of another commit on the same host (or of
+--baseline); the run fails (exit 1) if any function got slower by more than
+the threshold (default 25%). Timings under MIN_SECONDS are not compared.
+
+Usage (from the repo root): python3 benchmarks/bench_rating.py [-n rows ...] [-b bench ...] [-t 0.25] [--baseline commit] [--no-save]
+"""
+
+import os
+import sys
+import json
+import time
+import types
+import argparse
+import platform
+import tempfile
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+import numpy as np
+import pandas as pd
+
+import keywords
+import get_github_details as ghd
+import get_stackoverflow_details as sod
+import parse_applicant_masterdata as pam
+
+RESULTS_FILE = os.path.join(REPO_DIR, 'benchmarks', 'bench_rating.jsonl')
+ROWS = [10, 1000, 100000]
+THRESHOLD = 0.25
+# shorter timings are mostly noise, they aren't checked for regressions
+MIN_SECONDS = 1e-3
+# time spent per benchmark and size, for repeats of fast functions
+MIN_TOTAL_SECONDS = 0.2
+MAX_REPEATS = 20
+LANGUAGES = ['python', 'javascript', 'java', 'c++', 'go', 'shell', 'rust', 'ruby']
+WORDS = ['install', 'usage', 'library', 'python', 'api', 'server', 'client', 'data', 'pipeline',
+         'fast', 'parser', 'configuration', 'example', 'command', 'tool', 'database', 'the', 'and',
+         'is', 'a', 'of', 'to', 'with', 'for']
+
+
+def repo_frame(n_rows, seed=0):
+    '''Rated repo columns of n_rows repos of one user
+    '''
+    rnd = np.random.RandomState(seed)
+    owners = np.where(rnd.rand(n_rows) < 0.5, 'bench', 'other')
+    return pd.DataFrame({
+            'user_login': 'bench',
+            'owner': owners,
+            'language': rnd.choice(LANGUAGES, n_rows),
+            'forks_count': rnd.poisson(3, n_rows),
+            'stargazers_count': rnd.poisson(10, n_rows),
+            'contributions': rnd.poisson(200, n_rows),
+            'user_contrib_pct': 100*rnd.rand(n_rows)
+    })
+
+
+def tags_frame(n_rows, seed=0):
+    '''Top answer tags frame of n_rows tags, indexed by tag_name
+    '''
+    rnd = np.random.RandomState(seed)
+    tag_rows = [{'tag_name': 'tag{}'.format(i), 'answer_count': int(rnd.poisson(20)),
+                 'answer_score': int(rnd.poisson(80)), 'question_count': int(rnd.poisson(3)),
+                 'question_score': int(rnd.poisson(5))} for i in range(n_rows)]
+    return sod.tags_frame(tag_rows).set_index('tag_name')
+
+
+def user_frame():
+    user_json = {'display_name': 'Bench', 'user_id': 1, 'location': 'Earth',
+                 'link': 'https://stackoverflow.com/users/1/bench', 'accept_rate': 80,
+                 'reputation': 12345, 'badge_counts': {'bronze': 30, 'silver': 12, 'gold': 2},
+                 'creation_date': 1300000000, 'last_access_date': 1700000000,
+                 'last_modified_date': 1600000000}
+    return sod.user_frame(user_json, keep_raw=False)
+
+
+def readmes(n_rows, seed=0):
+    '''n_rows readmes of 200 words
+    '''
+    rnd = np.random.RandomState(seed)
+    return [' '.join(rnd.choice(WORDS, 200)) for _ in range(n_rows)]
+
+
+def applicants_frame(n_rows, seed=0):
+    '''Applicant ratings frame like read_applicants returns, n_rows applicants
+    '''
+    rnd = np.random.RandomState(seed)
+    columns = {('master_details', 'name'): ['Applicant {}'.format(i) for i in range(n_rows)],
+               ('master_details', 'email'): ['a{}@example.com'.format(i) for i in range(n_rows)],
+               ('github_id_details', 'login'): ['a{}'.format(i) for i in range(n_rows)],
+               ('github_overall_rating', 'github_overall_rating'): rnd.poisson(500, n_rows),
+               ('stackoverflow_overall_rating', 'stackoverflow_overall_rating'):
+                       rnd.poisson(900, n_rows)}
+    for language in LANGUAGES:
+        columns[('github_expertise_ratings', language)] = rnd.poisson(60, n_rows)
+    df = pd.DataFrame(columns)
+    df.columns = pd.MultiIndex.from_tuples(df.columns)
+    return df
+
+
+USER = types.SimpleNamespace(name='Bench', login='bench', email='bench@example.com')
+REPUTATION_OPS = sod.GENERAL_OPS['reputation']
+
+
+def bench_get_overall_rating(n_rows):
+    df = repo_frame(n_rows)
+    return lambda: ghd.get_overall_rating(df.copy(), USER)
+
+
+def bench_apply_row_ops(n_rows):
+    df = repo_frame(n_rows)
+    return lambda: df.apply(ghd.apply_row_ops, axis=1, row_ops=ghd.REPO_OPS)
+
+
+def bench_apply_column_ops(n_rows):
+    df = repo_frame(n_rows)
+    return lambda: ghd.apply_column_ops(df, ghd.REPO_OPS)
+
+
+def bench_apply_func_wgt_bias(n_rows):
+    values = pd.Series(np.random.RandomState(0).poisson(1000, n_rows))
+    return lambda: sod.apply_func_wgt_bias(values, REPUTATION_OPS)
+
+
+def bench_stackoverflow_overall_rating(n_rows):
+    user_df, tags_df = user_frame(), tags_frame(n_rows)
+    return lambda: sod.overall_rating(user_df, tags_df)
+
+
+def bench_get_keywords(n_rows):
+    texts = readmes(n_rows)
+    return lambda: [keywords.get_keywords(text) for text in texts]
+
+
+def bench_write_df_to_excel(n_rows):
+    df = applicants_frame(n_rows)
+    path = os.path.join(tempfile.mkdtemp(), 'bench.xlsx')
+    return lambda: pam.write_df_to_excel(df, path)
+
+
+# {name: (setup(n_rows) returning the timed callable, max rows)}
+BENCHES = {
+        'get_overall_rating': (bench_get_overall_rating, 10**6),
+        'apply_row_ops': (bench_apply_row_ops, 10**5),
+        'apply_column_ops': (bench_apply_column_ops, 10**6),
+        'apply_func_wgt_bias': (bench_apply_func_wgt_bias, 10**6),
+        'stackoverflow_overall_rating': (bench_stackoverflow_overall_rating, 10**6),
+        'get_keywords': (bench_get_keywords, 10**4),
+        'write_df_to_excel': (bench_write_df_to_excel, 10**4),
+}
+
+
+def time_func(func):
+    '''Best wall time (sec) of func over repeats taking about MIN_TOTAL_SECONDS
+    '''
+    times = []
+    while len(times) < MAX_REPEATS and sum(times) < MIN_TOTAL_SECONDS:
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def git_commit():
+    '''Short hash of HEAD, '-dirty' if the tree has changes, None outside a git repo
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, check=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                cwd=REPO_DIR, check=True, stdout=subprocess.PIPE).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if status else '')
+
+
+def load_results(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f_results:
+        return [json.loads(line) for line in f_results if line.strip()]
+
+
+def baseline_seconds(results, commit, host, baseline=None):
+    '''{(bench, rows): seconds} of the latest results on host of commit baseline,
+    or of the latest other commit than commit
+    '''
+    results = [result for result in results if result['host'] == host]
+    if baseline is None:
+        earlier = [result['commit'] for result in results if result['commit'] != commit]
+        if not earlier:
+            return {}
+        baseline = earlier[-1]
+    return {(result['bench'], result['rows']): result['seconds']
+            for result in results if result['commit'] == baseline}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rating function micro-benchmarks")
+    parser.add_argument("-n", dest="rows", type=int, nargs='+', default=ROWS,
+                        help="numbers of rows (default {})".format(' '.join(map(str, ROWS))))
+    parser.add_argument("-b", dest="benches", nargs='+', choices=list(BENCHES), default=list(BENCHES),
+                        help="benchmarks to run (default all)")
+    parser.add_argument("-t", dest="threshold", type=float, default=THRESHOLD,
+                        help="slowdown that fails the run (default {})".format(THRESHOLD))
+    parser.add_argument("-f", dest="results_file", type=str, default=RESULTS_FILE,
+                        help="json lines file of results (default benchmarks/bench_rating.jsonl)")
+    parser.add_argument("--baseline", dest="baseline", type=str,
+                        help="commit to compare with (default the latest other commit)")
+    parser.add_argument("--no-save", dest="no_save", action="store_true",
+                        help="don't append the results to the results file")
+    args = parser.parse_args()
+    os.chdir(REPO_DIR)
+    commit = git_commit()
+    host = platform.node()
+    baseline = baseline_seconds(load_results(args.results_file), commit, host, args.baseline)
+    print('commit {}, host {}, pandas {}'.format(commit, host, pd.__version__))
+    print('{:30s} {:>8s} {:>12s} {:>10s} {:>10s}'.format('bench', 'rows', 'time (s)', 'us/row',
+                                                         'vs base'))
+    results = []
+    regressions = []
+    for name in args.benches:
+        setup, max_rows = BENCHES[name]
+        for n_rows in args.rows:
+            if n_rows > max_rows:
+                continue
+            seconds = time_func(setup(n_rows))
+            base = baseline.get((name, n_rows))
+            change = '' if base is None else '{:+.0%}'.format(seconds/base - 1)
+            if base is not None and base >= MIN_SECONDS and seconds > base*(1 + args.threshold):
+                regressions.append((name, n_rows, base, seconds))
+                change += ' !'
+            print('{:30s} {:8d} {:12.5f} {:10.2f} {:>10s}'.format(name, n_rows, seconds,
+                                                                  1e6*seconds/n_rows, change))
+            results.append({'commit': commit, 'host': host, 'time': time.time(),
+                            'python': platform.python_version(), 'pandas': pd.__version__,
+                            'bench': name, 'rows': n_rows, 'seconds': seconds})
+    if not args.no_save:
+        with open(args.results_file, 'a') as f_results:
+            for result in results:
+                f_results.write(json.dumps(result) + '\n')
+    if regressions:
+        print('\n{} regression(s) over {:.0%}:'.format(len(regressions), args.threshold))
+        for name, n_rows, base, seconds in regressions:
+            print('\t{} ({} rows): {:.5f} s -> {:.5f} s'.format(name, n_rows, base, seconds))
+        sys.exit(1)
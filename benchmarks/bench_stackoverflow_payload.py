@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Payload benchmark of the Stackoverflow requests with and without response filters.
+
+Fetches the profiles and top answer tags of a few users the way the ratings
+need them, once with the default filters (full user json, all tag fields) and
+once with the minimal server-side filters, and reports the requests made, bytes
+on the wire (compressed) and after decompression, and the time to parse the
+responses into frames. Makes 2 * (1 + number of users) API requests, plus the
+ones creating the filters.
+
+Usage (from the repo root): python3 benchmarks/bench_stackoverflow_payload.py [-i id ...] [-a key] [-r api_root]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+import requests
+import stackexchange
+import pandas as pd
+
+import api_session
+import rate_limit
+import get_stackoverflow_details as sod
+
+# a few active users with many tags
+USER_IDS = [22656, 29407, 157882, 17034, 6309, 23354, 115145, 100297, 19068, 1144035]
+
+
+class MeteredSession(requests.Session):
+    '''Session recording (bytes on the wire, decompressed body) of every response
+    '''
+    def __init__(self):
+        super().__init__()
+        self.responses = []
+
+    def send(self, request, **kwargs):
+        resp = super().send(request, **kwargs)
+        # urllib3 counts the (compressed) bytes read from the socket
+        wire_bytes = resp.raw.tell() if hasattr(resp.raw, 'tell') else len(resp.content)
+        self.responses.append((wire_bytes, resp.content))
+        return resp
+
+
+def fetch_default(so, user_ids):
+    '''Profiles and top answer tags with the default filters
+    '''
+    for user in so.users(user_ids, pagesize=sod.IDS_PER_REQUEST):
+        user.top_answer_tags.fetch()
+
+
+def fetch_minimal(so, user_ids):
+    '''Profiles and top answer tags with the minimal filters
+    '''
+    for user in sod.get_users_by_ids(so, user_ids, minimal=True).values():
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            sod.get_top_answers_tags(user)
+
+
+def parse_time(bodies, repeats):
+    '''Best time (sec) to decode bodies and build a frame of their items
+    '''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for body in bodies:
+            items = json.loads(body.decode('utf-8')).get('items', [])
+            pd.json_normalize(items)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Stackoverflow response payload benchmark")
+    parser.add_argument("-i", dest="user_ids", type=int, nargs='+', default=USER_IDS,
+                        help="stackoverflow user ids to fetch (default {} active users)".format(
+                                len(USER_IDS)))
+    parser.add_argument("-a", dest="auth_key", type=str,
+                        help="stackoverflow authentication key (to avoid rate limits)")
+    parser.add_argument("-r", dest="api_root", type=str, default=api_session.STACKEXCHANGE_API_ROOT,
+                        help="API root (default {})".format(api_session.STACKEXCHANGE_API_ROOT))
+    parser.add_argument("-n", dest="repeats", type=int, default=20,
+                        help="parse repeats, best time is reported (default 20)")
+    args = parser.parse_args()
+    session = MeteredSession()
+    adapter = api_session.make_adapter(
+            stackexchange_governor=rate_limit.stackoverflow_governor([args.auth_key]))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    so = api_session.StackExchangeSite(stackexchange.StackOverflow, args.auth_key, session=session,
+                                       api_root=args.api_root, cache=0)
+    # create the filters outside the measured requests
+    sod.get_filter(so, sod.USER_FILTER_FIELDS)
+    sod.get_filter(so, sod.TAG_FILTER_FIELDS)
+    n_users = len(args.user_ids)
+    print('{} users'.format(n_users))
+    print('{:10s} {:>9s} {:>12s} {:>12s} {:>14s}'.format(
+            'filters', 'requests', 'wire KB', 'json KB', 'parse ms/user'))
+    for name, fetch in [('default', fetch_default), ('minimal', fetch_minimal)]:
+        session.responses = []
+        fetch(so, args.user_ids)
+        wire_bytes = sum(wire for wire, body in session.responses)
+        bodies = [body for wire, body in session.responses]
+        elapsed = parse_time(bodies, args.repeats)
+        print('{:10s} {:9d} {:12.1f} {:12.1f} {:14.2f}'.format(
+                name, len(bodies), wire_bytes/1e3, sum(map(len, bodies))/1e3,
+                1e3*elapsed/max(1, n_users)))
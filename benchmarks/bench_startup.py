@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Startup time benchmark for the three entry points.
+
+Times `import <module>` and `python <script> --help` in fresh interpreters and
+lists the heavy dependencies each import pulls in.
+
+Usage (from the repo root): python3 benchmarks/bench_startup.py [-r repeats]
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENTRY_POINTS = ['get_github_details', 'get_stackoverflow_details', 'parse_applicant_masterdata']
+HEAVY_MODULES = ['pandas', 'numpy', 'nltk', 'github', 'stackexchange', 'requests']
+
+
+def time_command(cmd, repeats):
+    '''Wall times (sec) of running cmd repeats times from the repo root
+    '''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                       check=True)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def loaded_heavy_modules(module):
+    '''Heavy dependencies that are in sys.modules after importing module
+    '''
+    code = ('import sys, {}; print(",".join(m for m in {!r} if m in sys.modules))'
+            .format(module, HEAVY_MODULES))
+    out = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, check=True,
+                         stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return out.strip() or '-'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Startup time benchmark for the entry points")
+    parser.add_argument("-r", dest="repeats", type=int, default=10,
+                        help="number of runs per measurement (default 10)")
+    args = parser.parse_args()
+    baseline = time_command([sys.executable, '-c', 'pass'], args.repeats)
+    print('{:30s} {:>12s} {:>12s}  {}'.format('entry point', 'import (ms)', '--help (ms)',
+                                             'heavy modules loaded on import'))
+    print('{:30s} {:12.1f} {:>12s}'.format('(bare interpreter)',
+                                           1000*statistics.median(baseline), '-'))
+    for module in ENTRY_POINTS:
+        import_times = time_command([sys.executable, '-c', 'import ' + module], args.repeats)
+        help_times = time_command([sys.executable, module + '.py', '--help'], args.repeats)
+        print('{:30s} {:12.1f} {:12.1f}  {}'.format(module, 1000*statistics.median(import_times),
+                                                   1000*statistics.median(help_times),
+                                                   loaded_heavy_modules(module)))
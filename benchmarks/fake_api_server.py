@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-in for the Github REST and Stackexchange APIs, for offline benchmarks.
+
+Serves generated fixtures shaped like the real payloads (users, repos,
+contributors, readmes, Stackoverflow users and top answer tags), paginated,
+gzip compressed, with rate limit headers / quota fields, from a background
+thread. Applicant k (0 <= k < n_applicants) is named 'Applicant k', with email
+'applicantk@example.com'; their Github user 'applicantk' has n_repos repos, the
+first n_shared of which are organization repos shared by all applicants, and
+their Stackoverflow user id is 1000 + k. Fixtures are the same on every run.
+The Github GraphQL endpoint (POST /graphql) answers the user id and repos
+queries of github_graphql with the same repos, contributions and readmes.
+
+Configurable behavior:
+    latency         seconds added to every response
+    github_quota    Github requests per quota_window seconds, then 403 until the window resets
+    backoff         'backoff' seconds sent with every backoff_every-th Stackexchange response
+    error_every     every error_every-th response is a 503
+    stall           seconds added to every stall_every-th response (a slow tail)
+
+push(full_names) moves the pushed_at / updated_at of repos forward by a day,
+as if they were pushed to, for incremental re-rating runs.
+
+Usage:
+    server = FakeApiServer(n_applicants=20, n_repos=30, latency=0.05).start()
+    ... point the clients at server.url ...
+    server.counts  # requests served by api, endpoint
+    server.stop()
+
+Run on its own (python3 benchmarks/fake_api_server.py [-p port]) to serve until interrupted.
+"""
+
+import re
+import sys
+import json
+import gzip
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+import collections
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+N_APPLICANTS = 20
+N_REPOS = 30
+N_SHARED = 5
+N_TAGS = 30
+N_DEVS = 40
+PER_PAGE = 30
+LANGUAGES = ['Python', 'JavaScript', 'Java', 'C++', 'Go', 'Shell', None]
+TAGS = ['python', 'javascript', 'java', 'c++', 'go', 'pandas', 'numpy', 'django', 'flask', 'react',
+        'node.js', 'sql', 'postgresql', 'docker', 'linux', 'bash', 'git', 'regex', 'json', 'html',
+        'css', 'algorithm', 'multithreading', 'performance', 'unit-testing', 'rest', 'http',
+        'asyncio', 'machine-learning', 'scikit-learn', 'tensorflow', 'kubernetes']
+README_WORDS = ['install', 'usage', 'library', 'python', 'api', 'server', 'client', 'data',
+                'pipeline', 'fast', 'parser', 'configuration', 'example', 'command', 'line',
+                'tool', 'database', 'query', 'cache', 'async', 'http', 'json', 'license', 'tests',
+                'documentation', 'contributing', 'build', 'docker', 'deploy', 'benchmark']
+# readme files looked up per repo by the GraphQL repos query (github_graphql.README_FILES)
+README_LOOKUPS = 6
+GITHUB_URL_FIELDS = ['forks', 'keys', 'collaborators', 'teams', 'hooks', 'issue_events', 'events',
+                     'assignees', 'branches', 'tags', 'blobs', 'git_tags', 'git_refs', 'trees',
+                     'statuses', 'languages', 'stargazers', 'contributors', 'subscribers',
+                     'subscription', 'commits', 'git_commits', 'comments', 'issue_comment',
+                     'contents', 'compare', 'merges', 'archive', 'downloads', 'issues', 'pulls',
+                     'milestones', 'notifications', 'labels', 'releases', 'deployments']
+
+
+def applicant(k):
+    '''Master data name and email of applicant k
+    '''
+    return {'name': 'Applicant {}'.format(k), 'email': 'applicant{}@example.com'.format(k)}
+
+
+def iso_date(day):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(1400000000 + 86400*day))
+
+
+def repo_index(full_name):
+    '''Index j of a repo named by github_repo
+    '''
+    return int(full_name.rsplit('-', 1)[1])
+
+
+def git_blob_sha(data):
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    '''Server that doesn't log clients closing their connection (e.g. after a 503)
+    '''
+    def handle_error(self, request, client_address):
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeApiServer(object):
+    '''Github REST and Stackexchange API stand-in on 127.0.0.1, see module docstring
+    '''
+    def __init__(self, n_applicants=N_APPLICANTS, n_repos=N_REPOS, n_shared=N_SHARED,
+                 n_tags=N_TAGS, latency=0.0, github_quota=None, quota_window=60,
+                 backoff=None, backoff_every=0, error_every=0, stall=0.0, stall_every=0, port=0):
+        self.n_applicants = n_applicants
+        self.n_repos = n_repos
+        self.n_shared = min(n_shared, n_repos)
+        self.n_tags = n_tags
+        self.latency = latency
+        self.github_quota = github_quota
+        self.quota_window = quota_window
+        self.backoff = backoff
+        self.backoff_every = backoff_every
+        self.error_every = error_every
+        self.stall = stall
+        self.stall_every = stall_every
+        self.lock = threading.Lock()
+        self.counts = collections.Counter()
+        # responses of any kind, for the injected errors and stalls
+        self.n_served = 0
+        # {resource: (requests used, start of quota window)}
+        self.github_used = {}
+        self.filters = {}
+        # {repo full_name: days pushed_at / updated_at moved forward}
+        self.pushes = collections.Counter()
+        handler = type('Handler', (FakeApiHandler,), {'api': self})
+        self.httpd = QuietHTTPServer(('127.0.0.1', port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.httpd.server_port)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def reset_counts(self):
+        with self.lock:
+            self.counts.clear()
+
+    def push(self, full_names):
+        '''Bump pushed_at / updated_at of repos full_names, as if they were pushed to
+        '''
+        with self.lock:
+            self.pushes.update(full_names)
+
+    def n_requests(self, api=None):
+        return sum(n for (counted_api, endpoint), n in self.counts.items()
+                   if api is None or counted_api == api)
+
+    # Github fixtures
+
+    def github_user(self, login, brief=False):
+        k = int(login[len('applicant'):]) if login.startswith('applicant') else -1
+        url = '{}/users/{}'.format(self.url, login)
+        user = {'login': login, 'id': 5000 + k, 'node_id': 'U_{}'.format(login),
+                'avatar_url': 'https://avatars.example.com/u/{}'.format(5000 + k),
+                'gravatar_id': '', 'url': url, 'html_url': 'https://github.com/' + login,
+                'followers_url': url + '/followers', 'following_url': url + '/following{/other_user}',
+                'gists_url': url + '/gists{/gist_id}', 'starred_url': url + '/starred{/owner}{/repo}',
+                'subscriptions_url': url + '/subscriptions', 'organizations_url': url + '/orgs',
+                'repos_url': url + '/repos', 'events_url': url + '/events{/privacy}',
+                'received_events_url': url + '/received_events', 'type': 'User',
+                'site_admin': False}
+        if brief:
+            user['score'] = 1.0
+            return user
+        user.update({'name': applicant(k)['name'] if k >= 0 else login, 'company': None,
+                     'blog': '', 'location': 'Earth', 'hireable': None, 'bio': None,
+                     'email': applicant(k)['email'] if k >= 0 else None,
+                     'public_repos': self.n_repos, 'public_gists': 0, 'followers': k % 17,
+                     'following': k % 5, 'created_at': iso_date(k), 'updated_at': iso_date(900)})
+        return user
+
+    def github_repo(self, login, j):
+        '''Repo j of user login: the first n_shared are shared organization repos,
+        every 10th one is empty, the one after it an unchanged fork and the third
+        one after it has no readme
+        '''
+        shared = j < self.n_shared
+        owner, name = ('acme', 'shared-{}'.format(j)) if shared else (login, 'project-{}'.format(j))
+        full_name = owner + '/' + name
+        rnd = random.Random(full_name)
+        kind = j % 10
+        url = '{}/repos/{}'.format(self.url, full_name)
+        repo = {'id': rnd.randrange(10**8), 'node_id': 'R_' + full_name, 'name': name,
+                'full_name': full_name, 'private': False,
+                'owner': dict(self.github_user(owner, brief=True),
+                              type='Organization' if shared else 'User'),
+                'html_url': 'https://github.com/' + full_name,
+                'description': ' '.join(rnd.choice(README_WORDS) for _ in range(8)),
+                'fork': kind == 1 and not shared, 'url': url}
+        for field in GITHUB_URL_FIELDS:
+            repo[field + '_url'] = '{}/{}'.format(url, field)
+        created = 100 + rnd.randrange(500)
+        days = self.pushes[full_name]
+        repo.update({'created_at': iso_date(created), 'updated_at': iso_date(created + 200 + days),
+                     'pushed_at': iso_date((created if kind == 1 else created + 100) + days),
+                     'git_url': 'git://github.com/{}.git'.format(full_name),
+                     'ssh_url': 'git@github.com:{}.git'.format(full_name),
+                     'clone_url': 'https://github.com/{}.git'.format(full_name),
+                     'homepage': None, 'size': 0 if kind == 0 else rnd.randrange(1, 50000),
+                     'stargazers_count': 0 if kind in (0, 1) else rnd.randrange(50),
+                     'language': rnd.choice(LANGUAGES), 'has_issues': True, 'has_wiki': True,
+                     'forks_count': 0 if kind in (0, 1) else rnd.randrange(10), 'archived': False,
+                     'open_issues_count': rnd.randrange(5), 'license': None, 'topics': [],
+                     'default_branch': 'master'})
+        repo['watchers_count'] = repo['watchers'] = repo['stargazers_count']
+        repo['forks'], repo['open_issues'] = repo['forks_count'], repo['open_issues_count']
+        return repo
+
+    def github_contributors(self, full_name):
+        rnd = random.Random(full_name)
+        owner = full_name.split('/')[0]
+        if repo_index(full_name) % 10 == 0:
+            # empty repo, no commits
+            return []
+        if owner == 'acme':
+            logins = ['applicant{}'.format(k) for k in range(self.n_applicants)]
+        else:
+            logins = [owner]
+        logins += ['dev{}'.format(i) for i in rnd.sample(range(N_DEVS), rnd.randrange(1, 10))]
+        contributors = [dict(self.github_user(login, brief=True), contributions=rnd.randrange(1, 300))
+                        for login in logins]
+        return sorted(contributors, key=lambda contrib: -contrib['contributions'])
+
+    def github_readme(self, full_name):
+        '''Readme of repo full_name, None if it has none
+        '''
+        if repo_index(full_name) % 10 == 3:
+            return None
+        rnd = random.Random(full_name + '/readme')
+        lines = ['# ' + full_name.split('/')[1], '']
+        for _ in range(rnd.randrange(10, 60)):
+            lines.append(' '.join(rnd.choice(README_WORDS) for _ in range(12)))
+        content = '\n'.join(lines).encode('utf-8')
+        url = '{}/repos/{}/contents/README.md'.format(self.url, full_name)
+        return {'type': 'file', 'encoding': 'base64', 'size': len(content), 'name': 'README.md',
+                'path': 'README.md', 'sha': git_blob_sha(content), 'url': url,
+                'content': base64.encodebytes(content).decode('ascii')}
+
+    def github_repo_node(self, login, j, readmes=True):
+        '''GraphQL repository node of repo j of user login, with the commit counts of login
+        '''
+        repo = self.github_repo(login, j)
+        contributors = self.github_contributors(repo['full_name'])
+        node = {'databaseId': repo['id'], 'name': repo['name'], 'nameWithOwner': repo['full_name'],
+                'url': repo['html_url'], 'description': repo['description'],
+                'isFork': repo['fork'], 'diskUsage': repo['size'],
+                'forkCount': repo['forks_count'], 'stargazerCount': repo['stargazers_count'],
+                'createdAt': repo['created_at'], 'updatedAt': repo['updated_at'],
+                'pushedAt': repo['pushed_at'],
+                'owner': {'login': repo['owner']['login'], '__typename': repo['owner']['type']},
+                'primaryLanguage': {'name': repo['language']} if repo['language'] else None,
+                'issues': {'totalCount': repo['open_issues_count']},
+                'pullRequests': {'totalCount': 0},
+                # empty repos have no default branch
+                'defaultBranchRef': None}
+        if contributors:
+            node['defaultBranchRef'] = {'target': {
+                    'history': {'totalCount': sum(c['contributions'] for c in contributors)},
+                    'userHistory': {'totalCount': sum(c['contributions'] for c in contributors
+                                                      if c['login'] == login)}}}
+        if readmes:
+            readme = self.github_readme(repo['full_name'])
+            # only README.md exists, the other readme files looked up are null
+            for i in range(README_LOOKUPS):
+                node['readme{}'.format(i)] = None
+            if readme is not None:
+                node['readme0'] = {'oid': readme['sha'],
+                                   'text': base64.b64decode(readme['content']).decode('utf-8')}
+        return node
+
+    def github_graphql(self, query, variables):
+        '''Data of a GraphQL user id or repos query, None if the query isn't known
+        '''
+        login = variables.get('login', '')
+        if 'repositories(' in query:
+            self.count('github', 'graphql repos')
+            if variables.get('userId') != 'U_' + login:
+                return {'user': None}
+            start = int(variables.get('cursor') or 0)
+            end = min(self.n_repos, start + int(variables['pageSize']))
+            nodes = [self.github_repo_node(login, j, readmes='readme0' in query)
+                     for j in range(start, end)]
+            return {'user': {'repositories': {
+                    'pageInfo': {'hasNextPage': end < self.n_repos, 'endCursor': str(end)},
+                    'nodes': nodes}}}
+        if 'user(' in query:
+            self.count('github', 'graphql user')
+            return {'user': {'id': 'U_' + login}}
+        return None
+
+    # Stackexchange fixtures
+
+    def se_user(self, user_id, display_name=None):
+        k = user_id - 1000
+        return {'badge_counts': {'bronze': k % 50, 'silver': k % 20, 'gold': k % 5},
+                'account_id': 30000 + k, 'is_employee': False, 'last_modified_date': 1600000000,
+                'last_access_date': 1700000000, 'reputation_change_year': k % 100,
+                'reputation_change_quarter': k % 30, 'reputation_change_month': k % 10,
+                'reputation_change_week': 0, 'reputation_change_day': 0,
+                'reputation': 100 + 37*k, 'creation_date': 1300000000 + 86400*k,
+                'user_type': 'registered', 'user_id': user_id, 'accept_rate': 50 + k % 50,
+                'location': 'Earth', 'website_url': 'https://example.com/{}'.format(k),
+                'link': 'https://stackoverflow.com/users/{}/applicant-{}'.format(user_id, k),
+                'profile_image': 'https://www.gravatar.com/avatar/{:032x}?s=256&d=identicon'.format(k),
+                'display_name': display_name or 'Applicant {}'.format(k),
+                'about_me': '<p>' + 'Software developer. ' * (10 + k % 30) + '</p>',
+                'view_count': 10*k, 'up_vote_count': k, 'down_vote_count': k % 7,
+                'answer_count': 3*k, 'question_count': k % 40, 'collectives': []}
+
+    def se_top_tags(self, user_id, pagesize):
+        rnd = random.Random(user_id)
+        tags = rnd.sample(TAGS, min(len(TAGS), self.n_tags))[:pagesize]
+        return [{'user_id': user_id, 'tag_name': tag, 'answer_count': rnd.randrange(100),
+                 'answer_score': rnd.randrange(500), 'question_count': rnd.randrange(20),
+                 'question_score': rnd.randrange(50)} for tag in tags]
+
+    def se_filtered(self, obj, typ, include):
+        '''obj with only the fields of a filter's include list (None: all fields)
+        '''
+        if include is None:
+            return obj
+        return {key: (self.se_filtered(value, 'badge_count', include)
+                      if isinstance(value, dict) else value)
+                for key, value in obj.items() if '{}.{}'.format(typ, key) in include}
+
+    # request handling
+
+    def serve(self):
+        '''Number of this response among all responses served
+        '''
+        with self.lock:
+            self.n_served += 1
+            return self.n_served
+
+    def count(self, api, endpoint):
+        with self.lock:
+            self.counts[(api, endpoint)] += 1
+            return sum(n for (counted_api, _), n in self.counts.items() if counted_api == api)
+
+    def github_quota_left(self, resource):
+        '''(remaining, reset epoch) of the Github quota of resource after one more request
+        '''
+        with self.lock:
+            now = time.time()
+            used, window_start = self.github_used.get(resource, (0, None))
+            # windows start on a whole second, resets are reported in whole seconds
+            if window_start is None or now >= window_start + self.quota_window:
+                used, window_start = 0, float(int(now))
+            self.github_used[resource] = (used + 1, window_start)
+            return self.github_quota - used - 1, int(window_start + self.quota_window)
+
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    api = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        headers = dict(headers or {}, **{'Content-Type': 'application/json; charset=utf-8'})
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            data = gzip.compress(data, compresslevel=6)
+            headers['Content-Encoding'] = 'gzip'
+        headers['Content-Length'] = str(len(data))
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def delay_or_fail(self):
+        '''Add the latency and stalls of this response, True if it was answered with a 503
+        '''
+        api = self.api
+        n = api.serve()
+        if api.latency:
+            time.sleep(api.latency)
+        if api.stall and api.stall_every and n % api.stall_every == 0:
+            time.sleep(api.stall)
+        if api.error_every and n % api.error_every == 0:
+            api.count('fault', '503')
+            self.send_json(503, {'message': 'Service Unavailable'})
+            return True
+        return False
+
+    def do_GET(self):
+        if self.delay_or_fail():
+            return
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        path = urllib.parse.unquote(url.path).strip('/')
+        if re.match(r'\d+\.\d+/', path):
+            return self.stackexchange(path.split('/', 1)[1], query)
+        return self.github(path, query)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.delay_or_fail():
+            return
+        path = urllib.parse.urlsplit(self.path).path.strip('/')
+        request = json.loads(body.decode('utf-8') or '{}')
+        data = None
+        if path == 'graphql':
+            data = self.api.github_graphql(request.get('query', ''), request.get('variables') or {})
+        if data is None:
+            self.api.count('github', 'not_found')
+            return self.send_json(404, {'message': 'Not Found'})
+        self.send_json(200, {'data': data})
+
+    def paginate(self, items, path, query, headers):
+        '''Page of items for query page/per_page, with a Link header to the next / last page
+        '''
+        per_page = int(query.get('per_page', PER_PAGE))
+        page = int(query.get('page', 1))
+        n_pages = max(1, -(-len(items) // per_page))
+        links = []
+        for rel, link_page in [('next', page + 1), ('last', n_pages)]:
+            if page < n_pages:
+                link_query = urllib.parse.urlencode(dict(query, page=link_page))
+                links.append('<{}/{}?{}>; rel="{}"'.format(self.api.url, path, link_query, rel))
+        if links:
+            headers['Link'] = ', '.join(links)
+        return items[(page - 1)*per_page:page*per_page]
+
+    def github(self, path, query):
+        api = self.api
+        resource = 'search' if path.startswith('search/') else 'core'
+        headers = {}
+        if api.github_quota is not None:
+            remaining, reset = api.github_quota_left(resource)
+            headers.update({'X-RateLimit-Limit': str(api.github_quota),
+                            'X-RateLimit-Remaining': str(max(0, remaining)),
+                            'X-RateLimit-Reset': str(reset), 'X-RateLimit-Resource': resource})
+            if remaining < 0:
+                api.count('github', 'rate_limited')
+                return self.send_json(403, {'message': 'API rate limit exceeded'}, headers)
+        parts = path.split('/')
+        if path == 'search/users':
+            api.count('github', 'search/users')
+            match = re.match(r'applicant(\d+)@example\.com$', query.get('q', ''))
+            logins = ['applicant' + match.group(1)] if match else []
+            items = [api.github_user(login, brief=True) for login in logins]
+            body = {'total_count': len(items), 'incomplete_results': False,
+                    'items': self.paginate(items, path, query, headers)}
+        elif len(parts) == 2 and parts[0] == 'users':
+            api.count('github', 'users/{login}')
+            body = api.github_user(parts[1])
+        elif len(parts) == 3 and parts[0] == 'users' and parts[2] == 'repos':
+            api.count('github', 'users/{login}/repos')
+            repos = [api.github_repo(parts[1], j) for j in range(api.n_repos)]
+            body = self.paginate(repos, path, query, headers)
+        elif len(parts) == 3 and parts[0] == 'repos':
+            api.count('github', 'repos/{repo}')
+            login = parts[1] if parts[1] != 'acme' else 'applicant0'
+            body = api.github_repo(login, int(parts[2].rsplit('-', 1)[1]))
+        elif len(parts) == 4 and parts[0] == 'repos' and parts[3] == 'contributors':
+            api.count('github', 'repos/{repo}/contributors')
+            contributors = api.github_contributors(parts[1] + '/' + parts[2])
+            body = self.paginate(contributors, path, query, headers)
+        elif len(parts) == 4 and parts[0] == 'repos' and parts[3] == 'readme':
+            api.count('github', 'repos/{repo}/readme')
+            body = api.github_readme(parts[1] + '/' + parts[2])
+            if body is None:
+                return self.send_json(404, {'message': 'Not Found'}, headers)
+        else:
+            api.count('github', 'not_found')
+            return self.send_json(404, {'message': 'Not Found'}, headers)
+        self.send_json(200, body, headers)
+
+    def stackexchange(self, path, query):
+        api = self.api
+        include = api.filters.get(query.get('filter'))
+        parts = path.split('/')
+        if path == 'filters/create':
+            n = api.count('stackexchange', 'filters/create')
+            with api.lock:
+                filter_id = 'F{}'.format(len(api.filters))
+                api.filters[filter_id] = set(query.get('include', '').split(';'))
+            items = [{'filter': filter_id, 'filter_type': 'safe'}]
+        elif path == 'users':
+            n = api.count('stackexchange', 'users')
+            match = re.match(r'applicant (\d+)$', query.get('inname', '').strip().lower())
+            users = []
+            if match:
+                k = int(match.group(1))
+                # the applicant and two namesakes
+                users = [api.se_user(1000 + k)] + [
+                        api.se_user(900000 + 10*k + i, 'Applicant {} {}'.format(k, 'XY'[i]))
+                        for i in range(2)]
+            items = [api.se_filtered(user, 'user', include) for user in users]
+        elif len(parts) == 3 and parts[0] == 'users' and parts[2] == 'top-answer-tags':
+            n = api.count('stackexchange', 'users/{id}/top-answer-tags')
+            tags = api.se_top_tags(int(parts[1]), int(query.get('pagesize', PER_PAGE)))
+            items = [api.se_filtered(tag, 'top_tag', include) for tag in tags]
+        elif len(parts) == 2 and parts[0] == 'users':
+            n = api.count('stackexchange', 'users/{ids}')
+            items = [api.se_filtered(api.se_user(int(user_id)), 'user', include)
+                     for user_id in parts[1].split(';')]
+        else:
+            api.count('stackexchange', 'not_found')
+            return self.send_json(404, {'error_id': 404, 'error_name': 'no_method',
+                                        'error_message': 'no method found with this name'})
+        body = {'items': items, 'has_more': False, 'quota_max': 10000,
+                'quota_remaining': max(0, 10000 - n)}
+        if api.backoff and api.backoff_every and n % api.backoff_every == 0:
+            body['backoff'] = api.backoff
+        if include is not None:
+            body = {key: value for key, value in body.items() if '.' + key in include}
+        self.send_json(200, body)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the fake Github / Stackexchange API")
+    parser.add_argument("-p", dest="port", type=int, default=8000, help="port (default 8000)")
+    parser.add_argument("-n", dest="n_applicants", type=int, default=N_APPLICANTS,
+                        help="number of applicants (default {})".format(N_APPLICANTS))
+    parser.add_argument("-r", dest="n_repos", type=int, default=N_REPOS,
+                        help="repos per Github user (default {})".format(N_REPOS))
+    parser.add_argument("-l", dest="latency", type=float, default=0.0,
+                        help="seconds added to every response (default 0)")
+    args = parser.parse_args()
+    server = FakeApiServer(n_applicants=args.n_applicants, n_repos=args.n_repos,
+                           latency=args.latency, port=args.port)
+    print('Serving on {} (Stackexchange API root {}), Ctrl-C to stop'.format(server.url, server.url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+        sys.exit(0)
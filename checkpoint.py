@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Checkpoint store for master data runs.
+
+Each applicant's ratings are committed to a SQLite file as soon as they are
+available, keyed by master row number plus name/email. A rerun skips the
+applicants that are done and retries only the failed or missing ones.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+CHECKPOINT_FILE = os.path.join('master_data', 'checkpoint.sqlite')
+
+
+def to_json_value(value):
+    '''Convert numpy / pandas scalars to something json can store
+    '''
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class CheckpointStore(object):
+    '''SQLite store of applicant ratings, one row per master data row
+    '''
+    def __init__(self, path=CHECKPOINT_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS applicants (
+                               row INTEGER PRIMARY KEY,
+                               name TEXT,
+                               email TEXT,
+                               status TEXT,
+                               ratings TEXT,
+                               error TEXT,
+                               updated_at REAL)''')
+        self.db.commit()
+
+    def is_done(self, row, name, email):
+        '''True if ratings for the applicant in row were saved successfully
+        '''
+        with self.lock:
+            result = self.db.execute('SELECT name, email, status FROM applicants WHERE row = ?',
+                                     (int(row),)).fetchone()
+        return result is not None and result == (name, email, 'done')
+
+    def save(self, row, name, email, ratings_dict, status='done', error=None):
+        '''Commit ratings ({(field_type, field): value}) of the applicant in row
+        '''
+        ratings = [[field_type, field, value] for (field_type, field), value in ratings_dict.items()]
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO applicants VALUES (?,?,?,?,?,?,?)',
+                            (int(row), name, email, status,
+                             json.dumps(ratings, default=to_json_value), error, time.time()))
+            self.db.commit()
+
+    def load(self, rows=None, status='done'):
+        '''Return {row: ratings_dict} of applicants with status (any status if None),
+        ordered by row, restricted to rows if given
+        '''
+        with self.lock:
+            results = self.db.execute('SELECT row, ratings FROM applicants '
+                                      'WHERE ? IS NULL OR status = ? ORDER BY row',
+                                      (status, status)).fetchall()
+        ratings = {}
+        for row, ratings_json in results:
+            if rows is not None and row not in rows:
+                continue
+            ratings[row] = {(field_type, field): value
+                            for field_type, field, value in json.loads(ratings_json)}
+        return ratings
+
+    def clear(self):
+        with self.lock:
+            self.db.execute('DELETE FROM applicants')
+            self.db.commit()
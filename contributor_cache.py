@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Run-scoped cache of repo contributor counts.
+
+Applicants from the same university or company contribute to the same
+organization repos. The contributor list of a repo (many pages for big repos)
+is fetched once per run and shared by every user and applicant touching it:
+concurrent lookups of the same repo wait for a single fetch. Memory is bounded
+by the total number of contributors held, least recently used repos are
+dropped first. Optionally backed by a SQLite file, so later runs reuse counts
+that are younger than the ttl.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CONTRIBUTORS_CACHE_FILE = os.path.join('cache', 'contributors.sqlite')
+# max number of (repo, contributor) counts held in memory
+CONTRIBUTORS_CACHE_SIZE = 200000
+# seconds for which on-disk counts are used, contributors change slowly
+CONTRIBUTORS_CACHE_TTL = 24*60*60
+
+
+class ContributorCache(object):
+    '''LRU cache of {login: contributions} and their total by repo full_name,
+    backed by a SQLite file if path is given
+    '''
+    def __init__(self, path=None, max_size=CONTRIBUTORS_CACHE_SIZE, ttl=CONTRIBUTORS_CACHE_TTL):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.lru = OrderedDict()
+        self.size = 0
+        # {full_name: threading.Event} of fetches in progress
+        self.inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if path is None:
+            return
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS contributors (
+                               full_name TEXT PRIMARY KEY,
+                               counts TEXT,
+                               stored_at REAL)''')
+        self.db.execute('DELETE FROM contributors WHERE stored_at < ?', (time.time() - ttl,))
+        self.db.commit()
+
+    def _remember(self, full_name, entry):
+        if full_name in self.lru:
+            self.size -= len(self.lru.pop(full_name)[0])
+        self.lru[full_name] = entry
+        self.size += len(entry[0])
+        # keep at least the entry just added, however big
+        while self.size > self.max_size and len(self.lru) > 1:
+            self.size -= len(self.lru.popitem(last=False)[1][0])
+
+    def _lookup(self, full_name):
+        '''(counts, total) from memory or disk, None if not cached. Call with lock held.
+        '''
+        entry = self.lru.get(full_name)
+        if entry is None and self.db is not None:
+            row = self.db.execute('SELECT counts FROM contributors WHERE full_name = ? '
+                                  'AND stored_at >= ?', (full_name, time.time() - self.ttl)).fetchone()
+            if row is not None:
+                counts = json.loads(row[0])
+                entry = (counts, sum(counts.values()))
+        if entry is not None:
+            self._remember(full_name, entry)
+        return entry
+
+    def get(self, full_name, fetch):
+        '''(counts, total) of repo full_name, calling fetch() for {login: contributions}
+        if it isn't cached. Concurrent calls for the same repo share a single fetch.
+        '''
+        while True:
+            with self.lock:
+                entry = self._lookup(full_name)
+                if entry is not None:
+                    self.hits += 1
+                    return entry
+                event = self.inflight.get(full_name)
+                if event is None:
+                    # this call fetches, others wait for it
+                    event = self.inflight[full_name] = threading.Event()
+                    self.misses += 1
+                    break
+            # another thread is fetching, use its result (or retry if it failed)
+            event.wait()
+        try:
+            counts = fetch()
+            entry = (counts, sum(counts.values()))
+            with self.lock:
+                self._remember(full_name, entry)
+                if self.db is not None:
+                    self.db.execute('INSERT OR REPLACE INTO contributors VALUES (?,?,?)',
+                                    (full_name, json.dumps(counts), time.time()))
+                    self.db.commit()
+            return entry
+        finally:
+            with self.lock:
+                del self.inflight[full_name]
+            event.set()
+
+    def clear(self):
+        with self.lock:
+            self.lru.clear()
+            self.size = 0
+            if self.db is not None:
+                self.db.execute('DELETE FROM contributors')
+                self.db.commit()
+
+
+# contributor cache used by get_contributions, in memory only unless one with a file is installed
+_cache = ContributorCache()
+
+
+def install_cache(cache):
+    '''Use cache (ContributorCache, or None for no caching) for all contributor lookups
+    '''
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    return _cache
+
+
+def get_contributions(full_name, fetch):
+    '''(counts, total) of repo full_name through the installed cache,
+    fetch() returns {login: contributions}
+    '''
+    cache = _cache
+    if cache is None:
+        counts = fetch()
+        return counts, sum(counts.values())
+    return cache.get(full_name, fetch)
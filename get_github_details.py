@@ -10,107 +10,237 @@ import json
 import sys
 import os
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
-import nltk
-import pandas as pd
-import numpy as np
-from github import Github
-from pandas.io.json import json_normalize
+import keywords
+import user_search
+import contributor_cache
+import repo_snapshots
+import result_store
+import resilience
+import tracing
+from lazy_import import LazyModule
 
-# add nltk_data folder to the list of NLTK library paths
-nltk.data.path.insert(0,'nltk_data')
-# set of stopwords
-STOPWORDS = set(nltk.corpus.stopwords.words('english'))
+# heavy dependencies are imported on first use
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
+api_session = LazyModule('api_session')
+http_cache = LazyModule('http_cache')
+rate_limit = LazyModule('rate_limit')
+github_graphql = LazyModule('github_graphql')
+# maximum number of repos whose contributors and readme are fetched concurrently
+REPO_WORKERS = 8
+# readme keyword extraction engine, 'regex' (fast) or 'nltk' (parity with earlier results)
+KEYWORDS_ENGINE = 'regex'
+# repo fields in the main_details sheet of the excel export
+EXCEL_FIELDS = ['user_name', 'user_login', 'user_email', 'full_name', 'owner',
+                'html_url', 'language', 'updated_at', 'fork', 'forks_count', 'stargazers_count',
+                'contributions', 'user_contrib_pct','readme_keywords','repo_rating','user_rating']
+# raw repo fields used for ratings and excel output, nested fields flattened as 'a.b'
+REPO_FIELDS = ['id', 'name', 'full_name', 'html_url', 'description', 'language', 'fork', 'size',
+               'forks_count', 'stargazers_count', 'watchers_count', 'open_issues_count',
+               'created_at', 'updated_at', 'pushed_at', 'owner.login', 'owner.type']
 
 
-def get_keywords(readme):
-    tokens_all = nltk.word_tokenize(readme)
-    tokens_set = set(tokens_all)
-    tokens_alpha = [s.lower() for s in tokens_set if s.isalpha()]
-    tokens_nostop = set(tokens_alpha) - STOPWORDS
-    return list(tokens_nostop)
+def get_keywords(readme, engine=KEYWORDS_ENGINE):
+    '''Keywords of a single readme, see keywords.get_keywords
+    '''
+    return keywords.get_keywords(readme, engine=engine)
 
 
-def parse_contributions(df_repo, user, repo):
-    '''Extract user's contribution for the specified repo
+@tracing.traced('github.contributors')
+def parse_contributions(repo_row, user, repo):
+    '''Extract user's contribution for the specified repo.
+    Contributor counts of a repo are fetched once per run (contributor_cache).
     '''
-    # get list of all contributions
-    contribs_list = repo.get_contributors()
-    # dict of {user:contributions} for the repo
-    contribs_dict = {contrib.login : contrib.contributions for contrib in contribs_list}
+    # dict of {user:contributions} for the repo, from list of all contributions
+    fetch = lambda: {contrib.login : contrib.contributions for contrib in repo.get_contributors()}
+    contribs_dict, sum_contribs = contributor_cache.get_contributions(repo.full_name, fetch)
     # get user's contribution %
-    sum_contribs = sum(contrib for contrib in contribs_dict.values())
     try:
         user_contrib = 100*contribs_dict[user.login]/sum_contribs
     except (ZeroDivisionError, KeyError):
         user_contrib = 0
-    # add contribution and owner details to the repo dataframe
-    df_repo['user_contrib_pct'] = user_contrib
-    df_repo['contributions'] = sum_contribs
-    df_repo['owner'] = repo.owner.login
+    # add contribution and owner details to the repo row
+    repo_row['user_contrib_pct'] = user_contrib
+    repo_row['contributions'] = sum_contribs
+    repo_row['owner'] = repo.owner.login
     print("\t\t{:3.0f}% contribution in '{}' ({})".format(user_contrib, repo.full_name,
                                                           repo.language))
-    return df_repo
+    return repo_row
 
 
-def parse_readme(df_repo, user, repo):
-    '''Extract keywords from readme
+@tracing.traced('github.readme')
+def parse_readme(repo_row, user, repo):
+    '''Get readme text and blob sha, keywords are extracted from the readmes
+    of all repos at once by add_readme_keywords
     '''
     try:
         readme_data = repo.get_readme()
         readme_binstr = readme_data.decoded_content
         readme = readme_binstr.decode('utf-8')
-        keywords_list = get_keywords(readme)
+        readme_sha = readme_data.sha
     except:
-        keywords_list = []
-    df_repo['readme_keywords'] = ','.join(keywords_list)
-    return df_repo
+        readme = ''
+        readme_sha = None
+    repo_row['readme_text'] = readme
+    repo_row['readme_sha'] = readme_sha
+    return repo_row
+
+
+@tracing.traced('github.keywords')
+def add_readme_keywords(repo_rows, engine=KEYWORDS_ENGINE):
+    '''Replace readme text of each repo row with the readme keywords,
+    extracting keywords of all readmes as a batch. Readmes already seen
+    (same blob sha) get their keywords from the keyword cache.
+    '''
+    readmes = [repo_row.pop('readme_text', '') for repo_row in repo_rows]
+    shas = [repo_row.pop('readme_sha', None) for repo_row in repo_rows]
+    keywords_lists = keywords.get_keywords_batch(readmes, engine=engine, shas=shas)
+    for repo_row, keywords_list in zip(repo_rows, keywords_lists):
+        repo_row['readme_keywords'] = ','.join(keywords_list)
+    return repo_rows
 
 
-def add_user_details(df_repo, user, fields):
-    '''Add specified user details to tabular data
+def add_user_details(repo_row, user, fields):
+    '''Add specified user details to the repo row
     '''
     for field in fields:
         try:
-            df_repo['user_' + field] = getattr(user, field)
+            repo_row['user_' + field] = getattr(user, field)
         except AttributeError:
             continue
-    return df_repo
+    return repo_row
 
 
 def convert_datetime_cols(df_all, date_cols):
     ''' Convert datetime string to datetime objects
     '''
     for col in date_cols:
-        df_all[col] = pd.to_datetime(df_all[col],infer_datetime_format=True)
+        df_all[col] = pd.to_datetime(df_all[col])
     return df_all
 
 
-def parse_user_details(user):
-    '''For each of the users matching the search string,
-    get all the user repos and parse the information to a dataframe.
+def flatten_json(data, prefix=''):
+    '''Flatten nested dicts to a single dict with 'a.b' keys, as json_normalize does
+    '''
+    record = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            record.update(flatten_json(value, prefix + key + '.'))
+        else:
+            record[prefix + key] = value
+    return record
+
+
+def add_pruned_details(repo_row, reason):
+    '''Fill in contribution and readme details of a pruned repo without fetching them
+    '''
+    repo_row['user_contrib_pct'] = 0
+    repo_row['contributions'] = 0
+    repo_row['owner'] = repo_row.get('owner.login')
+    repo_row['readme_text'] = ''
+    repo_row['readme_sha'] = None
+    print("\t\t  - skipped '{}' ({})".format(repo_row.get('full_name'), reason))
+    return repo_row
+
+
+def parse_repo(user, repo, keep_raw=True, exact=False, readme=True, prune_forks=False):
+    '''Get contribution and readme details of a single repo as a dict (one row of repo table).
+    If keep_raw is False only REPO_FIELDS of the raw repo json are kept.
+    The readme isn't fetched unless readme, the ratings don't use it.
+    Unless exact, repos that can't add to the user's ratings (see prune_reason) are
+    not fetched, their 'pruned' column gives the reason. Forks never pushed to are
+    pruned too if prune_forks.
     '''
-    repos_dfs = []
-    # get all repos for user
-    repos = list(user.get_repos(type='all'))
-    n_repos = len(repos)
-    print('\t{}, {}, {}, {:2d} repos'.format(user.name, user.login, user.email, n_repos))
-    if n_repos == 0:
-        return pd.DataFrame()
-    # for each repo, get contirbution details for the user and parse the info to dataframe
-    for repo in repos:
-        # json to dataframe using builtin pandas method
-        df_repo = json_normalize(repo.raw_data) # 30 sec
+    # flatten repo json to a row
+    repo_row = flatten_json(repo.raw_data)
+    if not keep_raw:
+        repo_row = {field:repo_row.get(field) for field in REPO_FIELDS}
+    repo_row['pruned'] = None if exact else prune_reason(repo_row, user.login, forks=prune_forks)
+    if repo_row['pruned'] is not None:
+        repo_row = add_pruned_details(repo_row, repo_row['pruned'])
+    else:
         # parse contribution
-        df_repo = parse_contributions(df_repo, user, repo) # 1 min
+        repo_row = parse_contributions(repo_row, user, repo) # 1 min
         # parse readme readme
-        df_repo = parse_readme(df_repo, user, repo) # 30 sec
-        # append user id details to the repo dataframe
-        df_repo = add_user_details(df_repo, user, fields = ['login','name','email','score'])
-        # add it to the list of repo dataframes
-        repos_dfs.append(df_repo)
-    # combine all the repo dataframes for each of the matching users
-    df_all = pd.concat(repos_dfs, axis=0, ignore_index=True)
+        if readme:
+            repo_row = parse_readme(repo_row, user, repo) # 30 sec
+    # append user id details to the repo row
+    repo_row = add_user_details(repo_row, user, fields = ['login','name','email','score'])
+    return repo_row
+
+
+@tracing.traced('github.repos')
+def parse_user_details(user, n_workers=REPO_WORKERS, keep_raw=True, engine=KEYWORDS_ENGINE,
+                       graphql=None, exact=False, lean=False, prune_forks=False):
+    '''For each of the users matching the search string,
+    get all the user repos and parse the information to a dataframe.
+    Up to n_workers repos are fetched concurrently.
+    If keep_raw is False the unused raw repo json fields are dropped.
+    Readme keywords are extracted with engine ('regex' or 'nltk').
+    If graphql (github_graphql.GithubGraphql) is given, repos are fetched with
+    a few GraphQL queries instead, keeping only REPO_FIELDS.
+    Unless exact, contributors and readme of repos that can't add to the ratings are skipped,
+    and of forks never pushed to if prune_forks.
+    If lean, only what the ratings need is fetched and kept: no readmes, only REPO_FIELDS.
+    If repo snapshots are installed (repo_snapshots.install_snapshots), only repos that are
+    new or changed since the user's snapshot are fetched, the others keep their snapshot rows
+    (REST only, GraphQL fetches every repo in a few queries anyway).
+    '''
+    keep_raw = keep_raw and not lean
+    if graphql is not None:
+        # repos, contributions and readmes in one query per page of repos
+        repo_rows = graphql.get_repo_rows(user.login, getattr(user, 'node_id', None),
+                                          readmes=not lean)
+        repo_rows = [add_user_details(repo_row, user, fields = ['login','name','email','score'])
+                     for repo_row in repo_rows]
+        n_repos = len(repo_rows)
+        print('\t{}, {}, {}, {:2d} repos'.format(user.name, user.login, user.email, n_repos))
+        if n_repos == 0:
+            return pd.DataFrame()
+        # extract keywords of all readmes at once
+        repo_rows = add_readme_keywords(repo_rows, engine=engine)
+    else:
+        # get all repos for user
+        repos = list(user.get_repos(type='all'))
+        n_repos = len(repos)
+        print('\t{}, {}, {}, {:2d} repos'.format(user.name, user.login, user.email, n_repos))
+        if n_repos == 0:
+            return pd.DataFrame()
+        # repos listed with the same pushed_at / updated_at as in the snapshot are unchanged
+        snapshots = repo_snapshots.get_snapshots()
+        options = {'keep_raw': keep_raw, 'readme': not lean, 'exact': exact, 'engine': engine,
+                   'prune_forks': prune_forks}
+        snapshot = snapshots.load(user.login, options) if snapshots is not None else {}
+        versions = [repo_snapshots.repo_version(repo) for repo in repos]
+        changed = [repo for repo, version in zip(repos, versions)
+                   if snapshot.get(repo.full_name, (None, None))[0] != version]
+        # for each repo, get contirbution details for the user and parse the info to a row,
+        # executor.map returns the repo rows in the original repo order,
+        # workers trace their requests for this thread's applicant
+        fetch_repo = tracing.bind(lambda repo: parse_repo(user, repo, keep_raw, exact,
+                                                          readme=not lean, prune_forks=prune_forks))
+        with ThreadPoolExecutor(max_workers=max(1, min(n_workers, len(changed)))) as executor:
+            changed_rows = list(executor.map(fetch_repo, changed))
+        # extract keywords of all readmes fetched at once
+        changed_rows = add_readme_keywords(changed_rows, engine=engine)
+        changed_rows = {repo.full_name: repo_row for repo, repo_row in zip(changed, changed_rows)}
+        repo_rows = [changed_rows[repo.full_name] if repo.full_name in changed_rows
+                     else add_user_details(snapshot[repo.full_name][1], user,
+                                           fields = ['login','name','email','score'])
+                     for repo in repos]
+        if snapshots is not None:
+            full_names = [repo.full_name for repo in repos]
+            snapshots.save(user.login, options, list(zip(full_names, versions, repo_rows)))
+            if len(changed) < n_repos:
+                print('\t{} of {} repos unchanged since the last run, not fetched again'.format(
+                        n_repos - len(changed), n_repos))
+        n_pruned = sum(repo_row['pruned'] is not None for repo_row in repo_rows)
+        if n_pruned:
+            print('\t{} of {} repos skipped, they can\'t add to the ratings'.format(n_pruned, n_repos))
+    # build the dataframe of all the repos at once
+    df_all = pd.DataFrame.from_records(repo_rows)
     # convert datetime columns to datetime objects
     df_all = convert_datetime_cols(df_all, date_cols=['updated_at','created_at', 'pushed_at'])
     # return combined dataframe
@@ -118,10 +248,18 @@ def parse_user_details(user):
     return df_all
 
 
+def get_func(func):
+    '''Resolve func given by name (e.g. 'log10') to the numpy function
+    '''
+    if isinstance(func, str):
+        return getattr(np, func)
+    return func
+
+
 def apply_func_wgt_bias(x, ops):
     ''' Returns a_f * func( a_x * x + b_x) + b_f
     '''
-    func = ops.get('func',float)
+    func = get_func(ops.get('func',float))
     a_x = ops.get('a_x',1)
     a_f = ops.get('a_f',1)
     b_x = ops.get('b_x',0)
@@ -136,31 +274,83 @@ def apply_row_ops(row, row_ops):
     return result
 
 
-def get_overall_rating(repo_details, user):
-    '''Get overall rating based on all details
+def apply_column_ops(df, col_ops):
+    ''' Vectorized apply_row_ops, returns SUM( a_f*func(a_x*x + b_x) + b_f) over
+    whole columns of df as a numpy array
+    '''
+    result = np.zeros(df.shape[0])
+    for col, ops in col_ops.items():
+        func = get_func(ops.get('func',float))
+        # float() doesn't take arrays, the column is cast to float anyway
+        func = np.asarray if func is float else func
+        x = df[col].values.astype(float)
+        result += ops.get('a_f',1) * func(x * ops.get('a_x',1) + ops.get('b_x',0)) + ops.get('b_f',0)
+    return result
+
+
+# calculate repo's overall rating as SUM( a_f*func(a_x*x + b_x) + b_f)
+REPO_OPS = {
+        'forks_count': {'func':'abs', 'a_x':1, 'a_f':2, 'b_x':0, 'b_f':0},
+        'stargazers_count': {'func':'abs', 'a_x':1, 'a_f':1, 'b_x':0, 'b_f':0},
+        'contributions': {'func':'log10', 'a_x':1, 'a_f':1, 'b_x':1, 'b_f':0}
+}
+# user's share of a repo's rating is reduced by owner_frac if the user owns the repo
+OWNER_FRAC = 0.25
+
+
+def user_rating_bound(repo_row, user_login, contributions, repo_ops=REPO_OPS, owner_frac=OWNER_FRAC):
+    '''Upper bound of a repo's user_rating from the fields of the repo listing,
+    for a repo with at most contributions commits, taking the user's share as 100%
+    '''
+    row = {col: abs(repo_row.get(col) or 0) for col in repo_ops}
+    row['contributions'] = contributions
+    isowner = repo_row.get('owner.login') == user_login
+    return apply_row_ops(row, repo_ops) * (1.25 - owner_frac*isowner)
+
+
+def prune_reason(repo_row, user_login, forks=False):
+    '''Reason why the repo (flattened repo listing json) can't get a non-zero user_rating,
+    None if it may. Such repos don't need contributors and readme fetched.
+    Only repos whose stars and forks alone rate below 1 are pruned, and of those
+      * empty repos (size 0): no commits, so no contributions
+      * if forks, forks never pushed to: assumed to hold no commits of the user. This is
+        a guess, not a bound: commits the user made upstream before the fork count.
+    '''
+    if user_rating_bound(repo_row, user_login, contributions=0) >= 1:
+        return None
+    if repo_row.get('size') == 0:
+        return 'empty'
+    # pushed_at of a fork that was never pushed to is older than its creation
+    pushed_at, created_at = repo_row.get('pushed_at'), repo_row.get('created_at')
+    if forks and repo_row.get('fork') and pushed_at and created_at and pushed_at <= created_at:
+        return 'unchanged fork'
+    return None
+
+
+def rate_repos(repo_details, repo_ops=REPO_OPS, owner_frac=OWNER_FRAC):
+    '''Add isowner, repo_rating and user_rating columns to repo_details,
+    evaluating repo_ops on whole columns at once
     '''
     isowner = repo_details['owner'] == repo_details['user_login']
     repo_details['isowner'] = isowner.astype(int)
     # assign a rating for each repo
-    # calculate repo's overall rating as SUM( a_f*func(a_x*x + b_x) + b_f)
-    repo_ops = {
-            'forks_count': {'func':np.abs, 'a_x':1, 'a_f':2, 'b_x':0, 'b_f':0},
-            'stargazers_count': {'func':np.abs, 'a_x':1, 'a_f':1, 'b_x':0, 'b_f':0},
-            'contributions': {'func':np.log10, 'a_x':1, 'a_f':1, 'b_x':1, 'b_f':0}
-    }
-    repo_details['repo_rating'] = repo_details.apply(lambda x: apply_row_ops(x,repo_ops), axis=1)
-    owner_frac = 0.25
-    user_contrib = 0.01*repo_details['user_contrib_pct'] * (1.25 - owner_frac*repo_details['isowner'])
-    repo_details['user_rating'] = repo_details['repo_rating'] * user_contrib
+    repo_rating = apply_column_ops(repo_details, repo_ops)
+    user_contrib = 0.01*repo_details['user_contrib_pct'].values * \
+                   (1.25 - owner_frac*repo_details['isowner'].values)
     # convert to int
-    repo_details['repo_rating'] = repo_details['repo_rating'].astype(int)
-    repo_details['user_rating'] = repo_details['user_rating'].astype(int)
-    # derive overall rating
-    overall_rating = pd.pivot_table(repo_details, index='language', values='user_rating',
-                                    aggfunc=sum, margins=True,
-                                    margins_name='github_overall_rating').to_frame()
+    repo_details['repo_rating'] = repo_rating.astype(int)
+    repo_details['user_rating'] = (repo_rating * user_contrib).astype(int)
+    return repo_details
+
+
+def build_overall_rating(language_ratings, user):
+    '''Tabulate user id details, overall rating and expertise (language) ratings
+    from the series of user ratings summed by language
+    '''
+    overall_rating = language_ratings.to_frame(name='value')
+    overall_rating.loc['github_overall_rating', 'value'] = language_ratings.sum()
+    overall_rating['value'] = overall_rating['value'].astype(int)
     overall_rating.index.name = 'field'
-    overall_rating = overall_rating.rename(columns={'user_rating':'value'})
     overall_rating['field_type'] = 'github_expertise_ratings'
     overall_rating.loc['github_overall_rating', 'field_type'] = 'github_overall_rating'
     # add user details
@@ -170,69 +360,149 @@ def get_overall_rating(repo_details, user):
     user_ds = pd.Series(user_details, name='value').to_frame()
     user_ds.index.name = 'field'
     user_ds['field_type'] = 'github_id_details'
-    overall_rating = user_ds.append(overall_rating.sort_values(by='value', ascending=False))
+    overall_rating = pd.concat([user_ds, overall_rating.sort_values(by='value', ascending=False)])
     overall_rating = overall_rating.set_index(['field_type', overall_rating.index])
+    return overall_rating
+
+
+@tracing.traced('github.rating')
+def get_overall_rating(repo_details, user):
+    '''Get overall rating based on all details
+    '''
+    repo_details = rate_repos(repo_details)
+    # derive overall rating
+    language_ratings = repo_details.groupby('language')['user_rating'].sum()
+    overall_rating = build_overall_rating(language_ratings, user)
     # all details
     all_details = repo_details
     return overall_rating, all_details
 
 
-def get_github_profiles(matching_users, search_string):
-    '''Get all details for matching users and save as excel file
+@tracing.traced('github.rating')
+def get_overall_ratings(users_repo_details, repo_ops=REPO_OPS, owner_frac=OWNER_FRAC):
+    '''Get overall ratings for a list of (user, repo_details) in a single pass:
+    the repos of all users are rated together and summed by (user, language).
+    Returns list of (overall_rating, all_details) in the same order.
+    '''
+    if len(users_repo_details) == 0:
+        return []
+    all_repos = pd.concat([repo_details for user, repo_details in users_repo_details],
+                          axis=0, ignore_index=True)
+    all_repos = rate_repos(all_repos, repo_ops, owner_frac)
+    # sum of user ratings by (user, language) for all users at once
+    user_language_ratings = all_repos.groupby(['user_login','language'])['user_rating'].sum()
+    ratings = []
+    start = 0
+    for user, repo_details in users_repo_details:
+        # split the rated repos back per user
+        all_details = all_repos.iloc[start:start + repo_details.shape[0]].reset_index(drop=True)
+        start += repo_details.shape[0]
+        try:
+            language_ratings = user_language_ratings.loc[user.login]
+        except KeyError:
+            language_ratings = pd.Series(dtype=int)
+        language_ratings.index.name = 'language'
+        ratings.append((build_overall_rating(language_ratings, user), all_details))
+    return ratings
+
+
+def get_github_profiles(matching_users, search_string, n_workers=REPO_WORKERS, keep_raw=True,
+                        engine=KEYWORDS_ENGINE, graphql=None, exact=False, lean=False, store=None,
+                        prune_forks=False):
+    '''Get all details for matching users and save them to store (result_store.ResultStore),
+    fetching up to n_workers repos of a user concurrently,
+    keeping all raw repo json fields only if keep_raw,
+    extracting readme keywords with engine ('regex' or 'nltk'),
+    fetching repos through the GraphQL API if graphql (github_graphql.GithubGraphql) is given,
+    fetching contributors and readme of every repo if exact, not only of the ones that can
+    add to the ratings, skipping forks never pushed to if prune_forks.
+    If lean, only the overall ratings are fetched, stored and returned: no readmes,
+    no repo details kept.
     '''
-    # fields to output to excel file
-    fields = ['user_name', 'user_login', 'user_email', 'full_name', 'owner',
-              'html_url', 'language', 'updated_at', 'fork', 'forks_count', 'stargazers_count',
-              'contributions', 'user_contrib_pct','readme_keywords','repo_rating','user_rating']
     n_matches = len(matching_users)
     search_term = search_string.replace('@','[at]').replace(' ','_')
     users_dict = {}
+    users_repo_details = []
     # exit if there are no matches
     if n_matches == 0:
         print("Found 0 Github users matching '{}'".format(search_string))
         sys.exit(0)
-    # get details of all the matching users, parse the details to dataframe, write it to excel file
+    # get details of all the matching users, parse the details to dataframe, append it to the store
     else:
         print("Found {} Github users matching '{}'.\nFetching ...".format(n_matches,search_string))
         # for each user get all the user repos and parse info to dataframe
         for i,user in enumerate(matching_users):
             print("\tGetting details for '{}' ...".format(user.name))
-            repo_details = parse_user_details(user)
+            repo_details = parse_user_details(user, n_workers=n_workers, keep_raw=keep_raw,
+                                              engine=engine, graphql=graphql, exact=exact,
+                                              lean=lean, prune_forks=prune_forks)
             # check if there are no repos
             if repo_details.shape[0] == 0:
                 print('\tNo repos for {}, nothing to save.'.format(user.login))
                 continue
-            else:
-                # get overall ratings
-                overall_rating, all_details = get_overall_rating(repo_details, user)
-                 # write dataframe to excel file
-                file_name = '{}_{}_github.xlsx'.format(search_term, str(i+1))
-                file_path = os.path.join('github_output', file_name)
-                excel_writer = pd.ExcelWriter(file_path)
-                overall_rating.to_excel(excel_writer, sheet_name='overall_rating')
-                all_details[fields].to_excel(excel_writer, sheet_name='main_details')
-                all_details.to_excel(excel_writer, sheet_name='all_details')
-                excel_writer.save()
-                print('\tDetails saved to {}'.format(file_name))
-                users_dict[user.email] = {
-                        'login': user.login,
-                        'all_details':all_details,
-                        'overall_rating':overall_rating
-                }
+            users_repo_details.append((i, user, repo_details))
+        # get overall ratings of all users in a single pass
+        overall_ratings = get_overall_ratings([(user, repo_details)
+                                               for i, user, repo_details in users_repo_details])
+        for (i, user, _), (overall_rating, all_details) in zip(users_repo_details, overall_ratings):
+            if store is not None:
+                # one part per user, named like the excel files it is exported to
+                key = '{}_{}'.format(search_term, str(i+1))
+                store.append('github', 'ratings', key, overall_rating)
+                if not lean:
+                    store.append('github', 'repos', key, all_details)
+                print('\tDetails of {} saved to {}'.format(
+                        user.login, os.path.dirname(store.table_dir('github', 'ratings'))))
+            if lean:
+                users_dict[user.email] = {'login': user.login, 'overall_rating': overall_rating}
+                continue
+            users_dict[user.email] = {
+                    'login': user.login,
+                    'all_details':all_details,
+                    'overall_rating':overall_rating
+            }
     return users_dict
 
 
-def init_github_object(auth_token=None):
+@tracing.traced('github.excel')
+def export_excel(store, out_dir='github_output'):
+    '''Write an excel file per user (overall_rating, main_details and all_details sheets)
+    from the Github results of store
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    for key in store.keys('github', 'ratings'):
+        overall_rating = store.read('github', 'ratings', key).drop(columns='key')
+        overall_rating = overall_rating.set_index(['field_type', 'field'])
+        all_details = store.read('github', 'repos', key)
+        all_details = all_details.drop(columns=['key', 'index'], errors='ignore')
+        file_name = '{}_github.xlsx'.format(key)
+        with pd.ExcelWriter(os.path.join(out_dir, file_name)) as excel_writer:
+            overall_rating.to_excel(excel_writer, sheet_name='overall_rating')
+            # lean runs keep no repo details
+            if not all_details.empty:
+                all_details.reindex(columns=EXCEL_FIELDS).to_excel(excel_writer,
+                                                                  sheet_name='main_details')
+                all_details.to_excel(excel_writer, sheet_name='all_details')
+        print('Details exported to {}'.format(file_name))
+
+
+def init_github_object(auth_token=None, cache=None, policy=None):
     '''Get authentication header using auth token in auth_file.
-    Returns auth_header for GET requests
+    Returns auth_header for GET requests.
+    If cache (http_cache.ResponseCache) is given, responses are cached and revalidated.
+    Requests are paced and rotated across the pool of tokens in AUTH_TOKENS (github_auth.py),
+    and sent with the timeouts, retries and circuit breaker of policy
+    (resilience.RequestPolicy, default one if None).
     '''
+    auth_tokens = [auth_token]
     # if auth token is not provided as an argv
     if auth_token == None:
         # check if auth token file exists, get token if it does
         try:
             import github_auth
             print("\nReading auth_token from github_auth.py\n")
-            auth_token = github_auth.AUTH_TOKEN
+            auth_tokens = list(getattr(github_auth, 'AUTH_TOKENS', [])) or [github_auth.AUTH_TOKEN]
+            auth_token = auth_tokens[0]
         # proceed without auth if there is no auth token file
         except ImportError:
             print("\n", '''Authentication token not provided; Can't find github_auth.py;
@@ -240,17 +510,56 @@ def init_github_object(auth_token=None):
             print("Rate limit without authentication is 60 requests/hour")
             print("Store github AUTH_TOKEN in github_auth.py to avoid rate limitation")
             auth_token == None
-        # initialize github object
-    g = Github(login_or_token=auth_token, timeout=60)
+    # route all requests through the response cache, the rate limit governor
+    # and the retry / timeout policy
+    governor = rate_limit.github_governor(auth_tokens)
+    policy = policy if policy is not None else resilience.RequestPolicy()
+    adapter = api_session.make_adapter(cache=cache, governor=governor, policy=policy)
+    api_session.install_github_session(api_session.make_session(adapter))
+    # initialize github object, the policy sets the timeouts of each attempt
+    from github import Github
+    g = Github(login_or_token=auth_token, timeout=policy.read_timeout)
     return g
 
 
-def find_matching_users(g, search_string, auth_token=None):
-    '''Get users matching the search_string
+def init_graphql_client(endpoint=None):
+    '''GraphQL client that shares the session (cache, rate limit governor, tokens)
+    set up by init_github_object. Requires an auth token.
+    '''
+    endpoint = endpoint or github_graphql.GRAPHQL_ENDPOINT
+    return github_graphql.GithubGraphql(api_session.GithubHTTPSConnection.shared_session,
+                                        endpoint=endpoint)
+
+
+def match_confidence(user, search_string):
+    '''Confidence that user is the one searched for: exact email, login or name match
+    '''
+    search_string = user_search.normalize(search_string)
+    if user_search.normalize(user.login) == search_string:
+        return user_search.MATCH_LOGIN
+    # email and name aren't part of search results, reading them fetches the user
+    if '@' in search_string:
+        if user_search.normalize(user.email) == search_string:
+            return user_search.MATCH_EMAIL
+    elif user_search.normalize(user.name) == search_string:
+        return user_search.MATCH_NAME
+    return user_search.MATCH_NONE
+
+
+@tracing.traced('github.search')
+def find_matching_users(g, search_string, auth_token=None, top_k=None,
+                        min_confidence=user_search.MATCH_NAME):
+    '''Get users matching the search_string.
+    If top_k is given, only up to top_k users with an exact email/login/name match
+    (min_confidence) are returned, best first, without paging through all search results.
     '''
     # find all users matchin the search string
     search_result = g.search_users(search_string, sort='repositories' ,order='desc')
-    matching_users = list(search_result)
+    if top_k is None:
+        return list(search_result)
+    matching_users = user_search.top_k_matches(
+            search_result, lambda user: match_confidence(user, search_string), top_k,
+            min_confidence=min_confidence)
     return matching_users
 
 
@@ -263,12 +572,71 @@ if __name__ == '__main__':
                         help="substring to search for in users' name/email/login fields")
     parser.add_argument("-a", dest="auth_token", type=str, nargs="?",
                         help="github authentication token (to avoid rate limitation)")
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true",
+                        help="don't use the on-disk response, readme keyword and contributor caches")
+    parser.add_argument("-w", dest="n_workers", type=int, default=REPO_WORKERS,
+                        help="number of repos to fetch concurrently (default {})".format(REPO_WORKERS))
+    parser.add_argument("--no-raw", dest="no_raw", action="store_true",
+                        help="keep only the repo fields used for ratings, not the full raw json")
+    parser.add_argument("-k", dest="engine", choices=keywords.ENGINES, default=KEYWORDS_ENGINE,
+                        help="readme keyword extraction engine (default {})".format(KEYWORDS_ENGINE))
+    parser.add_argument("--top", dest="top_k", type=int,
+                        help="get only the top_k users whose email, login or name is an exact match")
+    parser.add_argument("--exact", dest="exact", action="store_true",
+                        help="fetch contributors and readme of every repo, "
+                             "don't prune repos that can't add to the ratings")
+    parser.add_argument("--prune-forks", dest="prune_forks", action="store_true",
+                        help="also skip forks never pushed to, assuming they hold none of the "
+                             "user's commits (fewer requests, may lower ratings)")
+    parser.add_argument("--lean", dest="lean", action="store_true",
+                        help="only get the ratings: skip readmes and repo details, print ratings")
+    parser.add_argument("-o", dest="results_dir", type=str, default=result_store.RESULTS_DIR,
+                        help="directory of the parquet result store (default '{}')".format(
+                                result_store.RESULTS_DIR))
+    parser.add_argument("--excel", dest="excel", action="store_true",
+                        help="export the results to an excel file per user in github_output")
+    parser.add_argument("--graphql", dest="graphql", action="store_true",
+                        help="fetch repos, contributions and readmes with the GraphQL API "
+                             "(needs an auth token, keeps only the repo fields used for ratings)")
+    parser.add_argument("--graphql-endpoint", dest="graphql_endpoint", type=str,
+                        help="GraphQL endpoint (default {})".format(
+                                "https://api.github.com/graphql"))
+    parser.add_argument("--incremental", dest="snapshots_file", type=str, nargs="?",
+                        const=repo_snapshots.REPO_SNAPSHOTS_FILE,
+                        help="only fetch Github repos new or changed since the last run, keeping "
+                             "snapshots of each user's parsed repos in SNAPSHOTS_FILE "
+                             "(default '{}')".format(repo_snapshots.REPO_SNAPSHOTS_FILE))
+    resilience.add_arguments(parser)
+    tracing.add_arguments(parser)
     args = parser.parse_args()
+    tracing.start(args)
     search_string = args.search_string
+    tracing.set_applicant(search_string)
     auth_token = args.auth_token
+    cache = None if args.no_cache else http_cache.ResponseCache()
+    if not args.no_cache:
+        # keep readme keywords and contributor counts across runs
+        keywords.install_cache(keywords.KeywordCache(keywords.KEYWORDS_CACHE_FILE))
+        contributor_cache.install_cache(
+                contributor_cache.ContributorCache(contributor_cache.CONTRIBUTORS_CACHE_FILE))
+    if args.snapshots_file:
+        # re-rate users from the repos parsed in earlier runs, fetching only changed repos
+        repo_snapshots.install_snapshots(repo_snapshots.RepoSnapshots(args.snapshots_file))
     # init github object
-    g = init_github_object(auth_token=auth_token)
+    g = init_github_object(auth_token=auth_token, cache=cache,
+                           policy=resilience.policy_from_args(args))
+    graphql = init_graphql_client(args.graphql_endpoint) if args.graphql else None
     # find matching users
-    matching_users = find_matching_users(g, search_string, auth_token)
-    # get all details for mathing users and save specified fields to excel sheet
-    users_dicts = get_github_profiles(matching_users, search_string)
+    matching_users = find_matching_users(g, search_string, auth_token, top_k=args.top_k)
+    # get all details for mathing users and save them to the result store
+    store = result_store.ResultStore(args.results_dir)
+    users_dicts = get_github_profiles(matching_users, search_string, n_workers=args.n_workers,
+                                      keep_raw=not args.no_raw, engine=args.engine,
+                                      graphql=graphql, exact=args.exact, lean=args.lean,
+                                      prune_forks=args.prune_forks,
+                                      store=store)
+    if args.excel:
+        export_excel(store)
+    if args.lean:
+        for user_email, user_dict in users_dicts.items():
+            print('\n{}\n'.format(user_dict['overall_rating']))
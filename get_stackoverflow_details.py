@@ -10,29 +10,65 @@ import json
 import sys
 import os
 import argparse
+import threading
 
-import stackexchange
-import nltk
-import pandas as pd
-import numpy as np
+import user_search
+import result_store
+import resilience
+import tracing
+from lazy_import import LazyModule
 
-# add nltk_data folder to the list of NLTK library paths
-nltk.data.path.insert(0,'nltk_data')
-# set of stopwords
-STOPWORDS = set(nltk.corpus.stopwords.words('english'))
+# heavy dependencies are imported on first use
+stackexchange = LazyModule('stackexchange')
+pd = LazyModule('pandas')
+requests = LazyModule('requests')
+np = LazyModule('numpy')
+api_session = LazyModule('api_session')
+http_cache = LazyModule('http_cache')
+rate_limit = LazyModule('rate_limit')
+stackexchange_async = LazyModule('stackexchange_async')
+# user fields used for ratings and excel output, nested fields flattened as 'a.b'
+USER_FIELDS = ['display_name', 'user_id', 'age', 'location', 'link', 'accept_rate', 'reputation',
+               'badge_counts.bronze', 'badge_counts.silver', 'badge_counts.gold',
+               'creation_date', 'last_access_date', 'last_modified_date']
+# max ids in one vectorized /users/{ids} request, and max page size (API limits)
+IDS_PER_REQUEST = 100
+MAX_PAGESIZE = 100
+# top answer tag counts used for tag ratings
+TAG_FIELDS = ['tag_name', 'answer_count', 'answer_score', 'question_count', 'question_score']
+# response wrapper fields py-stackexchange and the rate limit governor read
+WRAPPER_FIELDS = ['.backoff', '.error_id', '.error_message', '.error_name', '.has_more', '.items',
+                  '.quota_max', '.quota_remaining']
+# server-side filters returning only the fields used for ratings and excel output
+# ('age' is no longer served by the API, it is left empty)
+USER_FILTER_FIELDS = WRAPPER_FIELDS + \
+                     ['user.' + field for field in USER_FIELDS if '.' not in field and field != 'age'] + \
+                     ['user.badge_counts', 'badge_count.bronze', 'badge_count.silver', 'badge_count.gold']
+TAG_FILTER_FIELDS = WRAPPER_FIELDS + ['top_tag.' + field for field in TAG_FIELDS]
+# {(api root, fields): filter id} of the filters created so far
+_filters = {}
+_filters_lock = threading.Lock()
 
 
-def init_stackoverflow_object(auth_key=None):
+def init_stackoverflow_object(auth_key=None, cache=None, use_async=False, policy=None):
     '''Get authentication header using authentication key provided
     either as part of command line or stored in stackoverflow_auth.py.
+    If cache (http_cache.ResponseCache) is given, responses are cached.
+    Requests are paced and rotated across the pool of keys in AUTH_KEYS (stackoverflow_auth.py),
+    and sent with the timeouts, retries and circuit breaker of policy
+    (resilience.RequestPolicy, default one if None).
+    If use_async, requests are sent by the asyncio client (stackexchange_async, needs aiohttp),
+    without the response cache.
     '''
+    auth_keys = [auth_key]
     # if auth token is not provided as an argv
     if auth_key == None:
         # check if auth token file exists, get token if it does
         try:
             import stackoverflow_auth
             print("\nReading auth_token from stackoverflow_auth.py\n")
-            auth_key = stackoverflow_auth.AUTH_KEY
+            auth_keys = list(getattr(stackoverflow_auth, 'AUTH_KEYS', [])) or [stackoverflow_auth.AUTH_KEY]
+            auth_key = auth_keys[0]
         # proceed without auth if there is no auth token file
         except ImportError:
             print("\n", '''Authentication token not provided; Can't find stackoverflow_auth.py;
@@ -40,72 +76,119 @@ def init_stackoverflow_object(auth_key=None):
             print("Rate limit without authentication is 300 requests/day")
             print("Store stackoverflow AUTH_KEY in stackoverflow_auth.py to avoid rate limitation")
             auth_key == None
-        # initialize stackoverflow object
-    so = stackexchange.Site(stackexchange.StackOverflow, auth_key)
+    # initialize stackoverflow object, sending requests through the response cache,
+    # paced by the rate limit governor (30 requests / 5 sec, backoff, quota per key)
+    governor = rate_limit.stackoverflow_governor(auth_keys)
+    policy = policy if policy is not None else resilience.RequestPolicy()
+    if use_async:
+        return stackexchange_async.AsyncStackExchangeSite(stackexchange.StackOverflow, auth_key,
+                                                          governor=governor, policy=policy, cache=0)
+    session = api_session.make_session(api_session.make_adapter(
+            cache=cache, policy=policy, stackexchange_governor=governor))
+    so = api_session.StackExchangeSite(stackexchange.StackOverflow, auth_key, session=session,
+                                       cache=0)
     return so
 
 
+def get_filter(so, fields):
+    '''Id of a server-side filter (/filters/create) returning only fields, created once
+    per process. None (the default filter) if it can't be created, e.g. after an error
+    response, a connection error or timeout, or with the API's circuit open.
+    '''
+    key = (getattr(so, 'api_root', None), tuple(fields))
+    with _filters_lock:
+        if key not in _filters:
+            params = {'include': ';'.join(fields), 'base': 'none', 'unsafe': 'false'}
+            try:
+                _filters[key] = so._request('filters/create', params)['items'][0]['filter']
+            except (stackexchange.StackExchangeError, requests.exceptions.RequestException,
+                    resilience.CircuitOpenError, KeyError, IndexError) as err:
+                print('Could not create a response filter, using the default one: {!r}'.format(err))
+                _filters[key] = None
+        return _filters[key]
+
+
 def convert_datetime_cols(df_all, date_cols):
     ''' Convert datetime string to datetime objects
     '''
     for col in date_cols:
-        df_all[col] = pd.to_datetime(df_all[col], unit='s', infer_datetime_format=True)
+        df_all[col] = pd.to_datetime(df_all[col], unit='s')
     return df_all
 
 
-def get_top_answers_tags(user):
-    '''Get top answer tags and tag details
+# tag rating as SUM(weight * count) of the tag's counts
+TAG_WEIGHTS = {'answer_count': 1, 'answer_score': 1, 'question_count': 1, 'question_score': 1}
+
+
+def tags_frame(tag_rows, tag_weights=TAG_WEIGHTS):
+    '''Frame of top answer tags (tag json rows) with their weighted rating as 'value',
+    sorted by rating
     '''
-    print('\tGetting tags details ...')
-    tags_dfs = []
-    cols = ['tag_name', 'answer_count', 'answer_score', 'question_count', 'question_score']
-    # top answer tags
-    top_tags = user.top_answer_tags.fetch()
-    for tag in top_tags:
-        df = pd.io.json.json_normalize(tag.json)
-        tags_dfs.append(df)
-    try:
-        df_all = pd.concat(tags_dfs, axis=0)[cols]
-    except ValueError:
-        df_all = pd.DataFrame(columns=cols)
-    # row totals
-    df_all['value'] = df_all.sum(axis=1).astype(int)
+    # build the dataframe of all the tags at once, keeping only the tag fields
+    df_all = pd.DataFrame.from_records(tag_rows, columns=TAG_FIELDS)
+    # weighted row totals
+    df_all['value'] = sum(weight*df_all[col] for col, weight in tag_weights.items()).astype(int)
     df_tags = df_all
     # return df sorted by row totals
     return df_tags.sort_values(by = 'value', ascending=False)
 
 
-def parse_user_details(user):
-    '''For given user get all the user's details and parse the information to a dataframe.
+@tracing.traced('stackoverflow.tags')
+def get_top_answers_tags(user, tag_weights=TAG_WEIGHTS):
+    '''Get top answer tags and tag details
     '''
-    print('\tGetting user details ...')
-    # get all the user details and parse info to dataframe
-    user_json = user.json
-    user_df = pd.io.json.json_normalize(user_json)
-    drop_cols = [col for col in user_df.columns if '_params_' in col]
-    user_df.drop(drop_cols, axis=1, inplace=True)
-    # get tag details
-    tags_df = get_top_answers_tags(user)
+    print('\tGetting tags details ...')
+    # top answer tags, only the tag fields in the response
+    tag_filter = get_filter(user.site, TAG_FILTER_FIELDS)
+    top_tags = user.top_answer_tags.fetch(**({'filter': tag_filter} if tag_filter else {}))
+    return tags_frame([tag.json for tag in top_tags], tag_weights)
+
+
+def user_frame(user_json, keep_raw=True):
+    '''(field, value) frame of a user json, nested fields flattened as 'a.b'.
+    If keep_raw is False only USER_FIELDS are kept.
+    '''
+    user_df = pd.json_normalize(user_json)
+    if keep_raw:
+        drop_cols = [col for col in user_df.columns if '_params_' in col]
+        user_df.drop(drop_cols, axis=1, inplace=True)
+    else:
+        user_df = user_df.reindex(columns=USER_FIELDS)
     # convert datetime columns to datetime objects
     date_cols=['creation_date', 'last_access_date', 'last_modified_date']
     for col in date_cols:
         try:
-            user_df[col] = pd.to_datetime(user_df[col], unit='s', infer_datetime_format=True)
+            user_df[col] = pd.to_datetime(user_df[col], unit='s')
         except KeyError:
             continue
     # transpose user_df
     user_df = user_df.T
     user_df.index.name = 'field'
     user_df.rename(columns={0:'value'}, inplace=True)
+    return user_df
+
+
+@tracing.traced('stackoverflow.profile')
+def parse_user_details(user, keep_raw=True):
+    '''For given user get all the user's details and parse the information to a dataframe.
+    If keep_raw is False only USER_FIELDS of the raw user json are kept.
+    '''
+    print('\tGetting user details ...')
+    # get all the user details and parse info to dataframe
+    user_df = user_frame(user.json, keep_raw=keep_raw)
+    # get tag details
+    tags_df = get_top_answers_tags(user)
     # cleanup tags_df
     tags_df = tags_df.set_index('tag_name', drop=True)
     return user_df, tags_df
 
 
 def apply_func_wgt_bias(x, ops):
-    ''' Returns a_f * func( a_x * x + b_x) + b_f
+    ''' Returns a_f * func( a_x * x + b_x) + b_f, func given by name (e.g. 'log10') is a numpy function
     '''
     func = ops.get('func',float)
+    if isinstance(func, str):
+        func = getattr(np, func)
     a_x = ops.get('a_x',1)
     a_f = ops.get('a_f',1)
     b_x = ops.get('b_x',0)
@@ -114,27 +197,33 @@ def apply_func_wgt_bias(x, ops):
     return result
 
 
-def overall_rating(user_df, tags_df):
+# calculate general rating as SUM( a_f*func(a_x*x + b_x) + b_f)
+GENERAL_OPS = {
+    'accept_rate': {'func':'abs', 'a_x':1, 'a_f':0.1, 'b_x':0, 'b_f':0},
+    'badge_counts.bronze': {'func':'abs', 'a_x':1, 'a_f':1, 'b_x':0, 'b_f':0},
+    'badge_counts.silver': {'func':'abs', 'a_x':1, 'a_f':10, 'b_x':0, 'b_f':0},
+    'badge_counts.gold': {'func':'abs', 'a_x':1, 'a_f':100, 'b_x':0, 'b_f':0},
+    'reputation': {'func':'log10', 'a_x':1, 'a_f':100, 'b_x':1, 'b_f':0}
+}
+
+
+@tracing.traced('stackoverflow.rating')
+def overall_rating(user_df, tags_df, general_ops=GENERAL_OPS):
     '''Get a tabulated form for user details, general ratings, overall rating, top tag ratings
     '''
     user_id_fields = ['display_name', 'user_id', 'age', 'location', 'link']
     general_rating_fields = ['accept_rate', 'reputation', 'badge_counts.bronze',
                              'badge_counts.silver', 'badge_counts.gold']
-    ratings_df = user_df.loc[user_id_fields + general_rating_fields].copy()
+    # fields the API no longer serves (age) are left empty
+    ratings_df = user_df.reindex(user_id_fields + general_rating_fields)
     # append user details
     ratings_df.loc[user_id_fields,'field_type'] = 'stackoverflow_id_details'
     # append geneal ratings
     ratings_df.loc[general_rating_fields, 'field_type'] = 'stackoverflow_general_ratings'
     ratings_df['value'] = ratings_df['value'].fillna(0)
-    # calculate overall rating as SUM( a_f*func(a_x*x + b_x) + b_f)
-    ops = {
-        'accept_rate': {'func':np.abs, 'a_x':1, 'a_f':0.1, 'b_x':0, 'b_f':0},
-        'badge_counts.bronze': {'func':np.abs, 'a_x':1, 'a_f':1, 'b_x':0, 'b_f':0},
-        'badge_counts.silver': {'func':np.abs, 'a_x':1, 'a_f':10, 'b_x':0, 'b_f':0},
-        'badge_counts.gold': {'func':np.abs, 'a_x':1, 'a_f':100, 'b_x':0, 'b_f':0},
-        'reputation': {'func':np.log10, 'a_x':1, 'a_f':100, 'b_x':1, 'b_f':0}
-    }
-    gen_ratings = [apply_func_wgt_bias(ratings_df.loc[key,'value'], opr) for key,opr in ops.items()]
+    # calculate overall rating as general rating plus tag ratings
+    gen_ratings = [apply_func_wgt_bias(ratings_df.loc[key,'value'], opr)
+                   for key,opr in general_ops.items()]
     overall_rating = 1*sum(gen_ratings) + 1*tags_df['value'].sum()
     # append overall rating
     ratings_df.loc['stackoverflow_overall_rating', 'value'] = int(overall_rating)
@@ -142,15 +231,18 @@ def overall_rating(user_df, tags_df):
     # append tags
     top_tags_df = tags_df['value'].to_frame()
     top_tags_df['field_type'] = 'stackoverflow_expertise_ratings'
-    ratings_df = ratings_df.append(top_tags_df)
+    ratings_df = pd.concat([ratings_df, top_tags_df])
     ratings_df.index.name = 'field'
     ratings_df = ratings_df.set_index(['field_type',ratings_df.index])
     return ratings_df
 
 
-def get_stackoverflow_profiles(matching_users, search_kw):
-    '''Get all details for matching users and save as excel file
+def get_stackoverflow_profiles(matching_users, search_kw, keep_raw=True, lean=False, store=None):
+    '''Get all details for matching users and save them to store (result_store.ResultStore),
+    keeping all raw user json fields only if keep_raw.
+    If lean, only the ratings are stored and returned, no user/tag details kept.
     '''
+    keep_raw = keep_raw and not lean
     n_matches = len(matching_users)
     search_term = str(list(search_kw.values())[0])
     users_dict = {}
@@ -158,24 +250,27 @@ def get_stackoverflow_profiles(matching_users, search_kw):
     if n_matches == 0:
         print("Found 0 Stackoverflow users matching '{}'".format(search_term))
         sys.exit(0)
-    # get details of all the matching users, parse the details to dataframe, write it to excel file
+    # get details of all the matching users, parse the details to dataframe, append it to the store
     else:
         print("Found {} Stackoverflow user(s) matching '{}'.\nFetching ...".format(n_matches,search_term))
         for i,user in enumerate(matching_users):
             # get all repos for the user and output to a dataframe
             print("\tGetting user_df and tags_df for '{}' ...".format(user.display_name))
-            user_df, tags_df = parse_user_details(user)
+            user_df, tags_df = parse_user_details(user, keep_raw=keep_raw)
             # get overall score
             ratings_df = overall_rating(user_df, tags_df)
-            # write dataframes to excel file
-            file_name = '{}_{}_stackoverflow.xlsx'.format(search_term.replace(' ','_'), str(i+1))
-            file_path = os.path.join('stackoverflow_output', file_name)
-            excel_writer = pd.ExcelWriter(file_path)
-            ratings_df.to_excel(excel_writer, sheet_name='overall_ratings')
-            user_df.to_excel(excel_writer, sheet_name='user_details', header=False)
-            tags_df.to_excel(excel_writer, sheet_name='top_answers_tags')
-            excel_writer.save()
-            print('\tDetails saved to {}'.format(file_name))
+            if store is not None:
+                # one part per user, named like the excel files it is exported to
+                key = '{}_{}'.format(search_term.replace(' ','_'), str(i+1))
+                store.append('stackoverflow', 'ratings', key, ratings_df)
+                if not lean:
+                    store.append('stackoverflow', 'user', key, user_df)
+                    store.append('stackoverflow', 'tags', key, tags_df)
+                print('\tDetails saved to {}'.format(
+                        os.path.dirname(store.table_dir('stackoverflow', 'ratings'))))
+            if lean:
+                users_dict[user.display_name] = {'ratings_df': ratings_df}
+                continue
             users_dict[user.display_name] = {
                 'user_df': user_df,
                 'tags_df': tags_df,
@@ -184,14 +279,82 @@ def get_stackoverflow_profiles(matching_users, search_kw):
     return users_dict
 
 
-def find_matching_users(so, search_kw, auth_key=None):
-    ''' find matching users
+def match_confidence(user, search_kw):
+    '''Confidence that user is the one searched for: exact display name match
+    '''
+    if user_search.normalize(user.display_name) == user_search.normalize(search_kw.get('inname')):
+        return user_search.MATCH_NAME
+    return user_search.MATCH_NONE
+
+
+@tracing.traced('stackoverflow.excel')
+def export_excel(store, out_dir='stackoverflow_output'):
+    '''Write an excel file per user (overall_ratings, user_details and top_answers_tags sheets)
+    from the Stackoverflow results of store
     '''
+    os.makedirs(out_dir, exist_ok=True)
+    for key in store.keys('stackoverflow', 'ratings'):
+        ratings_df = store.read('stackoverflow', 'ratings', key).drop(columns='key')
+        ratings_df = ratings_df.set_index(['field_type', 'field'])
+        user_df = store.read('stackoverflow', 'user', key)
+        tags_df = store.read('stackoverflow', 'tags', key)
+        file_name = '{}_stackoverflow.xlsx'.format(key)
+        with pd.ExcelWriter(os.path.join(out_dir, file_name)) as excel_writer:
+            ratings_df.to_excel(excel_writer, sheet_name='overall_ratings')
+            # lean runs keep no user and tag details
+            if not user_df.empty:
+                user_df = user_df.drop(columns='key').set_index('field')
+                user_df.to_excel(excel_writer, sheet_name='user_details', header=False)
+            if not tags_df.empty:
+                tags_df = tags_df.drop(columns='key').set_index('tag_name')
+                tags_df.to_excel(excel_writer, sheet_name='top_answers_tags')
+        print('Details exported to {}'.format(file_name))
+
+
+def user_kw(so, minimal=False):
+    '''Request kw for users: only the USER_FIELDS in the response if minimal
+    '''
+    user_filter = get_filter(so, USER_FILTER_FIELDS) if minimal else None
+    return {'filter': user_filter} if user_filter else {}
+
+
+@tracing.traced('stackoverflow.search')
+def find_matching_users(so, search_kw, auth_key=None, top_k=None,
+                        min_confidence=user_search.MATCH_NONE, minimal=False):
+    ''' find matching users.
+    If top_k is given, up to top_k users are returned with exact display name matches first,
+    looking at the first page (user_search.MAX_SEARCH_RESULTS users) of results only.
+    If minimal, users carry only the USER_FIELDS (not enough for keep_raw).
+    '''
+    kw = dict(search_kw, **user_kw(so, minimal))
+    # all results are paged through in the fewest pages, a top_k search looks at one page
+    kw.setdefault('pagesize', MAX_PAGESIZE if top_k is None else user_search.MAX_SEARCH_RESULTS)
     # find all users matching the search criteria
-    matching_users = so.users(**search_kw)
+    matching_users = so.users(**kw)
+    if top_k is None:
+        return matching_users
+    # stop at the first top_k exact matches, no further page is fetched after MAX_SEARCH_RESULTS
+    matching_users = user_search.top_k_matches(
+            matching_users, lambda user: match_confidence(user, search_kw), top_k,
+            min_confidence=min_confidence, stop_confidence=user_search.MATCH_NAME)
     return matching_users
 
 
+@tracing.traced('stackoverflow.users')
+def get_users_by_ids(so, user_ids, minimal=False):
+    '''{user_id: user} of the users with user_ids, IDS_PER_REQUEST ids per request,
+    with only the USER_FIELDS if minimal
+    '''
+    users = {}
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), IDS_PER_REQUEST):
+        batch_ids = user_ids[start:start + IDS_PER_REQUEST]
+        # one page holds the whole batch
+        for user in so.users(batch_ids, pagesize=IDS_PER_REQUEST, **user_kw(so, minimal)):
+            users[user.id] = user
+    return users
+
+
 if __name__ == '__main__':
     # get search_string, user_id and auth_key from command line arguments
     description = "Script to get job candidate's stackoverflow profile"
@@ -204,9 +367,28 @@ if __name__ == '__main__':
                         help="string to search for in users' display-name fields")
     parser.add_argument("-a", dest="auth_key", type=str, nargs="?",
                         help="stackoverflow authentication key (to avoid rate limits)")
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true",
+                        help="don't use the on-disk response cache")
+    parser.add_argument("--top", dest="top_k", type=int,
+                        help="get only the top_k users, exact display name matches first")
+    parser.add_argument("--lean", dest="lean", action="store_true",
+                        help="only get the ratings: skip user and tag details, print ratings")
+    parser.add_argument("-o", dest="results_dir", type=str, default=result_store.RESULTS_DIR,
+                        help="directory of the parquet result store (default '{}')".format(
+                                result_store.RESULTS_DIR))
+    parser.add_argument("--excel", dest="excel", action="store_true",
+                        help="export the results to an excel file per user in stackoverflow_output")
+    parser.add_argument("--no-raw", dest="no_raw", action="store_true",
+                        help="keep only the user fields used for ratings, not the full raw json")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="send requests with the asyncio client (needs aiohttp, no response cache)")
+    resilience.add_arguments(parser)
+    tracing.add_arguments(parser)
     args = parser.parse_args()
+    tracing.start(args)
     user_id = args.user_id
     search_string = args.search_string
+    tracing.set_applicant(search_string if user_id is None else user_id)
     auth_key = args.auth_key
     # build search criterial kw
     if user_id is not None:
@@ -215,9 +397,19 @@ if __name__ == '__main__':
         search_kw = {'inname':search_string}
     else:
         parser.error('Requires either USER_ID or SEARCH_STRING')
+    cache = None if args.no_cache else http_cache.ResponseCache()
     # init stackoverflow object
-    so = init_stackoverflow_object(auth_key = auth_key)
+    so = init_stackoverflow_object(auth_key = auth_key, cache=cache, use_async=args.use_async,
+                                   policy=resilience.policy_from_args(args))
     # get matching users
-    matching_users = find_matching_users(so, search_kw, auth_key)
-    # get all details for matching users and save as tabular form to excel sheet
-    users_dict = get_stackoverflow_profiles(matching_users, search_kw)
+    matching_users = find_matching_users(so, search_kw, auth_key, top_k=args.top_k,
+                                         minimal=args.no_raw or args.lean)
+    # get all details for matching users and save them to the result store
+    store = result_store.ResultStore(args.results_dir)
+    users_dict = get_stackoverflow_profiles(matching_users, search_kw, keep_raw=not args.no_raw,
+                                            lean=args.lean, store=store)
+    if args.excel:
+        export_excel(store)
+    if args.lean:
+        for display_name, user_dict in users_dict.items():
+            print('\n{}\n'.format(user_dict['ratings_df']))
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Github GraphQL backend for repo details.
+
+Fetches a user's repositories with stars, forks, language, owner, readme text
+and the user's commit contributions in a few paginated queries, instead of the
+three or more REST calls per repo PyGithub makes. Rows have the REPO_FIELDS
+columns of get_github_details plus the contribution and readme columns, so
+the same rating code applies.
+
+Contributions are the commits of the default branch authored by the user out
+of all commits of the default branch, which is what the REST contributors list
+counts (less anonymous commits).
+"""
+
+GRAPHQL_ENDPOINT = 'https://api.github.com/graphql'
+# repos per query, each repo carries readme text and two commit counts
+PAGE_SIZE = 25
+REPO_AFFILIATIONS = ['OWNER', 'COLLABORATOR', 'ORGANIZATION_MEMBER']
+# readme files looked up in the default branch, first one found is used
+README_FILES = ['README.md', 'README.rst', 'README', 'readme.md', 'README.txt', 'README.markdown']
+
+USER_ID_QUERY = '''
+query($login: String!) {
+  user(login: $login) { id }
+}
+'''
+
+REPOS_QUERY_TEMPLATE = '''
+query($login: String!, $userId: ID!, $pageSize: Int!, $cursor: String) {
+  user(login: $login) {
+    repositories(first: $pageSize, after: $cursor, ownerAffiliations: [%(affiliations)s]) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        databaseId name nameWithOwner url description isFork diskUsage
+        forkCount stargazerCount createdAt updatedAt pushedAt
+        owner { login __typename }
+        primaryLanguage { name }
+        issues(states: OPEN) { totalCount }
+        pullRequests(states: OPEN) { totalCount }
+        %(readmes)s
+        defaultBranchRef {
+          target {
+            ... on Commit {
+              history(first: 1) { totalCount }
+              userHistory: history(first: 1, author: {id: $userId}) { totalCount }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+%(fragments)s
+'''
+
+
+def make_repos_query(readmes=True):
+    '''Query for a page of a user's repos, with readme blobs if readmes
+    '''
+    readme_fields = ['readme{}: object(expression: "HEAD:{}") {{ ...readme }}'.format(i, name)
+                     for i, name in enumerate(README_FILES)]
+    return REPOS_QUERY_TEMPLATE % {
+            'affiliations': ', '.join(REPO_AFFILIATIONS),
+            'readmes': '\n        '.join(readme_fields) if readmes else '',
+            'fragments': 'fragment readme on Blob { oid text }' if readmes else ''
+    }
+
+
+REPOS_QUERY = make_repos_query(readmes=True)
+REPOS_QUERY_NO_READMES = make_repos_query(readmes=False)
+
+
+class GraphqlError(Exception):
+    pass
+
+
+def get_path(data, *keys):
+    '''data[k1][k2]..., None if any level is missing or null
+    '''
+    for key in keys:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(key)
+    return data
+
+
+def repo_node_to_row(node):
+    '''Convert a repository node to a repo row with the REST field names
+    '''
+    repo_row = {
+            'id': node['databaseId'],
+            'name': node['name'],
+            'full_name': node['nameWithOwner'],
+            'html_url': node['url'],
+            'description': node['description'],
+            'language': get_path(node, 'primaryLanguage', 'name'),
+            'fork': node['isFork'],
+            'size': node['diskUsage'],
+            'forks_count': node['forkCount'],
+            'stargazers_count': node['stargazerCount'],
+            # REST watchers_count is the number of stargazers
+            'watchers_count': node['stargazerCount'],
+            # REST open_issues_count includes open pull requests
+            'open_issues_count': (get_path(node, 'issues', 'totalCount') or 0) +
+                                 (get_path(node, 'pullRequests', 'totalCount') or 0),
+            'created_at': node['createdAt'],
+            'updated_at': node['updatedAt'],
+            'pushed_at': node['pushedAt'],
+            'owner.login': get_path(node, 'owner', 'login'),
+            'owner.type': get_path(node, 'owner', '__typename'),
+    }
+    # user's share of the commits of the default branch (empty repos have none)
+    target = get_path(node, 'defaultBranchRef', 'target')
+    sum_contribs = get_path(target, 'history', 'totalCount') or 0
+    user_contribs = get_path(target, 'userHistory', 'totalCount') or 0
+    repo_row['user_contrib_pct'] = 100*user_contribs/sum_contribs if sum_contribs else 0
+    repo_row['contributions'] = sum_contribs
+    repo_row['owner'] = repo_row['owner.login']
+    # first readme file that exists, keywords are extracted later from its text
+    readmes = [node.get('readme{}'.format(i)) for i in range(len(README_FILES))]
+    readme = next((blob for blob in readmes if blob), {})
+    repo_row['readme_text'] = readme.get('text') or ''
+    repo_row['readme_sha'] = readme.get('oid')
+    return repo_row
+
+
+class GithubGraphql(object):
+    '''Client for the Github GraphQL API, posting queries through session
+    (which carries the response cache and rate limit governor adapters)
+    '''
+    def __init__(self, session, endpoint=GRAPHQL_ENDPOINT, page_size=PAGE_SIZE, timeout=60):
+        self.session = session
+        self.endpoint = endpoint
+        self.page_size = page_size
+        self.timeout = timeout
+
+    def query(self, query, variables=None):
+        '''Run query, return its data. Raises GraphqlError if there's no data.
+        '''
+        resp = self.session.post(self.endpoint, json={'query': query, 'variables': variables or {}},
+                                 timeout=self.timeout)
+        if resp.status_code == 401:
+            raise GraphqlError('Github GraphQL API requires an authentication token')
+        try:
+            result = resp.json()
+        except ValueError:
+            raise GraphqlError('HTTP {} from {}'.format(resp.status_code, self.endpoint))
+        # errors on some fields come with the data of the rest, only fail without data
+        if result.get('data') is None:
+            messages = [error.get('message', '') for error in result.get('errors', [])]
+            raise GraphqlError('; '.join(messages) or 'HTTP {}'.format(resp.status_code))
+        return result['data']
+
+    def get_user_id(self, login):
+        return get_path(self.query(USER_ID_QUERY, {'login': login}), 'user', 'id')
+
+    def get_repo_rows(self, login, user_id=None, readmes=True):
+        '''Repo rows of all the repos of user login, one query per PAGE_SIZE repos,
+        with empty readmes unless readmes
+        '''
+        query = REPOS_QUERY if readmes else REPOS_QUERY_NO_READMES
+        if user_id is None:
+            user_id = self.get_user_id(login)
+        repo_rows = []
+        cursor = None
+        while True:
+            data = self.query(query, {'login': login, 'userId': user_id,
+                                            'pageSize': self.page_size, 'cursor': cursor})
+            repos = get_path(data, 'user', 'repositories') or {}
+            for node in repos.get('nodes') or []:
+                repo_row = repo_node_to_row(node)
+                print("\t\t{:3.0f}% contribution in '{}' ({})".format(
+                        repo_row['user_contrib_pct'], repo_row['full_name'], repo_row['language']))
+                repo_rows.append(repo_row)
+            if not get_path(repos, 'pageInfo', 'hasNextPage'):
+                return repo_rows
+            cursor = get_path(repos, 'pageInfo', 'endCursor')
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of GET responses from the Github and Stackexchange APIs.
+
+Fresh responses (younger than ttl) are served without a request, stale ones are
+revalidated with If-None-Match / If-Modified-Since. Github doesn't count 304
+responses against the rate limit, so re-rating applicants costs almost no quota.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+CACHE_DIR = 'cache'
+CACHE_FILE = os.path.join(CACHE_DIR, 'http_cache.sqlite')
+# seconds for which a cached response is served without revalidation
+CACHE_TTL = 24*60*60
+# seconds after which a response that hasn't been used is evicted
+CACHE_MAX_AGE = 30*24*60*60
+# max total size of cached response bodies, least recently used are evicted first
+CACHE_MAX_BYTES = 512*1024*1024
+# headers that describe the raw (compressed) body, not the cached one
+DROP_HEADERS = ['content-encoding', 'content-length', 'transfer-encoding']
+# query parameters left out of cache keys: Stackexchange app keys are rotated per request
+KEY_PARAMS = ['key', 'access_token']
+
+
+class ResponseCache(object):
+    '''SQLite store of responses keyed by request method, url and accept header
+    '''
+    def __init__(self, path=CACHE_FILE, ttl=CACHE_TTL, max_age=CACHE_MAX_AGE,
+                 max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.n_puts = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS responses (
+                               key TEXT PRIMARY KEY,
+                               status INTEGER,
+                               headers TEXT,
+                               body BLOB,
+                               size INTEGER,
+                               stored_at REAL,
+                               accessed_at REAL)''')
+        self.db.commit()
+        self.evict()
+
+    def get(self, key):
+        '''Return cached entry as a dict, None if there is no entry for key
+        '''
+        with self.lock:
+            row = self.db.execute('SELECT status, headers, body, stored_at FROM responses '
+                                  'WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+            self.db.commit()
+        status, headers, body, stored_at = row
+        return {'status': status, 'headers': json.loads(headers), 'body': body,
+                'stored_at': stored_at}
+
+    def put(self, key, status, headers, body):
+        '''Store response for key, evicting old entries every 100 stores
+        '''
+        headers = {k:v for k,v in headers.items() if k.lower() not in DROP_HEADERS}
+        now = time.time()
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?,?,?,?,?,?,?)',
+                            (key, status, json.dumps(headers), body, len(body), now, now))
+            self.db.commit()
+            self.n_puts += 1
+        if self.n_puts % 100 == 0:
+            self.evict()
+
+    def touch(self, key):
+        '''Mark entry for key as fresh again, after the server confirmed it (304)
+        '''
+        now = time.time()
+        with self.lock:
+            self.db.execute('UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?',
+                            (now, now, key))
+            self.db.commit()
+
+    def is_fresh(self, entry):
+        return time.time() - entry['stored_at'] < self.ttl
+
+    def evict(self):
+        '''Drop entries unused for max_age, then least recently used ones above max_bytes
+        '''
+        with self.lock:
+            self.db.execute('DELETE FROM responses WHERE accessed_at < ?',
+                            (time.time() - self.max_age,))
+            total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total > self.max_bytes:
+                rows = self.db.execute('SELECT key, size FROM responses ORDER BY accessed_at')
+                drop_keys = []
+                for key, size in rows.fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    drop_keys.append((key,))
+                    total -= size
+                self.db.executemany('DELETE FROM responses WHERE key = ?', drop_keys)
+            self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.db.execute('DELETE FROM responses')
+            self.db.commit()
+
+
+def cache_key(request):
+    '''Cache key for a prepared request, without credentials in the query (KEY_PARAMS)
+    '''
+    split_url = urllib.parse.urlsplit(request.url)
+    query = [(k, v) for k, v in urllib.parse.parse_qsl(split_url.query, keep_blank_values=True)
+             if k not in KEY_PARAMS]
+    url = urllib.parse.urlunsplit(split_url._replace(query=urllib.parse.urlencode(query)))
+    return '{} {} {}'.format(request.method, url, request.headers.get('Accept', ''))
+
+
+def build_response(request, entry):
+    '''Build a requests.Response from a cached entry
+    '''
+    resp = requests.Response()
+    resp.status_code = entry['status']
+    resp.headers = CaseInsensitiveDict(entry['headers'])
+    resp._content = entry['body']
+    resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)
+    resp.url = request.url
+    resp.request = request
+    resp.reason = 'OK'
+    resp.from_cache = True
+    return resp
+
+
+class CachingAdapter(HTTPAdapter):
+    '''Transport adapter that serves GET requests from a ResponseCache,
+    replaying ETag / Last-Modified of stale entries as conditional requests
+    '''
+    def __init__(self, cache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return super().send(request, **kwargs)
+        key = cache_key(request)
+        entry = self.cache.get(key)
+        if entry is not None and self.cache.is_fresh(entry):
+            return build_response(request, entry)
+        # revalidate stale entry
+        if entry is not None:
+            etag = entry['headers'].get('ETag')
+            last_modified = entry['headers'].get('Last-Modified')
+            if etag:
+                request.headers['If-None-Match'] = etag
+            if last_modified:
+                request.headers['If-Modified-Since'] = last_modified
+        resp = super().send(request, **kwargs)
+        if resp.status_code == 304 and entry is not None:
+            self.cache.touch(key)
+            return build_response(request, entry)
+        if resp.status_code == 200:
+            self.cache.put(key, resp.status_code, resp.headers, resp.content)
+        return resp
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Readme keyword extraction.
+
+Keywords are the distinct lowercase alphabetic words of a readme that are not
+stopwords. Two engines are available:
+  * 'regex': compiled regex tokenizer, several times faster than nltk
+  * 'nltk': nltk.word_tokenize, for exact parity with earlier results
+Batches of readmes are spread over a process pool that is shared by the run,
+if large enough for the engine (a handful of nltk readmes, a few dozen regex ones).
+Keyword lists are cached by readme blob sha, so identical readmes (forks,
+vendored dependencies) are tokenized once per run, and across runs if the
+cache is backed by a SQLite file.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import functools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from lazy_import import LazyModule
+
+nltk = LazyModule('nltk')
+
+NLTK_DATA_DIR = 'nltk_data'
+STOPWORDS_FILE = os.path.join(NLTK_DATA_DIR, 'corpora', 'stopwords', 'english')
+ENGINES = ['regex', 'nltk']
+# runs of word characters, joined by the punctuation nltk keeps inside a token;
+# joined tokens are dropped later, like nltk tokens that aren't purely alphabetic
+TOKEN_RE = re.compile(r"\w+(?:[-.'/]\w+)*")
+# batches (of one user's readmes) smaller than this are processed in the calling process,
+# by engine: a pool round trip costs about as much as 4 regex readmes, a quarter of an nltk one
+MIN_POOL_BATCH = {'regex': 32, 'nltk': 4}
+# readmes sent to a pool worker at a time, by engine
+POOL_CHUNKSIZE = {'regex': 16, 'nltk': 2}
+
+# on-disk keyword cache, used by the scripts unless --no-cache is given
+KEYWORDS_CACHE_FILE = os.path.join('cache', 'keywords.sqlite')
+# number of keyword lists kept in memory, least recently used are dropped first
+KEYWORDS_CACHE_SIZE = 4096
+# seconds after which on-disk entries are evicted
+KEYWORDS_CACHE_MAX_AGE = 90*24*60*60
+
+# process pool shared by all batches of a run, created on first use
+_pool = None
+# applicant lookups run in threads, only one of them may create the pool
+_pool_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=1)
+def get_stopwords():
+    '''Set of stopwords, loaded on first use
+    '''
+    with open(STOPWORDS_FILE, 'r') as f_stop:
+        return set(f_stop.read().splitlines())
+
+
+def nltk_keywords(readme):
+    '''Keywords using nltk.word_tokenize
+    '''
+    # add nltk_data folder to the list of NLTK library paths
+    if NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+    tokens_all = nltk.word_tokenize(readme)
+    tokens_set = set(tokens_all)
+    tokens_alpha = [s.lower() for s in tokens_set if s.isalpha()]
+    tokens_nostop = set(tokens_alpha) - get_stopwords()
+    return list(tokens_nostop)
+
+
+def regex_keywords(readme):
+    '''Keywords using the compiled regex tokenizer
+    '''
+    tokens_set = set(TOKEN_RE.findall(readme.lower()))
+    tokens_alpha = {s for s in tokens_set if s.isalpha()}
+    return list(tokens_alpha - get_stopwords())
+
+
+def get_keywords(readme, engine='regex'):
+    '''Keywords of readme using engine ('regex' or 'nltk')
+    '''
+    if engine == 'nltk':
+        return nltk_keywords(readme)
+    return regex_keywords(readme)
+
+
+def content_sha(readme):
+    '''Git blob sha of the readme text, the same sha Github reports for the readme
+    '''
+    data = readme.encode('utf-8')
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+
+class KeywordCache(object):
+    '''LRU cache of keyword lists keyed by engine and readme sha,
+    backed by a SQLite file if path is given
+    '''
+    def __init__(self, path=None, max_size=KEYWORDS_CACHE_SIZE, max_age=KEYWORDS_CACHE_MAX_AGE):
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.lru = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if path is None:
+            return
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS keywords (
+                               key TEXT PRIMARY KEY,
+                               keywords TEXT,
+                               stored_at REAL)''')
+        self.db.execute('DELETE FROM keywords WHERE stored_at < ?', (time.time() - max_age,))
+        self.db.commit()
+
+    def _remember(self, key, keywords_list):
+        self.lru[key] = keywords_list
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.max_size:
+            self.lru.popitem(last=False)
+
+    def get(self, key):
+        '''Keyword list for key, None if it isn't cached
+        '''
+        with self.lock:
+            keywords_list = self.lru.get(key)
+            if keywords_list is None and self.db is not None:
+                row = self.db.execute('SELECT keywords FROM keywords WHERE key = ?',
+                                      (key,)).fetchone()
+                if row is not None:
+                    keywords_list = json.loads(row[0])
+            if keywords_list is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, keywords_list)
+        return keywords_list
+
+    def put_many(self, items):
+        '''Store {key: keyword list}, with a single commit to disk
+        '''
+        with self.lock:
+            for key, keywords_list in items.items():
+                self._remember(key, keywords_list)
+            if self.db is not None and items:
+                now = time.time()
+                self.db.executemany('INSERT OR REPLACE INTO keywords VALUES (?,?,?)',
+                                    [(key, json.dumps(keywords_list), now)
+                                     for key, keywords_list in items.items()])
+                self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.lru.clear()
+            if self.db is not None:
+                self.db.execute('DELETE FROM keywords')
+                self.db.commit()
+
+
+# keyword cache used by get_keywords_batch, in memory only unless one with a file is installed
+_cache = KeywordCache()
+
+
+def install_cache(cache):
+    '''Use cache (KeywordCache, or None for no caching) for all keyword batches
+    '''
+    global _cache
+    _cache = cache
+
+
+def get_cache():
+    return _cache
+
+
+def get_pool():
+    '''Process pool shared by all batches of the run
+    '''
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, forking a process with running fetch threads isn't safe
+            _pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def extract_keywords_batch(readmes, engine='regex', use_pool=True):
+    '''Keywords of each of the readmes, in the same order, without the cache.
+    Large batches are spread over the shared process pool.
+    '''
+    func = functools.partial(get_keywords, engine=engine)
+    # on a single core the pool only adds pickling overhead
+    if not use_pool or len(readmes) < MIN_POOL_BATCH[engine] or (os.cpu_count() or 1) < 2:
+        return [func(readme) for readme in readmes]
+    return list(get_pool().map(func, readmes, chunksize=POOL_CHUNKSIZE[engine]))
+
+
+def get_keywords_batch(readmes, engine='regex', use_pool=True, shas=None):
+    '''Keywords of each of the readmes, in the same order.
+    Readmes are looked up in the installed cache by blob sha (shas, computed
+    from the text where missing), each distinct uncached readme is extracted once.
+    '''
+    cache = _cache
+    if cache is None:
+        return extract_keywords_batch(readmes, engine=engine, use_pool=use_pool)
+    shas = shas or [None]*len(readmes)
+    keys = ['{}:{}'.format(engine, sha or content_sha(readme)) for readme, sha in zip(readmes, shas)]
+    results = [cache.get(key) for key in keys]
+    # distinct readmes that aren't cached
+    missing = OrderedDict((key, readme) for key, readme, result in zip(keys, readmes, results)
+                          if result is None)
+    extracted = dict(zip(missing, extract_keywords_batch(list(missing.values()), engine=engine,
+                                                         use_pool=use_pool)))
+    cache.put_many(extracted)
+    return [extracted[key] if result is None else result for key, result in zip(keys, results)]
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lazy module imports, so that the scripts start (and print --help) without
+paying for pandas, numpy, nltk, PyGithub and py-stackexchange up front.
+"""
+
+import importlib
+
+
+class LazyModule(object):
+    '''Stand-in for a module that is imported on first attribute access
+    '''
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return "<lazy module '{}' ({})>".format(self._name, state)
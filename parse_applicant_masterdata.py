@@ -8,16 +8,42 @@ Created on Mon Apr 24 10:58:07 2017
 import json
 import sys
 import os
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import pandas as pd
+from lazy_import import LazyModule
 
 import get_github_details as ghd
 import get_stackoverflow_details as sod
+import checkpoint as ckpt
+import keywords
+import contributor_cache
+import repo_snapshots
+import result_store
+import resilience
+import user_search
+import tracing
+
+# heavy dependencies are imported on first use
+pd = LazyModule('pandas')
+http_cache = LazyModule('http_cache')
 
 
 MASTER_DIR = "master_data"
 MASTER_FILE = "Applicant Master Data 2017.xlsx"
 OUTPUT_FILE = MASTER_FILE.replace('Master', 'Github and Stackoverflow')
+# maximum number of lookups in flight against each API at any time
+GITHUB_MAX_CONCURRENT = 4
+STACKOVF_MAX_CONCURRENT = 2
+GITHUB_SEMAPHORE = threading.BoundedSemaphore(GITHUB_MAX_CONCURRENT)
+STACKOVF_SEMAPHORE = threading.BoundedSemaphore(STACKOVF_MAX_CONCURRENT)
+# outcome of an applicant's lookup on a site, in the '<source>_status' columns:
+# rated, matched but nothing to rate (no repos / tags), no matching user, lookup failed
+STATUS_OK = 'ok'
+STATUS_EMPTY = 'empty'
+STATUS_NO_MATCH = 'no_match'
+STATUS_FAILED = 'failed'
 
 def read_master_data(filepath):
     '''Read Applicant Master Data,
@@ -40,12 +66,15 @@ def read_master_data(filepath):
     return master_df
 
 
+@tracing.traced('master.excel')
 def write_df_to_excel(df, filepath):
     '''write df to excelfile in a proper order
     '''
     # order of columns for excel output
     cols_order = [
             'master_details',
+            'github_status',
+            'stackoverflow_status',
             'github_id_details',
             'stackoverflow_id_details',
             'github_overall_rating',
@@ -57,7 +86,7 @@ def write_df_to_excel(df, filepath):
     ordered_df_list = []
     for col_name in cols_order:
         try:
-            ordered_df_list.append(df[[col_name]].sortlevel(axis=1))
+            ordered_df_list.append(df[[col_name]].sort_index(axis=1))
         except (KeyError,IndexError):
             continue
     ordered_df = pd.concat(ordered_df_list, axis=1)
@@ -66,6 +95,29 @@ def write_df_to_excel(df, filepath):
 
 
 
+def ratings_to_frame(ratings_dict):
+    '''Long (field_type, field, value) frame of an applicant's {(field_type, field): value}
+    '''
+    return pd.DataFrame([(field_type, field, value) for (field_type, field), value in ratings_dict.items()],
+                        columns=['field_type', 'field', 'value'])
+
+
+@tracing.traced('master.read_results')
+def read_applicants(store):
+    '''Applicant ratings of the run in store as a frame with a row per applicant
+    (master row number) and (field_type, field) columns
+    '''
+    applicants_long = store.read('master', 'applicants')
+    if applicants_long.empty:
+        return pd.DataFrame()
+    applicants_long['key'] = applicants_long['key'].astype(int)
+    applicants_df = applicants_long.set_index(['key', 'field_type', 'field'])['value']
+    applicants_df = applicants_df.unstack(['field_type', 'field'])
+    applicants_df.index.name = None
+    # ratings columns back to numbers
+    return applicants_df.infer_objects().sort_index()
+
+
 def get_master_details(row):
     '''get a few id details from master data
     '''
@@ -79,98 +131,331 @@ def get_master_details(row):
     return master_details_dict
 
     
-def get_github_details(g, user_name, user_email):
-    '''get github details
+def lookup_status(source, status, error=None):
+    '''Status fields of an applicant's lookup on source ('github' or 'stackoverflow')
+    '''
+    status_dict = {(source + '_status', 'status'): status}
+    if error is not None:
+        status_dict[(source + '_status', 'error')] = error
+    return status_dict
+
+
+@tracing.traced('master.github')
+def get_github_details(g, user_name, user_email, github_kw=None):
+    '''get github details with their lookup status,
+    github_kw are passed on to ghd.get_github_profiles
     '''
     # search in Github for user matching the email_id
     search_string = user_email
-    github_matches = ghd.find_matching_users(g, search_string)
+    # only the best exact match is crawled
+    github_matches = ghd.find_matching_users(g, search_string, top_k=1)
     try:
         # get github data for the matching user
-        github_details = ghd.get_github_profiles(github_matches, search_string)
+        github_details = ghd.get_github_profiles(github_matches, search_string, **(github_kw or {}))
     except SystemExit:
-        github_details = {}
-    # get the github ratings df
-    github_ratings_df = github_details.get(search_string,{}).get('overall_rating', pd.DataFrame())
+        return lookup_status('github', STATUS_NO_MATCH)
+    # get the github ratings df of the only match, keyed by its own email
+    github_ratings_df = next(iter(github_details.values()), {}).get('overall_rating', pd.DataFrame())
     # convert df to dict
     github_ratings_dict = github_ratings_df.to_dict().get('value',{})
-    return github_ratings_dict
+    status = STATUS_OK if github_ratings_dict else STATUS_EMPTY
+    return {**github_ratings_dict, **lookup_status('github', status)}
 
 
-def get_stackoverflow_details(so, user_name, user_email):
-    '''get stackoverflow details
+@tracing.traced('master.stackoverflow')
+def get_stackoverflow_details(so, user_name, user_email, stackovf_kw=None, stackovf_users=None):
+    '''get stackoverflow details with their lookup status,
+    stackovf_kw are passed on to sod.get_stackoverflow_profiles.
+    The user in stackovf_users ({normalized name: user}) is used instead of a search
+    if it still matches the name.
     '''
     # use fullname as search string
     search_string = user_name
     search_kw = {'inname':search_string}
-    # find matching stackoverflow users, use the first match
-    stackovf_matches = sod.find_matching_users(so, search_kw)[0:1]
+    user = (stackovf_users or {}).get(user_search.normalize(search_string))
+    if user is not None and sod.match_confidence(user, search_kw) >= user_search.MATCH_NAME:
+        # fetched in a batch already, no search
+        stackovf_matches = [user]
+    else:
+        # find matching stackoverflow users, use the best match (exact display name only,
+        # weaker hits are no match), only the rated user fields unless the raw json is kept
+        stackovf_kw = stackovf_kw or {}
+        minimal = stackovf_kw.get('lean', False) or not stackovf_kw.get('keep_raw', True)
+        stackovf_matches = sod.find_matching_users(so, search_kw, top_k=1,
+                                                   min_confidence=user_search.MATCH_NAME,
+                                                   minimal=minimal)
     try:
         # get stackoverflow details for the first user
-        stackovf_details = sod.get_stackoverflow_profiles(stackovf_matches, search_kw)
+        stackovf_details = sod.get_stackoverflow_profiles(stackovf_matches, search_kw,
+                                                          **(stackovf_kw or {}))
     except SystemExit:
-        stackovf_details = {}
-    # get statckoverflow ratings df
-    stackovf_ratings_df = stackovf_details.get(search_string,{}).get('ratings_df', pd.DataFrame())
+        return lookup_status('stackoverflow', STATUS_NO_MATCH)
+    # get statckoverflow ratings df of the only match, keyed by its own display name
+    stackovf_ratings_df = next(iter(stackovf_details.values()), {}).get('ratings_df', pd.DataFrame())
     # convert df to dict
     stackovf_ratings_dict = stackovf_ratings_df.to_dict().get('value',{})
-    return stackovf_ratings_dict
+    status = STATUS_OK if stackovf_ratings_dict else STATUS_EMPTY
+    return {**stackovf_ratings_dict, **lookup_status('stackoverflow', status)}
+
+
+def run_rate_limited(semaphore, func, *args):
+    '''call func(*args) while holding the semaphore of the API it talks to
+    '''
+    with semaphore:
+        return func(*args)
 
 
-def get_github_stackorf_details(g, so, master_data_df):
-    '''get github and stackoverflow details for each of the applicant in the master_data_df
+def get_applicant_github_details(g, i, user_name, user_email, github_kw=None):
+    '''get github details for the applicant in master row i
+    '''
+    print('\nSl.No {:3d}: [{}], [{}]'.format(i, user_name, user_email))
+    with tracing.applicant(i):
+        return run_rate_limited(GITHUB_SEMAPHORE, get_github_details, g, user_name, user_email,
+                                github_kw)
+
+
+def get_applicant_stackovf_details(so, i, user_name, user_email, stackovf_kw=None,
+                                   stackovf_users=None):
+    '''get stackoverflow details for the applicant in master row i
+    '''
+    with tracing.applicant(i):
+        return run_rate_limited(STACKOVF_SEMAPHORE, get_stackoverflow_details, so, user_name,
+                                user_email, stackovf_kw, stackovf_users)
+
+
+def known_stackoverflow_ids(store):
+    '''{normalized applicant name: stackoverflow user_id} of the applicants matched
+    by exact display name in the runs of store, latest run first
+    '''
+    applicants = store.read('master', 'applicants', all_runs=True)
+    if applicants.empty:
+        return {}
+    id_fields = applicants['field_type'].isin(['master_details', 'stackoverflow_id_details']) & \
+                applicants['field'].isin(['name', 'display_name', 'user_id'])
+    ids_df = applicants[id_fields].set_index(['run', 'key', 'field'])['value'].unstack('field')
+    ids_df = ids_df.reindex(columns=['name', 'display_name', 'user_id']).dropna()
+    names = ids_df['name'].map(user_search.normalize)
+    matched = names == ids_df['display_name'].map(user_search.normalize)
+    # later runs overwrite earlier ones
+    return {name: int(user_id)
+            for name, user_id in zip(names[matched], ids_df['user_id'][matched])}
+
+
+@tracing.traced('master.prefetch')
+def prefetch_stackoverflow_users(so, master_data_df, store, minimal=False):
+    '''{normalized name: user} of the applicants in master_data_df whose Stackoverflow
+    user is known from earlier runs in store, fetched 100 ids per request instead of
+    a search per applicant (only the rated user fields if minimal)
+    '''
+    known_ids = known_stackoverflow_ids(store)
+    names = {user_search.normalize(name) for name in master_data_df['name']}
+    ids = {name: known_ids[name] for name in names if name in known_ids}
+    if not ids:
+        return {}
+    with STACKOVF_SEMAPHORE:
+        users = sod.get_users_by_ids(so, sorted(set(ids.values())), minimal=minimal)
+    print('\nFetched {} known Stackoverflow users in {} request(s)'.format(
+            len(users), -(-len(set(ids.values())) // sod.IDS_PER_REQUEST)))
+    return {name: users[user_id] for name, user_id in ids.items() if user_id in users}
+
+
+def get_github_stackorf_details(g, so, master_data_df, n_workers=1, checkpoint=None,
+                                github_kw=None, stackovf_kw=None, store=None, stackovf_users=None):
+    '''get github and stackoverflow details for each of the applicant in the master_data_df,
+    running up to n_workers Github/Stackoverflow lookups concurrently.
+    If checkpoint (checkpoint.CheckpointStore) is given, applicants done in an earlier run
+    are skipped and each applicant's ratings are committed as soon as they are available.
+    github_kw (e.g. graphql, exact, lean) are passed on to ghd.get_github_profiles,
+    stackovf_kw (e.g. lean) to sod.get_stackoverflow_profiles.
+    If store (result_store.ResultStore) is given, each applicant's ratings are appended to it
+    as soon as they are available.
+    Stackoverflow users in stackovf_users ({normalized name: user}, see
+    prefetch_stackoverflow_users) are rated without searching for them.
+    The ratings of each applicant carry the outcome of both lookups in
+    ('github_status' / 'stackoverflow_status', 'status'): STATUS_OK, STATUS_EMPTY,
+    STATUS_NO_MATCH or STATUS_FAILED (with the error in 'error').
+    The Github repos of each applicant are rated (vectorized) as soon as its lookup is done,
+    so the applicant can be checkpointed; rescore.py rates the stored repos of all applicants
+    in a single pass.
     '''
     all_details_dict = {}
     master_details_dict = {}
     github_ratings_dict = {}
     stackovf_ratings_dict = {}
     ratings_dict = {}
-    # for each applicant get Github, Stackoverflow and Master Data, do this for all applicants
-    for i,row in master_data_df.iterrows():
-        print('\nSl.No {:3d}: [{}], [{}]'.format(i, row['name'], row['email']) )
-        # applicant master details
-        master_details_dict[i] = get_master_details(row)
-        user_name = master_details_dict[i].get(('master_details','name'),'')
-        user_email = master_details_dict[i].get(('master_details','email'),'')
-        # search in Github for user matching the email_id
-        github_ratings_dict[i] = get_github_details(g, user_name, user_email)
-        # search in Stackoverflow for user matching the user_name
-        stackovf_ratings_dict[i] = get_stackoverflow_details(so, user_name, user_email)
-        # append all ratings df to applicant master details
-        ratings_dict[i] = {
-                **master_details_dict[i],
-                **github_ratings_dict[i],
-                **stackovf_ratings_dict[i]
-        }
+    errors_dict = {}
+    futures = {}
+    # submit Github and Stackoverflow lookups for all applicants, in master row order
+    with ThreadPoolExecutor(max_workers=max(1, n_workers)) as executor:
+        for i,row in master_data_df.iterrows():
+            # applicant master details
+            master_details_dict[i] = get_master_details(row)
+            user_name = master_details_dict[i].get(('master_details','name'),'')
+            user_email = master_details_dict[i].get(('master_details','email'),'')
+            # skip applicants that are done in an earlier run
+            if checkpoint is not None and checkpoint.is_done(i, user_name, user_email):
+                print('\nSl.No {:3d}: [{}], [{}] done in earlier run'.format(i, user_name, user_email))
+                continue
+            # search in Github for user matching the email_id
+            futures[executor.submit(get_applicant_github_details,
+                                    g, i, user_name, user_email, github_kw)] = (i, 'github')
+            # search in Stackoverflow for user matching the user_name
+            futures[executor.submit(get_applicant_stackovf_details,
+                                    so, i, user_name, user_email, stackovf_kw,
+                                    stackovf_users)] = (i, 'stackoverflow')
+        # collect results as they finish, commit each applicant once both lookups are done
+        for future in as_completed(futures):
+            i, source = futures[future]
+            try:
+                result = future.result()
+            except Exception as err:
+                print('\nSl.No {:3d}: {} lookup failed: {!r}'.format(i, source, err))
+                errors_dict.setdefault(i, []).append('{}: {!r}'.format(source, err))
+                result = lookup_status(source, STATUS_FAILED, repr(err))
+            if source == 'github':
+                github_ratings_dict[i] = result
+            else:
+                stackovf_ratings_dict[i] = result
+            if i not in github_ratings_dict or i not in stackovf_ratings_dict:
+                continue
+            # append all ratings df to applicant master details
+            ratings_dict[i] = {
+                    **master_details_dict[i],
+                    **github_ratings_dict[i],
+                    **stackovf_ratings_dict[i]
+            }
+            if checkpoint is not None:
+                status = 'failed' if i in errors_dict else 'done'
+                error = '; '.join(errors_dict.get(i, [])) or None
+                user_name = master_details_dict[i].get(('master_details','name'),'')
+                user_email = master_details_dict[i].get(('master_details','email'),'')
+                checkpoint.save(i, user_name, user_email, ratings_dict[i],
+                                status=status, error=error)
+            if store is not None:
+                store.append('master', 'applicants', i, ratings_to_frame(ratings_dict[i]))
+    # ratings of applicants done in an earlier run
+    if checkpoint is not None:
+        ratings_dict.update(checkpoint.load(rows=set(master_details_dict) - set(ratings_dict)))
+    # order by master row number
+    ratings_dict = {i:ratings_dict[i] for i in master_details_dict if i in ratings_dict}
     # dictionary of combined as well as individual ratings
     all_details_dict = {
             'ratings_dict': ratings_dict,
             'master_details_dict': master_details_dict,
             'github_ratings_dict': github_ratings_dict,
-            'stackovf_ratings_dict': stackovf_ratings_dict
+            'stackovf_ratings_dict': stackovf_ratings_dict,
+            'errors_dict': errors_dict
     }
     return all_details_dict
 
 
 if __name__ == '__main__':
+    # get run options from command line arguments
+    description = "Script to get Github and Stackoverflow ratings for all applicants in master data"
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("-w", dest="n_workers", type=int, default=1,
+                        help="number of applicant lookups to run concurrently (default 1)")
+    parser.add_argument("-n", dest="sample_size", type=int, default=10,
+                        help="number of applicants to sample from master data (default 10)")
+    parser.add_argument("--all", dest="all_applicants", action="store_true",
+                        help="get details for all applicants instead of a sample")
+    parser.add_argument("--no-cache", dest="no_cache", action="store_true",
+                        help="don't use the on-disk response, readme keyword and contributor caches")
+    parser.add_argument("-c", dest="checkpoint_file", type=str, default=ckpt.CHECKPOINT_FILE,
+                        help="checkpoint file, applicants done in it are skipped "
+                             "(default '{}')".format(ckpt.CHECKPOINT_FILE))
+    parser.add_argument("--no-checkpoint", dest="no_checkpoint", action="store_true",
+                        help="don't checkpoint / resume the run")
+    parser.add_argument("--restart", dest="restart", action="store_true",
+                        help="clear the checkpoint file and start over")
+    parser.add_argument("--graphql", dest="graphql", action="store_true",
+                        help="fetch Github repos with the GraphQL API (needs an auth token)")
+    parser.add_argument("--lean", dest="lean", action="store_true",
+                        help="only fetch what the ratings need: no readmes, no per-user excel files")
+    parser.add_argument("-o", dest="results_dir", type=str, default=result_store.RESULTS_DIR,
+                        help="directory of the parquet result store (default '{}')".format(
+                                result_store.RESULTS_DIR))
+    parser.add_argument("--no-excel", dest="no_excel", action="store_true",
+                        help="don't export the applicant ratings to an excel file")
+    parser.add_argument("--exact", dest="exact", action="store_true",
+                        help="fetch contributors and readme of every Github repo, "
+                             "don't prune repos that can't add to the ratings")
+    parser.add_argument("--prune-forks", dest="prune_forks", action="store_true",
+                        help="also skip Github forks never pushed to, assuming they hold none of "
+                             "the user's commits (fewer requests, may lower ratings)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="send Stackoverflow requests with the asyncio client "
+                             "(needs aiohttp, no response cache)")
+    parser.add_argument("--batch", dest="batch", action="store_true",
+                        help="fetch the Stackoverflow users matched in earlier runs 100 per request "
+                             "instead of searching for each applicant")
+    parser.add_argument("--incremental", dest="snapshots_file", type=str, nargs="?",
+                        const=repo_snapshots.REPO_SNAPSHOTS_FILE,
+                        help="only fetch Github repos new or changed since the last run, keeping "
+                             "snapshots of each user's parsed repos in SNAPSHOTS_FILE "
+                             "(default '{}')".format(repo_snapshots.REPO_SNAPSHOTS_FILE))
+    resilience.add_arguments(parser)
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.start(args)
     # read master data from excel file
     master_data_df = read_master_data(filepath = os.path.join(MASTER_DIR, MASTER_FILE))
+    # response cache shared by github and stackoverflow
+    cache = None if args.no_cache else http_cache.ResponseCache()
+    if not args.no_cache:
+        # readme keywords and contributor counts shared by all applicants of this and later runs
+        keywords.install_cache(keywords.KeywordCache(keywords.KEYWORDS_CACHE_FILE))
+        contributor_cache.install_cache(
+                contributor_cache.ContributorCache(contributor_cache.CONTRIBUTORS_CACHE_FILE))
+    if args.snapshots_file:
+        # re-rate users from the repos parsed in earlier runs, fetching only changed repos
+        repo_snapshots.install_snapshots(repo_snapshots.RepoSnapshots(args.snapshots_file))
+    # timeouts, retries and circuit breaker (per host) shared by both APIs
+    policy = resilience.policy_from_args(args)
     # initialize github object
-    g = ghd.init_github_object()
+    g = ghd.init_github_object(cache=cache, policy=policy)
+    # results of this run, per applicant and per matched user
+    store = result_store.ResultStore(args.results_dir)
+    # options for fetching Github profiles
+    github_kw = {
+            'graphql': ghd.init_graphql_client() if args.graphql else None,
+            'exact': args.exact,
+            'prune_forks': args.prune_forks,
+            'lean': args.lean,
+            'store': store
+    }
+    stackovf_kw = {'lean': args.lean, 'store': store}
     # initialize stackoverflow object
-    so = sod.init_stackoverflow_object()
+    so = sod.init_stackoverflow_object(cache=cache, use_async=args.use_async, policy=policy)
     # get applicant github stackoverflow data
-    sample = True
+    sample = not args.all_applicants
     if sample:
-        data_df = master_data_df.sample(10)
+        data_df = master_data_df.sample(args.sample_size)
         suffix = "Sample "
     else:
         data_df = master_data_df
         suffix = ""
-    all_details_dict = get_github_stackorf_details(g, so, data_df)
-    ratings_details = all_details_dict['ratings_dict']
-    # convert dict of all applicant details to a dataframe
-    applicants_df = pd.DataFrame.from_dict(ratings_details, orient='index')
-    # write to excel file
-    output_file = os.path.join(MASTER_DIR, suffix + OUTPUT_FILE)
-    write_df_to_excel(applicants_df, output_file)
+    # checkpoint store, applicants done in an earlier run are skipped
+    checkpoint = None if args.no_checkpoint else ckpt.CheckpointStore(args.checkpoint_file)
+    if checkpoint is not None and args.restart:
+        checkpoint.clear()
+    # stackoverflow users known from earlier runs, fetched in batches
+    stackovf_users = (prefetch_stackoverflow_users(so, data_df, store, minimal=args.lean)
+                      if args.batch else None)
+    all_details_dict = get_github_stackorf_details(g, so, data_df, n_workers=args.n_workers,
+                                                   checkpoint=checkpoint, github_kw=github_kw,
+                                                   stackovf_kw=stackovf_kw, store=store,
+                                                   stackovf_users=stackovf_users)
+    # add applicants done in an earlier run from the checkpoint store
+    if checkpoint is not None:
+        done_rows = set(store.keys('master', 'applicants'))
+        ratings_details = checkpoint.load(rows=set(data_df.index), status=None)
+        for i, ratings in ratings_details.items():
+            if str(i) not in done_rows:
+                store.append('master', 'applicants', i, ratings_to_frame(ratings))
+    print('\nResults saved to {}'.format(os.path.dirname(store.table_dir('master', 'applicants'))))
+    # export the ratings of all applicants to excel file
+    if not args.no_excel:
+        applicants_df = read_applicants(store)
+        output_file = os.path.join(MASTER_DIR, suffix + OUTPUT_FILE)
+        write_df_to_excel(applicants_df, output_file)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rate limit governor for the Github and Stackexchange APIs.
+
+Requests are paced with a token bucket and spread over a pool of auth tokens
+(Github) or app keys (Stackexchange). The remaining quota of each token is read
+back from the responses (X-RateLimit-Remaining/Reset headers for Github,
+quota_remaining/backoff fields for Stackexchange); when every token is exhausted
+the governor sleeps until the earliest reset instead of failing the run.
+"""
+
+import time
+import datetime
+import threading
+
+from requests.adapters import HTTPAdapter
+
+# authenticated Github requests per token per hour, anonymous requests per hour
+GITHUB_RATE = 5000/3600
+GITHUB_ANON_RATE = 60/3600
+# Stackexchange allows at most 30 requests in 5 seconds per IP
+STACKOVF_RATE = 30/5
+# number of requests that can be sent in a burst
+BURST = 30
+GITHUB_BURST = 100
+GITHUB_ANON_BURST = 60
+# retries of a request that was rejected for exceeding the rate limit
+MAX_RATE_LIMIT_RETRIES = 5
+
+
+class TokenBucket(object):
+    '''Allows rate requests per second on average, bursts of up to capacity
+    '''
+    def __init__(self, rate, capacity=BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''Block until a request can be sent
+        '''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last)*self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens)/self.rate
+            time.sleep(wait)
+
+
+class RateLimitGovernor(object):
+    '''Paces requests and rotates across a pool of auth tokens,
+    tracking remaining quota per (token, resource)
+    '''
+    def __init__(self, tokens, rate, capacity=BURST):
+        self.tokens = list(tokens) or [None]
+        self.bucket = TokenBucket(rate*len(self.tokens), capacity)
+        # {(token, resource): (remaining, reset epoch)}
+        self.quota = {}
+        # {method: epoch until which requests to method must wait}
+        self.backoff_until = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, resource='core', method=None):
+        '''Wait for pacing, backoff and quota; return the token with most remaining quota
+        '''
+        self.bucket.acquire()
+        while True:
+            with self.lock:
+                now = time.time()
+                wait = self.backoff_until.get(method, 0) - now
+                if wait <= 0:
+                    available = []
+                    for token in self.tokens:
+                        remaining, reset = self.quota.get((token, resource), (None, 0))
+                        # unknown quota, quota left, or reset already passed
+                        if remaining is None or remaining > 0 or reset <= now:
+                            available.append((remaining is None, remaining or 0, token))
+                    if available:
+                        return max(available, key=lambda x: (x[0], x[1]))[2]
+                    wait = min(self.quota[(t, resource)][1] for t in self.tokens) - now
+            print("\tRate limit reached, waiting {:.0f} sec ...".format(max(wait, 1)))
+            time.sleep(max(wait, 1))
+
+    def pace(self):
+        '''Wait for pacing only, for a copy of a request sent with an acquired token
+        '''
+        self.bucket.acquire()
+
+    def update(self, token, resource='core', remaining=None, reset=None, backoff=None,
+               method=None):
+        '''Record quota / backoff reported by the api for token
+        '''
+        with self.lock:
+            if remaining is not None:
+                self.quota[(token, resource)] = (int(remaining), float(reset or 0))
+            if backoff is not None:
+                self.backoff_until[method] = time.time() + float(backoff)
+
+    def exhaust(self, token, resource='core', reset=None):
+        '''Mark token as out of quota until reset (default 60 sec from now)
+        '''
+        reset = reset if reset is not None else time.time() + 60
+        self.update(token, resource, remaining=0, reset=reset)
+
+
+def github_resource(url):
+    '''Github rate limit resource that url is counted against
+    '''
+    if '/search/' in url:
+        return 'search'
+    if url.rstrip('/').endswith('/graphql'):
+        return 'graphql'
+    return 'core'
+
+
+def next_utc_midnight():
+    '''Epoch of the next Stackexchange daily quota reset
+    '''
+    tomorrow = datetime.datetime.utcnow().date() + datetime.timedelta(days=1)
+    return (datetime.datetime(tomorrow.year, tomorrow.month, tomorrow.day) -
+            datetime.datetime(1970, 1, 1)).total_seconds()
+
+
+def github_governor(tokens):
+    '''Governor for a pool of Github auth tokens, anonymous if the pool is empty
+    '''
+    tokens = [token for token in tokens if token]
+    if tokens:
+        return RateLimitGovernor(tokens, GITHUB_RATE, capacity=GITHUB_BURST)
+    return RateLimitGovernor(tokens, GITHUB_ANON_RATE, capacity=GITHUB_ANON_BURST)
+
+
+def stackoverflow_governor(keys):
+    '''Governor for a pool of Stackexchange app keys, anonymous if the pool is empty
+    '''
+    keys = [key for key in keys if key]
+    # the 30 requests / 5 sec limit is per IP, not per key
+    return RateLimitGovernor(keys, STACKOVF_RATE/max(1, len(keys)), capacity=BURST)
+
+
+class GovernedAdapter(HTTPAdapter):
+    '''Transport adapter that sends Github requests through a RateLimitGovernor,
+    setting the Authorization header to the pooled token with most quota left
+    and retrying requests rejected for exceeding the rate limit
+    '''
+    def __init__(self, governor, **kwargs):
+        self.governor = governor
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        resource = github_resource(request.url)
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            token = self.governor.acquire(resource)
+            if token is not None:
+                request.headers['Authorization'] = 'token ' + token
+            resp = super().send(request, **kwargs)
+            headers = resp.headers
+            remaining = headers.get('X-RateLimit-Remaining')
+            reset = headers.get('X-RateLimit-Reset')
+            resource = headers.get('X-RateLimit-Resource', resource)
+            self.governor.update(token, resource, remaining=remaining, reset=reset)
+            if resp.status_code not in (403, 429) or attempt == MAX_RATE_LIMIT_RETRIES:
+                return resp
+            # primary rate limit: token is out of quota until reset
+            if remaining == '0':
+                self.governor.exhaust(token, resource, float(reset) if reset else None)
+            # secondary rate limit: hold back all requests as long as asked to
+            elif 'Retry-After' in headers:
+                self.governor.update(token, resource, backoff=headers['Retry-After'])
+            else:
+                return resp
+            resp.close()
+        return resp
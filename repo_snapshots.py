@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-user snapshots of parsed Github repos, for incremental re-rating.
+
+The parsed row of each repo of a user (contributions, contribution share,
+readme keywords, ...) is kept with the repo's pushed_at / updated_at. When the
+user is rated again, their repo list (one paged request) is compared with the
+snapshot, and only repos that are new or were pushed to / updated since are
+fetched and parsed again. The other repos keep their snapshot rows. A snapshot
+row is reused only if it was parsed with the same options (raw fields kept,
+readme fetched, pruning, keyword engine).
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+
+REPO_SNAPSHOTS_FILE = os.path.join('cache', 'repo_snapshots.sqlite')
+
+
+def repo_version(repo):
+    '''pushed_at and updated_at of a repo as listed (no request to complete it)
+    '''
+    return '{}|{}'.format(repo.pushed_at, repo.updated_at)
+
+
+class RepoSnapshots(object):
+    '''SQLite store of the parsed repo rows of each Github user, by repo version
+    '''
+    def __init__(self, path=REPO_SNAPSHOTS_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS repos (
+                               login TEXT,
+                               full_name TEXT,
+                               version TEXT,
+                               options TEXT,
+                               row TEXT,
+                               saved_at REAL,
+                               PRIMARY KEY (login, full_name))''')
+        self.db.commit()
+
+    def load(self, login, options):
+        '''{full_name: (version, repo row)} of the snapshot of login's repos parsed with options
+        '''
+        with self.lock:
+            rows = self.db.execute('SELECT full_name, version, row FROM repos '
+                                   'WHERE login = ? AND options = ?',
+                                   (login, json.dumps(options, sort_keys=True))).fetchall()
+        return {full_name: (version, json.loads(row)) for full_name, version, row in rows}
+
+    def save(self, login, options, repo_rows):
+        '''Replace the snapshot of login's repos with repo_rows, [(full_name, version, repo row)],
+        repos no longer listed are dropped
+        '''
+        options = json.dumps(options, sort_keys=True)
+        with self.lock:
+            self.db.execute('DELETE FROM repos WHERE login = ?', (login,))
+            self.db.executemany('INSERT OR REPLACE INTO repos VALUES (?,?,?,?,?,?)',
+                                [(login, full_name, version, options,
+                                  json.dumps(repo_row, default=str), time.time())
+                                 for full_name, version, repo_row in repo_rows])
+            self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.db.execute('DELETE FROM repos')
+            self.db.commit()
+
+
+# snapshots used by ghd.parse_user_details, every repo is fetched unless some are installed
+_snapshots = None
+
+
+def install_snapshots(snapshots):
+    '''Re-rate users incrementally with snapshots (RepoSnapshots, or None to fetch every repo)
+    '''
+    global _snapshots
+    _snapshots = snapshots
+
+
+def get_snapshots():
+    return _snapshots
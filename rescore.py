@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Offline re-scoring of stored results with new weights.
+
+Recomputes the Github and Stackoverflow ratings of every applicant in the
+result store from the raw repo, user and tag tables fetched earlier, in one
+vectorized pass per source, with weights from a JSON config. Makes no API calls.
+
+Weights config (any part may be left out, defaults are the current weights):
+    {"github": {"repo_ops": {...}, "owner_frac": 0.25},
+     "stackoverflow": {"general_ops": {...}, "tag_weights": {...}}}
+
+Only users whose raw data is in the store are re-scored (not the ones of
+--lean runs); the other applicants keep their stored ratings.
+
+Usage: python3 rescore.py [-c weights.json] [-r run_id] [-o results_dir] [--no-excel]
+                          [--trace [file]] [--profile [file]]
+"""
+
+import os
+import sys
+import copy
+import json
+import argparse
+
+from lazy_import import LazyModule
+
+import tracing
+import result_store
+import get_github_details as ghd
+import get_stackoverflow_details as sod
+import parse_applicant_masterdata as pam
+
+pd = LazyModule('pandas')
+
+GITHUB_RATING_TYPES = ['github_overall_rating', 'github_expertise_ratings']
+STACKOVF_RATING_TYPES = ['stackoverflow_overall_rating', 'stackoverflow_expertise_ratings']
+
+
+def default_weights():
+    return {
+        'github': {'repo_ops': ghd.REPO_OPS, 'owner_frac': ghd.OWNER_FRAC},
+        'stackoverflow': {'general_ops': sod.GENERAL_OPS, 'tag_weights': sod.TAG_WEIGHTS}
+    }
+
+
+def load_weights(path=None):
+    '''Default weights, with the parts given in the json config at path replaced
+    '''
+    weights = copy.deepcopy(default_weights())
+    if path is None:
+        return weights
+    with open(path, 'r') as f_weights:
+        config = json.load(f_weights)
+    for source, source_weights in config.items():
+        weights[source].update(source_weights)
+    return weights
+
+
+def latest_per_user(df, user_col):
+    '''Rows of the latest stored part (run, key) of each user
+    '''
+    if df.empty:
+        return df
+    last = df.drop_duplicates(user_col, keep='last')[[user_col, 'run', 'key']]
+    return df.merge(last, on=[user_col, 'run', 'key'])
+
+
+@tracing.traced('rescore.github')
+def rescore_github(repos, repo_ops, owner_frac):
+    '''Long (user_login, field_type, field, value) ratings of all users in repos at once
+    '''
+    if repos.empty:
+        return pd.DataFrame(columns=['user_login', 'field_type', 'field', 'value'])
+    repos = ghd.rate_repos(repos.copy(), repo_ops, owner_frac)
+    language_ratings = repos.groupby(['user_login', 'language'])['user_rating'].sum()
+    overall_ratings = language_ratings.groupby(level='user_login').sum()
+    expertise = language_ratings.reset_index().rename(columns={'language': 'field',
+                                                               'user_rating': 'value'})
+    expertise['field_type'] = 'github_expertise_ratings'
+    overall = overall_ratings.reset_index().rename(columns={'user_rating': 'value'})
+    overall['field_type'] = overall['field'] = 'github_overall_rating'
+    return pd.concat([overall, expertise], ignore_index=True)
+
+
+@tracing.traced('rescore.stackoverflow')
+def rescore_stackoverflow(users, tags, general_ops, tag_weights):
+    '''Long (user_id, field_type, field, value) ratings of all users in users/tags at once
+    '''
+    if users.empty:
+        return pd.DataFrame(columns=['user_id', 'field_type', 'field', 'value'])
+    # one row per stored user part, one column per user field
+    users_wide = users.set_index(['run', 'key', 'field'])['value'].unstack('field')
+    general = users_wide.reindex(columns=list(general_ops)).astype(float).fillna(0)
+    general_ratings = pd.Series(ghd.apply_column_ops(general, general_ops), index=users_wide.index)
+    # tag ratings of all users
+    tags = tags.copy()
+    tags['value'] = sum(weight*tags[col] for col, weight in tag_weights.items()).astype(int)
+    tag_totals = tags.groupby(['run', 'key'])['value'].sum()
+    overall_ratings = (general_ratings + tag_totals.reindex(general_ratings.index).fillna(0)).astype(int)
+    user_ids = users_wide['user_id'].map(str)
+    overall = pd.DataFrame({'user_id': user_ids.values, 'value': overall_ratings.values})
+    overall['field_type'] = overall['field'] = 'stackoverflow_overall_rating'
+    expertise = tags.merge(user_ids.rename('user_id').reset_index(), on=['run', 'key'])
+    expertise = expertise[['user_id', 'tag_name', 'value']].rename(columns={'tag_name': 'field'})
+    expertise['field_type'] = 'stackoverflow_expertise_ratings'
+    return pd.concat([overall, expertise], ignore_index=True)
+
+
+def replace_ratings(applicants, id_field, new_ratings, user_col, rating_types):
+    '''Replace the rating_types rows of applicants (long frame) that are matched,
+    by their id_field (field_type, field) value, to a user in new_ratings
+    '''
+    ids = applicants[(applicants['field_type'] == id_field[0]) &
+                     (applicants['field'] == id_field[1])][['key', 'value']]
+    ids = ids.assign(value=ids['value'].map(str)).rename(columns={'value': user_col})
+    ids = ids[ids[user_col].isin(new_ratings[user_col].map(str))]
+    # drop the old ratings of the applicants that are re-scored
+    rescored = applicants['key'].isin(ids['key']) & applicants['field_type'].isin(rating_types)
+    new_ratings = new_ratings.assign(**{user_col: new_ratings[user_col].map(str)})
+    added = ids.merge(new_ratings, on=user_col)[['key', 'field_type', 'field', 'value']]
+    return pd.concat([applicants[~rescored], added], ignore_index=True)
+
+
+@tracing.traced('rescore.applicants')
+def rescore(store, weights, run_id=None):
+    '''Re-scored long (key, field_type, field, value) ratings of the applicants of run_id
+    (default the run of store), from the raw data of all runs in store
+    '''
+    applicants = store.read('master', 'applicants', run_id=run_id).drop(columns='run', errors='ignore')
+    if applicants.empty:
+        return applicants
+    applicants = applicants[['key', 'field_type', 'field', 'value']]
+    # raw data of all runs, latest per user
+    repos = latest_per_user(store.read('github', 'repos', all_runs=True), 'user_login')
+    users = store.read('stackoverflow', 'user', all_runs=True)
+    tags = store.read('stackoverflow', 'tags', all_runs=True)
+    if not users.empty:
+        user_ids = users[users['field'] == 'user_id'][['run', 'key', 'value']]
+        latest = user_ids.drop_duplicates('value', keep='last')[['run', 'key']]
+        users = users.merge(latest, on=['run', 'key'])
+        tags = tags.merge(latest, on=['run', 'key'])
+    github_weights = weights['github']
+    stackovf_weights = weights['stackoverflow']
+    github_ratings = rescore_github(repos, github_weights['repo_ops'], github_weights['owner_frac'])
+    stackovf_ratings = rescore_stackoverflow(users, tags, stackovf_weights['general_ops'],
+                                             stackovf_weights['tag_weights'])
+    applicants = replace_ratings(applicants, ('github_id_details', 'login'), github_ratings,
+                                 'user_login', GITHUB_RATING_TYPES)
+    applicants = replace_ratings(applicants, ('stackoverflow_id_details', 'user_id'),
+                                 stackovf_ratings, 'user_id', STACKOVF_RATING_TYPES)
+    return applicants
+
+
+def latest_run(store):
+    '''Id of the latest run in store with applicant ratings
+    '''
+    applicants = store.read('master', 'applicants', all_runs=True)
+    if applicants.empty:
+        return None
+    return applicants['run'].max()
+
+
+if __name__ == '__main__':
+    description = "Re-score stored applicant ratings with new weights, without API calls"
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("-c", dest="weights_file", type=str,
+                        help="json file of weights (default: current weights)")
+    parser.add_argument("-r", dest="run_id", type=str,
+                        help="run whose applicants are re-scored (default: latest run)")
+    parser.add_argument("-o", dest="results_dir", type=str, default=result_store.RESULTS_DIR,
+                        help="directory of the parquet result store (default '{}')".format(
+                                result_store.RESULTS_DIR))
+    parser.add_argument("--no-excel", dest="no_excel", action="store_true",
+                        help="don't export the re-scored applicant ratings to an excel file")
+    tracing.add_arguments(parser)
+    args = parser.parse_args()
+    tracing.start(args)
+    weights = load_weights(args.weights_file)
+    store = result_store.ResultStore(args.results_dir)
+    run_id = args.run_id or latest_run(store)
+    if run_id is None:
+        print("No applicant ratings in '{}'".format(args.results_dir))
+        sys.exit(0)
+    applicants = rescore(store, weights, run_id=run_id)
+    # save as a new run
+    store.append_many('master', 'applicants', applicants, part='rescored')
+    print('Re-scored {} applicants of run {}, saved to {}'.format(
+            applicants['key'].nunique(), run_id,
+            os.path.dirname(store.table_dir('master', 'applicants'))))
+    if not args.no_excel:
+        output_file = os.path.join(pam.MASTER_DIR, 'Rescored ' + pam.OUTPUT_FILE)
+        pam.write_df_to_excel(pam.read_applicants(store), output_file)
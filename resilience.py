@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timeouts, retries, hedging and circuit breaking of API requests.
+
+A RequestPolicy bounds every API call (api_session.ResilientAdapter, and the
+asyncio Stackexchange client) by
+  * connect and read timeouts per attempt, and a deadline for the whole call
+  * retries of idempotent requests (GET, HEAD) after connection errors,
+    timeouts and 5xx responses, with jittered exponential backoff
+  * optionally, hedging: an idempotent request that hasn't been answered after
+    hedge_delay is sent a second time (paced by the rate limit governor, if any,
+    with the same token / app key), the first response wins
+  * a circuit breaker per host: after consecutive failures, requests to the
+    host fail fast (CircuitOpenError) until a cooldown has passed, then a single
+    probe request decides whether the circuit closes again
+Rate limit rejections (403/429) are handled by rate_limit.GovernedAdapter.
+"""
+
+import time
+import random
+import threading
+
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# seconds a call may take over all its attempts and backoff
+DEADLINE = 90
+# read timeout of an attempt started close to the deadline
+MIN_READ_TIMEOUT = 1
+MAX_RETRIES = 3
+# backoff before retry n is uniform in [0, min(BACKOFF_MAX, BACKOFF_BASE * 2**n)] sec
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 20
+RETRY_STATUSES = (500, 502, 503, 504)
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+# default delay (sec) before a hedged request, with --hedge
+HEDGE_DELAY = 2.0
+# consecutive failures opening a host's circuit, seconds it stays open
+BREAKER_FAILURES = 5
+BREAKER_COOLDOWN = 30
+
+
+class CircuitOpenError(IOError):
+    '''Request not sent, the circuit of its host is open after repeated failures
+    '''
+    def __init__(self, host, wait):
+        super().__init__("circuit of '{}' open after repeated failures, retry in {:.0f} sec".format(
+                host, wait))
+        self.host = host
+
+
+class CircuitBreaker(object):
+    '''Per host circuit breaker: open after failures consecutive failures,
+    half open (one probe request) after cooldown seconds
+    '''
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        # {host: (consecutive failures, epoch until which the circuit is open)}
+        self.state = {}
+        self.lock = threading.Lock()
+
+    def check(self, host):
+        '''Raise CircuitOpenError if requests to host must not be sent
+        '''
+        with self.lock:
+            n_failures, open_until = self.state.get(host, (0, 0))
+            if n_failures < self.failures:
+                return
+            now = time.time()
+            if now < open_until:
+                raise CircuitOpenError(host, open_until - now)
+            # half open: this request probes the host, others are refused (CircuitOpenError)
+            # until it succeeds, or for another cooldown
+            self.state[host] = (n_failures, now + self.cooldown)
+
+    def record(self, host, ok):
+        '''Record the outcome of a request to host
+        '''
+        with self.lock:
+            if ok:
+                self.state.pop(host, None)
+                return
+            n_failures, open_until = self.state.get(host, (0, 0))
+            n_failures += 1
+            if n_failures >= self.failures:
+                if n_failures == self.failures:
+                    print("\tToo many failures of '{}', holding requests back for {} sec".format(
+                            host, self.cooldown))
+                open_until = time.time() + self.cooldown
+            self.state[host] = (n_failures, open_until)
+
+
+class RequestPolicy(object):
+    '''Timeouts, retries, hedging and circuit breaker shared by the requests of a run
+    '''
+    def __init__(self, connect_timeout=CONNECT_TIMEOUT, read_timeout=READ_TIMEOUT,
+                 deadline=DEADLINE, max_retries=MAX_RETRIES, backoff_base=BACKOFF_BASE,
+                 backoff_max=BACKOFF_MAX, hedge_delay=None, breaker=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+
+    def backoff(self, attempt):
+        '''Jittered (full jitter) exponential backoff before retry attempt (0 based)
+        '''
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2**attempt))
+
+    def timeout(self, deadline):
+        '''(connect, read) timeout of an attempt of a call ending at deadline (monotonic)
+        '''
+        remaining = deadline - time.monotonic()
+        floor = min(MIN_READ_TIMEOUT, self.read_timeout)
+        return (self.connect_timeout, max(floor, min(self.read_timeout, remaining)))
+
+
+def retry_after(headers):
+    '''Seconds asked to wait by a Retry-After header, None if absent or a date
+    '''
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def add_arguments(parser):
+    '''Add the request timeout / retry / hedging options to an argparse parser
+    '''
+    parser.add_argument("--deadline", dest="deadline", type=float, default=DEADLINE,
+                        help="seconds an API call may take over all its retries "
+                             "(default {})".format(DEADLINE))
+    parser.add_argument("--retries", dest="max_retries", type=int, default=MAX_RETRIES,
+                        help="retries of API calls failing with timeouts, connection errors "
+                             "or 5xx responses (default {})".format(MAX_RETRIES))
+    parser.add_argument("--hedge", dest="hedge_delay", type=float, nargs="?", const=HEDGE_DELAY,
+                        help="send a second request for API calls not answered after HEDGE_DELAY "
+                             "sec, use the first response (default {})".format(HEDGE_DELAY))
+
+
+def policy_from_args(args):
+    '''RequestPolicy of the add_arguments options of args
+    '''
+    return RequestPolicy(deadline=args.deadline, max_retries=args.max_retries,
+                         hedge_delay=args.hedge_delay)
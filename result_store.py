@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Columnar result store.
+
+Results are written as Parquet files (pyarrow), partitioned by run and source:
+
+    results/run=<run_id>/source=<github|stackoverflow|master>/<table>/<key>.parquet
+
+Each matched user / applicant is appended as its own part as soon as it is
+rated, so results are usable while a run is in progress and survive a crash.
+A table is read back as one frame (memory-mapped), for a run or for all runs.
+Excel files are an optional export built from the store.
+"""
+
+import os
+import re
+import glob
+import json
+import datetime
+
+from lazy_import import LazyModule
+
+pd = LazyModule('pandas')
+
+RESULTS_DIR = 'results'
+# suffix of the columns stored as JSON text, decoded by ResultStore.read
+JSON_SUFFIX = '.json'
+
+
+def new_run_id():
+    '''Run id sorting by start time, to the microsecond so runs started together don't share it
+    '''
+    return datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+
+
+def safe_key(key):
+    '''File name for a part key
+    '''
+    return re.sub(r'[^\w.@\[\]-]+', '_', str(key))
+
+
+def json_default(value):
+    '''numpy scalars as python numbers, anything else json can't store (dates) as text
+    '''
+    value = value.item() if hasattr(value, 'item') else value
+    return value if isinstance(value, (bool, int, float)) else str(value)
+
+
+def to_json(value):
+    if value is None or value != value:
+        return None
+    return json.dumps(value, default=json_default)
+
+
+def from_json(text):
+    # missing values are read back as None or NaN
+    return json.loads(text) if isinstance(text, str) else None
+
+
+def to_storable(df):
+    '''Copy of df that Parquet can store: index as columns, object columns mixing
+    types (e.g. names and ratings in one 'value' column) as JSON text in a column
+    renamed col + JSON_SUFFIX, so each value is read back with its type
+    '''
+    df = df.reset_index()
+    df.columns = ['.'.join(map(str, col)) if isinstance(col, tuple) else str(col)
+                  for col in df.columns]
+    json_cols = {}
+    for col in df.columns[df.dtypes == object]:
+        types = {type(value) for value in df[col] if value is not None and value == value}
+        if len(types) > 1 or types - {str, bool, int, float, list}:
+            df[col] = df[col].map(to_json)
+            json_cols[col] = col + JSON_SUFFIX
+    return df.rename(columns=json_cols)
+
+
+def from_storable(df):
+    '''df read from Parquet with its JSON text columns (see to_storable) decoded
+    '''
+    json_cols = {col: col[:-len(JSON_SUFFIX)] for col in df.columns if col.endswith(JSON_SUFFIX)}
+    for col in json_cols:
+        df[col] = df[col].astype(object).map(from_json)
+    return df.rename(columns=json_cols)
+
+
+class ResultStore(object):
+    '''Parquet files of result tables, one part per user / applicant,
+    in a partition per run and source
+    '''
+    def __init__(self, root=RESULTS_DIR, run_id=None):
+        self.root = root
+        self.run_id = run_id or new_run_id()
+
+    def table_dir(self, source, table, run_id=None):
+        return os.path.join(self.root, 'run=' + (run_id or self.run_id), 'source=' + source, table)
+
+    def append(self, source, table, key, df):
+        '''Write df as the part of table for key, replacing an earlier part for key
+        '''
+        table_dir = self.table_dir(source, table)
+        os.makedirs(table_dir, exist_ok=True)
+        path = os.path.join(table_dir, safe_key(key) + '.parquet')
+        df = to_storable(df)
+        df.insert(0, 'key', str(key))
+        # write to a temp file first, readers never see a partial part
+        tmp_path = path + '.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def append_many(self, source, table, df, part):
+        '''Write df, which has a 'key' column, as a single part (named part) of table
+        '''
+        table_dir = self.table_dir(source, table)
+        os.makedirs(table_dir, exist_ok=True)
+        path = os.path.join(table_dir, safe_key(part) + '.parquet')
+        tmp_path = path + '.tmp'
+        to_storable(df.set_index('key')).to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def keys(self, source, table, run_id=None):
+        '''Keys of the parts of table, in the order they were written
+        '''
+        table_dir = glob.escape(self.table_dir(source, table, run_id))
+        paths = sorted(glob.glob(os.path.join(table_dir, '*.parquet')), key=os.path.getmtime)
+        return [os.path.basename(path)[:-len('.parquet')] for path in paths]
+
+    def read(self, source, table, key=None, run_id=None, all_runs=False):
+        '''Table as a frame (its part for key only if given), for this run,
+        run_id, or all runs (with a 'run' column) if all_runs
+        '''
+        if all_runs:
+            run_dirs = sorted(glob.glob(os.path.join(glob.escape(self.root), 'run=*')))
+            run_ids = [os.path.basename(run_dir)[len('run='):] for run_dir in run_dirs]
+        else:
+            run_ids = [run_id or self.run_id]
+        frames = []
+        for run in run_ids:
+            table_dir = self.table_dir(source, table, run)
+            pattern = (glob.escape(safe_key(key)) if key is not None else '*') + '.parquet'
+            for path in sorted(glob.glob(os.path.join(glob.escape(table_dir), pattern))):
+                df = from_storable(pd.read_parquet(path, memory_map=True))
+                if all_runs:
+                    df.insert(0, 'run', run)
+                frames.append(df)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
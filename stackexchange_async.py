@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Asyncio Stackexchange client.
+
+Requests go through a single aiohttp session: a pooled keep-alive connector
+with at most max_concurrent requests in flight, paced by a
+rate_limit.RateLimitGovernor like the blocking client, so the 'backoff' and
+'quota_remaining' the API reports hold back later requests. Timeouts, retries
+and the circuit breaker of a resilience.RequestPolicy apply as well (no
+hedging).
+
+AsyncStackExchangeClient is used from coroutines (request, request_many).
+AsyncStackExchangeSite runs one on a background event loop and is a drop-in
+py-stackexchange Site for find_matching_users, parse_user_details and
+get_top_answers_tags: blocking calls from any thread share its pool.
+
+aiohttp is an optional dependency, only needed for this module.
+"""
+
+import time
+import asyncio
+import threading
+import urllib.parse
+
+import aiohttp
+import requests
+import stackexchange
+
+import api_session
+import rate_limit
+import resilience
+import tracing
+
+# requests in flight at once, connections kept open between requests (sec)
+MAX_CONCURRENT = 4
+KEEPALIVE_TIMEOUT = 30
+REQUEST_TIMEOUT = 60
+
+
+class AsyncStackExchangeClient(object):
+    '''Stackexchange API client sending requests through a pooled aiohttp session,
+    paced by governor (rate_limit.RateLimitGovernor), with the timeouts, retries and
+    circuit breaker of policy (resilience.RequestPolicy)
+    '''
+    def __init__(self, governor=None, api_root=api_session.STACKEXCHANGE_API_ROOT,
+                 api_version='2.2', max_concurrent=MAX_CONCURRENT, policy=None):
+        self.governor = governor if governor is not None else rate_limit.stackoverflow_governor([])
+        self.policy = policy if policy is not None else resilience.RequestPolicy()
+        self.api_root = api_root
+        self.api_version = api_version
+        self.max_concurrent = max_concurrent
+        # created in the event loop of the first request
+        self.session = None
+        self.semaphore = None
+
+    def _start(self):
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrent,
+                                             keepalive_timeout=KEEPALIVE_TIMEOUT)
+            self.session = aiohttp.ClientSession(
+                    connector=connector, timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT))
+            self.semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self.session
+
+    async def request(self, to, params, applicant=None):
+        '''Response json of request path to with (string) query params,
+        raises stackexchange.StackExchangeError for error responses.
+        The request is traced (tracing) for applicant.
+        '''
+        session = self._start()
+        url = '{}/{}/{}'.format(self.api_root, self.api_version, urllib.parse.quote(to))
+        params = dict(params)
+        method = api_session.stackexchange_method(to)
+        api = urllib.parse.urlsplit(self.api_root).netloc
+        policy = self.policy
+        loop = asyncio.get_event_loop()
+        deadline = time.monotonic() + policy.deadline
+        n_throttled = n_failed = 0
+        async with self.semaphore:
+            while True:
+                # the governor blocks for pacing / backoff, wait for it off the event loop
+                app_key = await loop.run_in_executor(None, self.governor.acquire, 'core', method)
+                if app_key is not None:
+                    params['key'] = app_key
+                policy.breaker.check(api)
+                connect, read = policy.timeout(deadline)
+                timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect, sock_read=read)
+                start = time.perf_counter()
+                try:
+                    async with session.get(url, params=params, timeout=timeout) as resp:
+                        status = resp.status
+                        body = await resp.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                    tracing.record_request(api, None, 0, time.perf_counter() - start, applicant)
+                    status, error = None, err
+                else:
+                    tracing.record_request(api, status, len(body), time.perf_counter() - start,
+                                           applicant)
+                failed = status is None or status in resilience.RETRY_STATUSES
+                policy.breaker.record(api, not failed)
+                if failed:
+                    delay = policy.backoff(n_failed)
+                    n_failed += 1
+                    if n_failed > policy.max_retries or time.monotonic() + delay >= deadline:
+                        if status is None:
+                            raise error
+                        raise stackexchange.StackExchangeError(
+                                stackexchange.StackExchangeError.UNKNOWN, 'server_error',
+                                'HTTP {}'.format(status))
+                    print("\tRetrying '{}' in {:.1f} sec ({})".format(to, delay, status or error))
+                    await asyncio.sleep(delay)
+                    continue
+                try:
+                    json = await resp.json(content_type=None)
+                except ValueError:
+                    raise stackexchange.StackExchangeError()
+                tracing.record_quota(api, json.get('quota_remaining'), applicant)
+                throttled = api_session.record_stackexchange_quota(self.governor, app_key, json,
+                                                                   method)
+                if not (throttled and n_throttled < rate_limit.MAX_RATE_LIMIT_RETRIES):
+                    break
+                n_throttled += 1
+        api_session.check_stackexchange_response(status, json)
+        return json
+
+    async def request_many(self, requests):
+        '''Response jsons of [(to, params)], sent concurrently
+        '''
+        return await asyncio.gather(*[self.request(to, params) for to, params in requests])
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class AsyncStackExchangeSite(api_session.StackExchangeSite):
+    '''py-stackexchange Site whose requests are sent by an AsyncStackExchangeClient
+    running on a background event loop
+    '''
+    def __init__(self, domain, app_key=None, governor=None,
+                 api_root=api_session.STACKEXCHANGE_API_ROOT, max_concurrent=MAX_CONCURRENT,
+                 policy=None, **kwargs):
+        # requests are sent by the client, not through a requests session
+        super().__init__(domain, app_key, session=requests.Session(), api_root=api_root, **kwargs)
+        if governor is None:
+            governor = rate_limit.stackoverflow_governor([app_key])
+        self.client = AsyncStackExchangeClient(governor, api_root, self.api_version,
+                                               max_concurrent, policy)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def run(self, coro):
+        '''Run coro on the client's event loop, return its result
+        '''
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def _request(self, to, params):
+        # the request runs on the loop thread, trace it for the caller's applicant
+        json = self.run(self.client.request(to, self._request_params(params),
+                                            tracing.current_applicant()))
+        if 'quota_remaining' in json and 'quota_max' in json:
+            self.rate_limit = (json['quota_remaining'], json['quota_max'])
+            self.requests_used = self.rate_limit[1] - self.rate_limit[0]
+            self.requests_left = self.rate_limit[0]
+        return json
+
+    def close(self):
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GithubGraphql.get_repo_rows against the local fake API server, compared with
+the rows of the REST path (get_github_details.parse_repo) for the same repos.
+
+Run from the repo root: python3 -m pytest tests (or python3 -m unittest discover tests)
+"""
+
+import os
+import io
+import sys
+import unittest
+import contextlib
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, 'benchmarks'))
+import requests
+from github import Github
+
+import contributor_cache
+import github_graphql
+import get_github_details as ghd
+from fake_api_server import FakeApiServer
+
+LOGIN = 'applicant1'
+N_REPOS = 14
+PAGE_SIZE = 5
+# fields of a GraphQL row that the REST row gets elsewhere (keywords are extracted from them)
+README_COLUMNS = {'readme_text', 'readme_sha'}
+
+
+class GithubGraphqlTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeApiServer(n_applicants=3, n_repos=N_REPOS).start()
+        cls.session = requests.Session()
+        cls.graphql = github_graphql.GithubGraphql(cls.session, endpoint=cls.server.url + '/graphql',
+                                                   page_size=PAGE_SIZE)
+        with contextlib.redirect_stdout(io.StringIO()):
+            cls.rows = {row['full_name']: row for row in cls.graphql.get_repo_rows(LOGIN)}
+            cls.rest_rows = cls.get_rest_rows()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.session.close()
+        cls.server.stop()
+
+    @classmethod
+    def get_rest_rows(cls):
+        '''{full_name: row} of the REST path, every repo fetched (exact), only REPO_FIELDS kept
+        '''
+        contributor_cache.install_cache(contributor_cache.ContributorCache())
+        g = Github(login_or_token='test-token', base_url=cls.server.url, seconds_between_requests=0,
+                   seconds_between_writes=0)
+        user = g.get_user(LOGIN)
+        return {repo.full_name: ghd.parse_repo(user, repo, keep_raw=False, exact=True)
+                for repo in user.get_repos(type='all')}
+
+    def test_pagination(self):
+        self.server.reset_counts()
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = self.graphql.get_repo_rows(LOGIN, user_id='U_' + LOGIN)
+        self.assertEqual([row['full_name'] for row in rows], list(self.rest_rows))
+        # one query per page of PAGE_SIZE repos
+        self.assertEqual(self.server.counts[('github', 'graphql repos')], -(-N_REPOS // PAGE_SIZE))
+
+    def test_user_id_query(self):
+        self.assertEqual(self.graphql.get_user_id(LOGIN), 'U_' + LOGIN)
+
+    def test_rest_columns(self):
+        rest_columns = set(next(iter(self.rest_rows.values())))
+        for row in self.rows.values():
+            # the REST row adds the pruning reason and the user details
+            self.assertLessEqual(set(row) - README_COLUMNS, rest_columns)
+            self.assertLessEqual(set(ghd.REPO_FIELDS), set(row))
+
+    def test_rest_values(self):
+        for full_name, rest_row in self.rest_rows.items():
+            row = self.rows[full_name]
+            for column in set(row) - README_COLUMNS:
+                self.assertEqual(row[column], rest_row[column], '{} {}'.format(full_name, column))
+            self.assertEqual(row['readme_sha'], rest_row['readme_sha'])
+            self.assertEqual(row['readme_text'], rest_row['readme_text'])
+
+    def test_missing_readme(self):
+        row = self.rows['{}/project-13'.format(LOGIN)]
+        self.assertEqual(row['readme_text'], '')
+        self.assertIsNone(row['readme_sha'])
+        self.assertTrue(self.rows['{}/project-12'.format(LOGIN)]['readme_text'])
+
+    def test_no_readmes(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = self.graphql.get_repo_rows(LOGIN, user_id='U_' + LOGIN, readmes=False)
+        self.assertTrue(all(row['readme_text'] == '' and row['readme_sha'] is None for row in rows))
+
+    def test_null_default_branch(self):
+        # empty repos have no default branch, hence no commits
+        for full_name in ['acme/shared-0', '{}/project-10'.format(LOGIN)]:
+            row = self.rows[full_name]
+            self.assertEqual(row['contributions'], 0)
+            self.assertEqual(row['user_contrib_pct'], 0)
+        self.assertGreater(self.rows['{}/project-12'.format(LOGIN)]['user_contrib_pct'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
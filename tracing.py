@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tracing and per-stage metrics of a rating run.
+
+Pipeline steps (searches, contributors, readmes, tags, keywords, ratings,
+excel writing) are timed as spans, nested per thread and labelled with the
+applicant being rated. HTTP requests that reach the network are counted per
+applicant and API with their bytes, time and the rate limit quota left
+(api_session.TracingAdapter). Spans and metrics are kept by the installed
+Tracer; nothing is recorded unless one is installed. They are written as JSON
+lines or as a Prometheus text dump, and summarized per stage.
+
+ThreadProfiler runs cProfile in the calling thread and in every thread started
+after it, so the lookups of worker threads show up in the profile too.
+"""
+
+import sys
+import json
+import time
+import atexit
+import pstats
+import cProfile
+import functools
+import threading
+from collections import defaultdict
+
+# default output files of --trace and --profile
+TRACE_FILE = 'trace.jsonl'
+PROFILE_FILE = 'profile.pstats'
+# prefix of the Prometheus metric names
+METRIC_PREFIX = 'rate_applicants'
+# functions listed in the printed profile
+PROFILE_TOP = 30
+
+
+class Tracer(object):
+    '''Spans and HTTP metrics of a run, by applicant
+    '''
+    def __init__(self):
+        self.spans = []
+        # {(applicant, api): {'requests':, 'errors':, 'bytes':, 'seconds':}}
+        self.http = defaultdict(lambda: {'requests': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0})
+        # {(api, status): count}
+        self.statuses = defaultdict(int)
+        # {(applicant, api, rate limit resource): lowest quota left seen}
+        self.quota = {}
+        self.lock = threading.Lock()
+
+    def record_span(self, name, applicant, start, seconds, parent=None, error=None):
+        with self.lock:
+            self.spans.append({'type': 'span', 'name': name, 'applicant': applicant,
+                               'parent': parent, 'start': start, 'seconds': seconds,
+                               'error': error})
+
+    def record_request(self, api, status, n_bytes, seconds, applicant=None):
+        '''Count a request to api that got a response with status (None if it failed)
+        '''
+        with self.lock:
+            counts = self.http[(applicant, api)]
+            counts['requests'] += 1
+            counts['errors'] += status is None or status >= 400
+            counts['bytes'] += n_bytes
+            counts['seconds'] += seconds
+            self.statuses[(api, status)] += 1
+
+    def record_quota(self, api, remaining, applicant=None, resource='core'):
+        '''Record the rate limit quota of resource left for api after a request
+        '''
+        if remaining is None:
+            return
+        with self.lock:
+            key = (applicant, api, resource)
+            self.quota[key] = min(int(remaining), self.quota.get(key, int(remaining)))
+
+    def stage_totals(self):
+        '''{span name: (count, total seconds, errors)}
+        '''
+        totals = defaultdict(lambda: [0, 0.0, 0])
+        with self.lock:
+            for span in self.spans:
+                total = totals[span['name']]
+                total[0] += 1
+                total[1] += span['seconds']
+                total[2] += span['error'] is not None
+        return {name: tuple(total) for name, total in totals.items()}
+
+    def records(self):
+        '''Spans, then per (applicant, api) HTTP metrics, as dicts
+        '''
+        with self.lock:
+            records = list(self.spans)
+            for (applicant, api), counts in sorted(self.http.items(), key=str):
+                quota = {resource: remaining for (label, quota_api, resource), remaining
+                         in self.quota.items() if (label, quota_api) == (applicant, api)}
+                records.append(dict(counts, type='http', applicant=applicant, api=api,
+                                    quota_remaining=quota))
+        return records
+
+    def write_json(self, path):
+        '''Write the records as JSON lines
+        '''
+        with open(path, 'w') as f_trace:
+            for record in self.records():
+                f_trace.write(json.dumps(record, default=str) + '\n')
+
+    def prometheus(self):
+        '''Prometheus text exposition of the stage timings and HTTP metrics
+        '''
+        lines = []
+        metric = lambda name, kind: lines.append('# TYPE {}_{} {}'.format(METRIC_PREFIX, name, kind))
+        sample = lambda name, labels, value: lines.append('{}_{}{{{}}} {}'.format(
+                METRIC_PREFIX, name, ','.join('{}="{}"'.format(k, escape_label(v))
+                                              for k, v in labels), value))
+        totals = self.stage_totals()
+        metric('stage_seconds', 'summary')
+        for name, (count, seconds, errors) in sorted(totals.items()):
+            sample('stage_seconds_sum', [('stage', name)], round(seconds, 6))
+            sample('stage_seconds_count', [('stage', name)], count)
+        metric('stage_errors_total', 'counter')
+        for name, (count, seconds, errors) in sorted(totals.items()):
+            sample('stage_errors_total', [('stage', name)], errors)
+        with self.lock:
+            http = sorted(self.http.items(), key=str)
+            statuses = sorted(self.statuses.items(), key=str)
+            quota = sorted(self.quota.items(), key=str)
+        for field, name, kind in [('requests', 'http_requests_total', 'counter'),
+                                  ('errors', 'http_errors_total', 'counter'),
+                                  ('bytes', 'http_response_bytes_total', 'counter'),
+                                  ('seconds', 'http_seconds_total', 'counter')]:
+            metric(name, kind)
+            for (applicant, api), counts in http:
+                sample(name, [('applicant', applicant), ('api', api)], round(counts[field], 6))
+        metric('http_responses_total', 'counter')
+        for (api, status), count in statuses:
+            sample('http_responses_total', [('api', api), ('status', status)], count)
+        metric('ratelimit_remaining_min', 'gauge')
+        for (applicant, api, resource), remaining in quota:
+            sample('ratelimit_remaining_min', [('applicant', applicant), ('api', api),
+                                               ('resource', resource)], remaining)
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        '''Write a Prometheus text dump if path ends with .prom, JSON lines otherwise
+        '''
+        if path.endswith('.prom'):
+            with open(path, 'w') as f_trace:
+                f_trace.write(self.prometheus())
+        else:
+            self.write_json(path)
+
+    def summary(self):
+        '''Table of the time spent per stage and the requests per API
+        '''
+        lines = ['{:32s} {:>7s} {:>10s} {:>7s}'.format('stage', 'count', 'time (s)', 'errors')]
+        for name, (count, seconds, errors) in sorted(self.stage_totals().items(),
+                                                     key=lambda item: -item[1][1]):
+            lines.append('{:32s} {:7d} {:10.2f} {:7d}'.format(name, count, seconds, errors))
+        api_totals = defaultdict(lambda: [0, 0, 0])
+        with self.lock:
+            for (applicant, api), counts in self.http.items():
+                api_totals[api][0] += counts['requests']
+                api_totals[api][1] += counts['errors']
+                api_totals[api][2] += counts['bytes']
+        lines.append('')
+        lines.append('{:32s} {:>8s} {:>9s} {:>7s}'.format('api', 'requests', 'KB', 'errors'))
+        for api, (n_requests, errors, n_bytes) in sorted(api_totals.items()):
+            lines.append('{:32s} {:8d} {:9.1f} {:7d}'.format(api, n_requests, n_bytes/1e3, errors))
+        return '\n'.join(lines)
+
+
+def escape_label(value):
+    return str('' if value is None else value).replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n')
+
+
+# tracer recording spans and metrics, tracing is off unless one is installed
+_tracer = None
+# per thread: applicant being rated, stack of open span names
+_context = threading.local()
+
+
+def install_tracer(tracer):
+    '''Record spans and metrics with tracer (Tracer, or None to stop tracing), returns tracer
+    '''
+    global _tracer
+    _tracer = tracer
+    return tracer
+
+
+def get_tracer():
+    return _tracer
+
+
+def set_applicant(applicant):
+    '''Label spans and requests of the calling thread with applicant (e.g. master row number)
+    '''
+    _context.applicant = applicant
+
+
+def current_applicant():
+    return getattr(_context, 'applicant', None)
+
+
+class applicant(object):
+    '''Context manager labelling the calling thread's spans and requests with applicant
+    '''
+    def __init__(self, label):
+        self.label = label
+
+    def __enter__(self):
+        self.previous = current_applicant()
+        set_applicant(self.label)
+        return self
+
+    def __exit__(self, *exc_info):
+        set_applicant(self.previous)
+
+
+def bind(func):
+    '''func running with the calling thread's applicant label, for worker threads
+    '''
+    label = current_applicant()
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with applicant(label):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class span(object):
+    '''Context manager timing a step named name as a span of the installed tracer
+    '''
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.tracer = _tracer
+        if self.tracer is not None:
+            stack = _context.__dict__.setdefault('stack', [])
+            self.parent = stack[-1] if stack else None
+            stack.append(self.name)
+            self.start = time.time()
+            self.clock = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.tracer is not None:
+            seconds = time.perf_counter() - self.clock
+            _context.stack.pop()
+            # SystemExit is how 'no matching users' is reported, not a failure
+            error = exc_type.__name__ if exc_type and exc_type is not SystemExit else None
+            self.tracer.record_span(self.name, current_applicant(), self.start, seconds,
+                                    parent=self.parent, error=error)
+        return False
+
+
+def traced(name):
+    '''Decorator running the function as a span named name
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_request(api, status, n_bytes, seconds, applicant=None):
+    '''Count a request with the installed tracer, if any,
+    for applicant (default the calling thread's)
+    '''
+    tracer = _tracer
+    if tracer is not None:
+        applicant = applicant if applicant is not None else current_applicant()
+        tracer.record_request(api, status, n_bytes, seconds, applicant)
+
+
+def record_quota(api, remaining, applicant=None, resource='core'):
+    '''Record the quota left with the installed tracer, if any
+    '''
+    tracer = _tracer
+    if tracer is not None:
+        applicant = applicant if applicant is not None else current_applicant()
+        tracer.record_quota(api, remaining, applicant, resource)
+
+
+def trace_to(path):
+    '''Install a tracer whose records are written to path (see Tracer.write)
+    and summarized when the process exits
+    '''
+    tracer = install_tracer(Tracer())
+    def dump():
+        tracer.write(path)
+        print('\n{}\n\nTrace written to {}'.format(tracer.summary(), path))
+    atexit.register(dump)
+    return tracer
+
+
+class ThreadProfiler(object):
+    '''cProfile of the calling thread and of all threads started while it runs.
+    From Python 3.12 only one cProfile can be enabled at a time, it sees every thread:
+    a single profile is used then (calls of concurrent threads may be attributed to
+    each other's callers).
+    '''
+    # one cProfile per thread, or a single one for the process
+    PER_THREAD = sys.version_info < (3, 12)
+
+    def __init__(self):
+        self.profiles = []
+        self.lock = threading.Lock()
+
+    def _profile_thread(self, *args):
+        # first profile event of a new thread: replace this hook with a profiler
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        if self.PER_THREAD:
+            threading.setprofile(self._profile_thread)
+        self._profile_thread()
+        return self
+
+    def stop(self):
+        if self.PER_THREAD:
+            threading.setprofile(None)
+        with self.lock:
+            profiles = list(self.profiles)
+        for profile in profiles:
+            profile.disable()
+        return pstats.Stats(*profiles)
+
+
+def profile_to(path, top=PROFILE_TOP):
+    '''Profile the process (ThreadProfiler), write the stats to path (pstats format)
+    and print the top functions by cumulative time when the process exits
+    '''
+    profiler = ThreadProfiler().start()
+    def dump():
+        stats = profiler.stop()
+        stats.dump_stats(path)
+        print('\nProfile written to {} (python3 -m pstats {})'.format(path, path))
+        stats.sort_stats('cumulative').print_stats(top)
+    atexit.register(dump)
+    return profiler
+
+
+def add_arguments(parser):
+    '''Add the --trace and --profile options to an argparse parser
+    '''
+    parser.add_argument("--trace", dest="trace_file", type=str, nargs="?", const=TRACE_FILE,
+                        help="record timed steps and request counts per applicant to TRACE_FILE, "
+                             "JSON lines or a Prometheus text dump if it ends with .prom "
+                             "(default '{}')".format(TRACE_FILE))
+    parser.add_argument("--profile", dest="profile_file", type=str, nargs="?", const=PROFILE_FILE,
+                        help="profile the run with cProfile, stats written to PROFILE_FILE "
+                             "(default '{}')".format(PROFILE_FILE))
+
+
+def start(args):
+    '''Start the tracing / profiling asked for by the add_arguments options of args
+    '''
+    if args.trace_file:
+        trace_to(args.trace_file)
+    if args.profile_file:
+        profile_to(args.profile_file)
@@ -17,8 +17,16 @@ import nltk
 import pandas as pd
 from pandas.io.json import json_normalize
 
-# initialize requests sessions
+# add repo root to the module search path for the shared http_cache/rate_limit modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api_session
+import http_cache
+import rate_limit
+
+# initialize requests sessions, serving GET requests from the on-disk response cache
+response_cache = http_cache.ResponseCache()
 requests_session = requests.Session()
+requests_session.mount('https://', api_session.make_adapter(cache=response_cache))
 # add nltk_data folder to the list of NLTK library paths
 nltk.data.path.insert(0,'nltk_data')
 # set of stopwords
@@ -225,6 +233,11 @@ if __name__ == '__main__':
     auth_token = args.auth_token
     # get github authentication - as header for GET request
     auth_header = get_github_auth(auth_token=None)
+    # pace requests and wait out rate limits instead of exiting on 403
+    auth_tokens = [auth_header['Authorization'].split(' ')[-1]] if auth_header else []
+    governor = rate_limit.github_governor(auth_tokens)
+    requests_session.mount('https://', api_session.make_adapter(cache=response_cache,
+                                                                governor=governor))
     # find all users matchin the search string
     matching_users, users_list = get_matching_users(search_string, auth_header=auth_header)
     # get all details for mathing users and save specific fields to excel sheet
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Bounded top-k search for the users matching an applicant.
+
+Search results of both APIs are fetched page by page as they are iterated.
+top_k_matches ranks hits by match confidence (exact email, login, name) and
+stops iterating as soon as k good hits are found, looking at the first page
+(MAX_SEARCH_RESULTS hits) at most, so a common name doesn't page through, and
+later crawl the profiles of, hundreds of users.
+"""
+
+import itertools
+
+# confidence that a search hit is the user searched for, higher is better
+MATCH_EMAIL = 3
+MATCH_LOGIN = 2
+MATCH_NAME = 1
+MATCH_NONE = 0
+# search hits examined at most, one page of search results of either API
+MAX_SEARCH_RESULTS = 30
+
+
+def normalize(value):
+    '''value lower-cased, with runs of whitespace collapsed to one space
+    '''
+    return ' '.join((value or '').split()).lower()
+
+
+def top_k_matches(results, confidence, top_k, min_confidence=MATCH_NONE, stop_confidence=None,
+                  max_results=MAX_SEARCH_RESULTS):
+    '''Up to top_k of results with confidence(result) >= min_confidence, most confident
+    first (ties in search order). Stops iterating results once top_k hits with
+    confidence >= stop_confidence (default min_confidence) are found, or after max_results.
+    '''
+    if stop_confidence is None:
+        stop_confidence = min_confidence
+    matches = []
+    n_good = 0
+    for i, result in enumerate(itertools.islice(results, max_results)):
+        match = confidence(result)
+        if match < min_confidence:
+            continue
+        matches.append((match, i, result))
+        if match >= stop_confidence:
+            n_good += 1
+            if n_good >= top_k:
+                break
+    matches.sort(key=lambda m: (-m[0], m[1]))
+    return [result for match, i, result in matches[:top_k]]